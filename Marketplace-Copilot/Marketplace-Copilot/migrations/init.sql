@@ -231,3 +231,170 @@ BEGIN
     LEFT JOIN price_drops pd ON pp.sku = pd.sku;
 END;
 $$ LANGUAGE plpgsql;
+
+-- Daily sales rollup consumed by the surge engine: units per (user, sku, day).
+-- Maintained by statement-level triggers on sales so bulk uploads cost one
+-- grouped upsert per statement; n_rows counts the contributing sales rows so
+-- a day disappears from the rollup exactly when its last sale row does.
+CREATE TABLE IF NOT EXISTS daily_sales (
+  user_id VARCHAR(255) NOT NULL,
+  sku VARCHAR(255) NOT NULL,
+  day DATE NOT NULL,
+  units INTEGER NOT NULL DEFAULT 0,
+  n_rows INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, sku, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_sales_sku ON daily_sales(sku);
+
+-- sales.date is VARCHAR; rows without a valid YYYY-MM-DD date (optionally followed by a time)
+-- are left out of the rollup instead of failing the insert. Validated by pattern and calendar
+-- ranges rather than an exception handler, so no call opens a subtransaction and the planner can
+-- inline it; the CASE arms keep make_date() from ever seeing an invalid date.
+CREATE OR REPLACE FUNCTION sales_day(d TEXT)
+RETURNS DATE AS $$
+    SELECT CASE
+        WHEN d !~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}([ T]|$)' THEN NULL
+        WHEN substr(d, 1, 4)::int >= 1
+         AND substr(d, 6, 2)::int BETWEEN 1 AND 12
+         AND substr(d, 9, 2)::int BETWEEN 1 AND CASE substr(d, 6, 2)::int
+                WHEN 2 THEN CASE WHEN substr(d, 1, 4)::int % 4 = 0
+                                  AND (substr(d, 1, 4)::int % 100 <> 0 OR substr(d, 1, 4)::int % 400 = 0)
+                                 THEN 29 ELSE 28 END
+                ELSE 30 + (substr(d, 6, 2)::int + substr(d, 6, 2)::int / 8) % 2
+            END
+        THEN make_date(substr(d, 1, 4)::int, substr(d, 6, 2)::int, substr(d, 9, 2)::int)
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The rollup queries take sales_day() once per row in an OFFSET 0 subquery; without the fence
+-- the planner flattens it and evaluates the call in both the select list and the NULL filter.
+
+CREATE OR REPLACE FUNCTION daily_sales_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE daily_sales d
+        SET units = d.units - o.units, n_rows = d.n_rows - o.n_rows
+        FROM (
+            SELECT s.user_id, p.sku, s.day, SUM(s.quantity) AS units, COUNT(*) AS n_rows
+            FROM (SELECT user_id, product_id, quantity, sales_day(date) AS day FROM old_rows OFFSET 0) s
+            JOIN products p ON p.id = s.product_id
+            WHERE s.day IS NOT NULL
+            GROUP BY 1, 2, 3
+        ) o
+        WHERE d.user_id = o.user_id AND d.sku = o.sku AND d.day = o.day;
+
+        DELETE FROM daily_sales WHERE n_rows <= 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO daily_sales AS d (user_id, sku, day, units, n_rows)
+        SELECT s.user_id, p.sku, s.day, SUM(s.quantity), COUNT(*)
+        FROM (SELECT user_id, product_id, quantity, sales_day(date) AS day FROM new_rows OFFSET 0) s
+        JOIN products p ON p.id = s.product_id
+        WHERE s.day IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, sku, day) DO UPDATE
+        SET units = d.units + EXCLUDED.units, n_rows = d.n_rows + EXCLUDED.n_rows;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_sales_insert ON sales;
+CREATE TRIGGER trg_daily_sales_insert
+AFTER INSERT ON sales
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_sync();
+
+DROP TRIGGER IF EXISTS trg_daily_sales_update ON sales;
+CREATE TRIGGER trg_daily_sales_update
+AFTER UPDATE ON sales
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_sync();
+
+DROP TRIGGER IF EXISTS trg_daily_sales_delete ON sales;
+CREATE TRIGGER trg_daily_sales_delete
+AFTER DELETE ON sales
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_sync();
+
+-- Per-user change counter keying the surge result cache (server/services/surge-cache.ts).
+-- Every statement that writes sales, products or promotions bumps the version of each user
+-- whose rows it touched, so a cache lookup is one key read instead of a scan of the user's sales.
+CREATE TABLE IF NOT EXISTS surge_data_version (
+  user_id VARCHAR(255) PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION surge_data_bump()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE surge_data_version SET version = version + 1;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO surge_data_version AS v (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM old_rows WHERE user_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO surge_data_version AS v (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM new_rows WHERE user_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- promotions is optional: its triggers are added when the migration runs after it exists
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['sales', 'products', 'promotions'] LOOP
+        CONTINUE WHEN to_regclass(t) IS NULL;
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_surge_insert ON %1$I', t);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_surge_insert AFTER INSERT ON %1$I
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION surge_data_bump()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_surge_update ON %1$I', t);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_surge_update AFTER UPDATE ON %1$I
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION surge_data_bump()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_surge_delete ON %1$I', t);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_surge_delete AFTER DELETE ON %1$I
+            REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION surge_data_bump()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_surge_truncate ON %1$I', t);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_surge_truncate AFTER TRUNCATE ON %1$I
+            FOR EACH STATEMENT EXECUTE FUNCTION surge_data_bump()', t);
+    END LOOP;
+END;
+$$;
+
+-- Full rebuild, e.g. after product SKUs were renamed
+CREATE OR REPLACE FUNCTION rebuild_daily_sales()
+RETURNS VOID AS $$
+BEGIN
+    TRUNCATE daily_sales;
+    INSERT INTO daily_sales (user_id, sku, day, units, n_rows)
+    SELECT s.user_id, p.sku, s.day, SUM(s.quantity), COUNT(*)
+    FROM (SELECT user_id, product_id, quantity, sales_day(date) AS day FROM sales OFFSET 0) s
+    JOIN products p ON p.id = s.product_id
+    WHERE s.day IS NOT NULL
+    GROUP BY 1, 2, 3;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill once, when the rollup is first created over existing sales
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM daily_sales) THEN
+        PERFORM rebuild_daily_sales();
+    END IF;
+END;
+$$;
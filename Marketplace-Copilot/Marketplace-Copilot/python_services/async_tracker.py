@@ -0,0 +1,290 @@
+"""
+Async Price Tracker
+Tracks competitor prices concurrently over aiohttp. Requests are paced by a
+token bucket per marketplace host instead of a fixed sleep before each page, and
+at most `concurrency` pages are in flight at once. Fetched pages are parsed in a
+process pool of `parse_workers` processes, so parsing is not serialized with
+the network I/O on the event loop's GIL. Stats and storage are the same as
+PriceTracker.track_prices().
+"""
+
+import asyncio
+import logging
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from config import SCRAPING_CONFIG, MARKETPLACE_CONFIG
+from page_parser import PriceData, parse_product_page
+from price_tracker import PriceTracker, CompetitorMapping
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt: throttled or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _init_parse_worker(root_level: int, parser_level: int):
+    """Log from parse processes the way the tracker process does"""
+    logging.basicConfig(level=root_level)
+    logging.getLogger('page_parser').setLevel(parser_level)
+
+
+class PipelineMetrics:
+    """Queue depths and per-stage latencies of one tracking run"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.queues: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        s = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+        s['count'] += 1
+        s['seconds'] += seconds
+        s['max'] = max(s['max'], seconds)
+
+    def _queue(self, name: str) -> Dict[str, float]:
+        return self.queues.setdefault(name, {
+            'samples': 0, 'depth_sum': 0, 'max_depth': 0,
+            'blocked_puts': 0, 'blocked_seconds': 0.0, 'wait_seconds': 0.0, 'items': 0
+        })
+
+    def _sample(self, q: Dict[str, float], depth: int):
+        q['samples'] += 1
+        q['depth_sum'] += depth
+        q['max_depth'] = max(q['max_depth'], depth)
+
+    async def put(self, name: str, queue: asyncio.Queue, item: Any):
+        """queue.put() counting the times a full queue held the producer back"""
+        q = self._queue(name)
+        start = time.monotonic()
+        if queue.full():
+            q['blocked_puts'] += 1
+            await queue.put((start, item))
+            q['blocked_seconds'] += time.monotonic() - start
+        else:
+            queue.put_nowait((start, item))
+        self._sample(q, queue.qsize())
+
+    async def get(self, name: str, queue: asyncio.Queue) -> Any:
+        """queue.get() recording how long the item sat in the queue; None ends the stage"""
+        entry = await queue.get()
+        if entry is None:
+            return None
+        queued_at, item = entry
+        q = self._queue(name)
+        q['items'] += 1
+        q['wait_seconds'] += time.monotonic() - queued_at
+        self._sample(q, queue.qsize())
+        return item
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Mean and max ms per stage; per queue mean and max depth, mean wait and blocked puts (seconds summed over producers)"""
+        out: Dict[str, Dict[str, float]] = {}
+        for stage, s in self.stages.items():
+            out[stage] = {
+                'count': s['count'],
+                'mean_ms': round(s['seconds'] * 1000 / s['count'], 2),
+                'max_ms': round(s['max'] * 1000, 2),
+            }
+        for name, q in self.queues.items():
+            out[f"{name}_queue"] = {
+                'mean_depth': round(q['depth_sum'] / q['samples'], 1) if q['samples'] else 0,
+                'max_depth': q['max_depth'],
+                'mean_wait_ms': round(q['wait_seconds'] * 1000 / q['items'], 2) if q['items'] else 0,
+                'blocked_puts': q['blocked_puts'],
+                'blocked_seconds': round(q['blocked_seconds'], 2),
+            }
+        return out
+
+
+class AsyncPriceTracker(PriceTracker):
+    """PriceTracker that scrapes many product pages concurrently"""
+
+    def __init__(self, db_config: Dict[str, str], concurrency: Optional[int] = None,
+                 host_limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 product_url: Optional[str] = None, parse_workers: Optional[int] = None):
+        super().__init__(db_config)
+        self.concurrency = concurrency or SCRAPING_CONFIG['concurrency']
+        self.host_limits.update(host_limits or {})
+        self.product_url = product_url or MARKETPLACE_CONFIG['amazon_in']['product_url']
+        self.timeout = SCRAPING_CONFIG['timeout']
+        self.max_retries = SCRAPING_CONFIG['max_retries']
+        self.parse_workers = SCRAPING_CONFIG['parse_workers'] if parse_workers is None else parse_workers
+        self.queue_size = SCRAPING_CONFIG['queue_size']
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+        self.metrics = PipelineMetrics()
+
+    async def fetch_product_page(self, session: aiohttp.ClientSession, asin: str) -> Optional[bytes]:
+        """Fetch a product page, retrying throttled and transient failures"""
+        url = self.product_url.format(asin=asin)
+        bucket = self.bucket_for(url)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                async with session.get(url) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                        retry_after = response.headers.get('Retry-After', '')
+                        logger.warning(f"HTTP {response.status} for ASIN {asin}, retrying")
+                        if retry_after.isdigit():
+                            await asyncio.sleep(int(retry_after))
+                        continue
+                    response.raise_for_status()
+                    return await response.read()
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Request error for ASIN {asin}: {e.status} {e.message}")
+                return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.max_retries:
+                    logger.warning(f"Request error for ASIN {asin}: {e!r}, retrying")
+                    continue
+                logger.error(f"Request error for ASIN {asin}: {e!r}")
+                return None
+        return None
+
+    def parse_executor(self) -> ProcessPoolExecutor:
+        """The parse process pool, started on first use and kept for later runs"""
+        if self.parse_pool is None:
+            # forkserver/spawn: the parent runs threads (writer flusher, DB pool) that fork would copy mid-state
+            method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+            self.parse_pool = ProcessPoolExecutor(
+                self.parse_workers,
+                mp_context=mp.get_context(method),
+                initializer=_init_parse_worker,
+                initargs=(logging.getLogger().level, logging.getLogger('page_parser').level)
+            )
+        return self.parse_pool
+
+    async def parse_page(self, content: bytes, asin: str) -> Optional[PriceData]:
+        """parse_product_page() in the process pool, or inline with parse_workers=0"""
+        if not self.parse_workers:
+            return parse_product_page(content, asin)
+        pool = self.parse_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, parse_product_page, content, asin)
+        except BrokenProcessPool:
+            # A worker died (and failed every pending page with it): start a new pool for the next pages
+            if self.parse_pool is pool:
+                logger.error("Parse worker died, restarting the parse pool")
+                self.parse_pool = None
+                pool.shutdown(wait=False)
+            raise
+
+    async def track_competitors(self, competitors: List[CompetitorMapping],
+                                stats: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """
+        Track the given competitors through three stages connected by bounded
+        queues: `concurrency` fetchers sharing one session, parsers feeding the
+        process pool and a store stage. A full queue blocks the stage before it,
+        so pages are not fetched faster than they can be parsed and stored.
+        """
+        stats = stats if stats is not None else {'total': len(competitors), 'success': 0, 'failed': 0}
+        metrics = self.metrics = PipelineMetrics()
+        pending: asyncio.Queue = asyncio.Queue()
+        for competitor in competitors:
+            pending.put_nowait(competitor)
+        parse_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        store_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        # Two pages per parse process: one parsing and one already handed over
+        parsers = 2 * self.parse_workers or 1
+
+        async def fetcher():
+            while not pending.empty():
+                competitor = pending.get_nowait()
+                start = time.monotonic()
+                try:
+                    content = await self.fetch_product_page(session, competitor.competitor_asin)
+                except Exception as e:
+                    # A bad URL or redirect, undecodable headers...: fail this competitor, not the run
+                    content = None
+                    logger.error(f"Error fetching ASIN {competitor.competitor_asin}: {e!r}")
+                metrics.record('fetch', time.monotonic() - start)
+                if content is None:
+                    stats['failed'] += 1
+                    logger.warning(f"Failed to scrape ASIN {competitor.competitor_asin}")
+                    continue
+                await metrics.put('parse', parse_queue, (competitor, content))
+
+        async def parser():
+            while (item := await metrics.get('parse', parse_queue)) is not None:
+                competitor, content = item
+                start = time.monotonic()
+                try:
+                    price_data = await self.parse_page(content, competitor.competitor_asin)
+                except Exception as e:
+                    price_data = None
+                    logger.error(f"Error scraping ASIN {competitor.competitor_asin}: {e!r}")
+                metrics.record('parse', time.monotonic() - start)
+                if price_data is None:
+                    stats['failed'] += 1
+                    logger.warning(f"Failed to scrape ASIN {competitor.competitor_asin}")
+                    continue
+                await metrics.put('store', store_queue, (competitor, price_data))
+
+        async def storer():
+            # One is enough: the writer only buffers, a full buffer flushes a whole batch
+            while (item := await metrics.get('store', store_queue)) is not None:
+                competitor, price_data = item
+                start = time.monotonic()
+                try:
+                    # psycopg2 blocks (a full writer buffer flushes): keep it off the event loop
+                    await asyncio.to_thread(self.record_price, competitor.id, price_data)
+                    stats['success'] += 1
+                    logger.debug(f"Tracked ASIN {competitor.competitor_asin}: ₹{price_data.price}")
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"Error tracking competitor {competitor.id}: {e}")
+                metrics.record('store', time.monotonic() - start)
+
+        async def fetch_stage():
+            await asyncio.gather(*(fetcher() for _ in range(min(self.concurrency, len(competitors)))))
+            for _ in range(parsers):
+                await parse_queue.put(None)
+
+        async def parse_stage():
+            await asyncio.gather(*(parser() for _ in range(parsers)))
+            await store_queue.put(None)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        headers = {k: self.session.headers[k] for k in ('User-Agent', 'Accept-Language')}
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            await asyncio.gather(fetch_stage(), parse_stage(), storer())
+        return stats
+
+    def track_prices(self, sku: Optional[str] = None) -> Dict[str, int]:
+        """Track prices for all active competitors or specific SKU"""
+        competitors = self.fetch_active_competitors(sku)
+        logger.info(f"Tracking prices for {len(competitors)} competitors ({self.concurrency} concurrent)")
+
+        start = time.monotonic()
+        stats = {'total': len(competitors), 'success': 0, 'failed': 0}
+        with self.buffered_writes(stats):
+            asyncio.run(self.track_competitors(competitors, stats))
+
+        logger.info(f"Price tracking complete: {stats} in {time.monotonic() - start:.1f}s")
+        logger.info(f"Tracking pipeline: {self.metrics.summary()}")
+        return stats
+
+    def close(self):
+        """Stop the parse processes"""
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(cancel_futures=True)
+            self.parse_pool = None
+
+
+# CLI usage
+if __name__ == "__main__":
+    import sys
+    from config import DB_CONFIG
+
+    tracker = AsyncPriceTracker(DB_CONFIG)
+    try:
+        stats = tracker.track_prices(sys.argv[1] if len(sys.argv) > 1 else None)
+    finally:
+        tracker.close()
+    print(f"Tracking complete: {stats}")
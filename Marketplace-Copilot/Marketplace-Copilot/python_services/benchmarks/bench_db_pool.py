@@ -0,0 +1,121 @@
+"""
+Connection pool benchmark: runs --ops short transactions (the
+fetch_active_competitors query) on the configured Postgres (config.DB_CONFIG,
+DB_* environment variables), once with a psycopg2.connect per transaction as the
+components used to do and once borrowing from db_pool, from --threads threads.
+Reports ms per transaction for both and the pool stats. --threads above
+--max-size makes callers wait for a connection, so waits and wait time show up.
+
+It then terminates the pool's backends from another connection and checks that
+the next borrows fail their health check, get a fresh connection and succeed.
+It exits 1 when a transaction or that check fails.
+
+Usage:
+    python python_services/benchmarks/bench_db_pool.py [--ops=2000] [--threads=8] [--max-size=4]
+"""
+
+import os
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from config import DB_CONFIG
+from db_pool import ConnectionPool
+
+QUERY = """
+    SELECT id, sku, competitor_asin, competitor_title
+    FROM competitor_mapping
+    WHERE sku = %s AND is_active = TRUE
+"""
+
+
+def timed(ops: int, threads: int, transaction: Callable[[int], None]) -> Dict[str, Any]:
+    errors: List[str] = []
+
+    def run(i: int):
+        try:
+            transaction(i)
+        except Exception as e:
+            errors.append(repr(e))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(run, range(ops)))
+    seconds = time.perf_counter() - t0
+    return {
+        "seconds": round(seconds, 3),
+        "ms_per_op": round(seconds * 1000 / ops, 3),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    ops = int(opts.get("ops", 2000))
+    threads = int(opts.get("threads", 8))
+    max_size = int(opts.get("max-size", 4))
+
+    def direct(i: int):
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(QUERY, (f"SKU{i % 100}",))
+                    cur.fetchall()
+        finally:
+            conn.close()
+
+    # health_check_after=0: every borrow of an idle connection is checked first
+    pool = ConnectionPool(DB_CONFIG, min_size=1, max_size=max_size, health_check_after=0)
+
+    def pooled(i: int):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(QUERY, (f"SKU{i % 100}",))
+                cur.fetchall()
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {"ops": ops, "threads": threads, "max_size": max_size}
+    report["connect_per_op"] = timed(ops, threads, direct)
+    report["pooled"] = timed(ops, threads, pooled)
+    report["pooled"]["pool"] = pool.stats()
+    report["speedup"] = round(report["connect_per_op"]["seconds"] / report["pooled"]["seconds"], 1)
+
+    # Health checks: kill every idle pooled backend, then borrow again
+    admin = psycopg2.connect(**DB_CONFIG)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        for conn, _ in list(pool.idle):
+            cur.execute("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(),))
+    admin.close()
+    before = pool.stats()["health_check_failures"]
+    after_kill = timed(threads, threads, pooled)
+    report["after_backend_kill"] = {
+        "errors": after_kill["errors"],
+        "first_error": after_kill["first_error"],
+        "health_check_failures": pool.stats()["health_check_failures"] - before,
+    }
+    pool.closeall()
+
+    for name in ("connect_per_op", "pooled", "after_backend_kill"):
+        if report[name]["errors"]:
+            failures.append(f"{name}: {report[name]['errors']} transactions failed (first: {report[name]['first_error']})")
+    if not report["after_backend_kill"]["health_check_failures"]:
+        failures.append("terminated pooled connections were not caught by the health check")
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Pool check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
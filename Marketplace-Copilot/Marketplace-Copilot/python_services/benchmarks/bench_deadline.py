@@ -0,0 +1,119 @@
+"""
+Deadline benchmark: runs the surge engines on a synthetic seller (generated
+with surge_bench, cached under data/.surge_bench/) without a budget and then
+with --deadline-ms set to fractions of that run's time, and reports per budget
+the SKUs finished, the SKUs skipped and how far the run went past its deadline.
+It checks that
+
+  - every SKU returned under a deadline has the same result as in the full run
+    (floats to a relative 1e-9: chunked batch passes sum over shorter matrices),
+  - the SKUs returned are the top of the priority ranking (recent units, then
+    all-time units), except for the order inside one batch/worker chunk,
+  - a budget much larger than the full run returns every SKU, not flagged partial,
+
+and exits 1 when a check fails.
+
+Usage:
+    python python_services/benchmarks/bench_deadline.py [--skus=2000] [--years=2] [--engines=sku,batch]
+        [--fractions=0.25,0.5] [--workers=2]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import warnings
+import logging
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import surge_engine
+from surge_bench import ensure_dataset
+
+
+def run(argv: List[str]) -> Dict[str, Any]:
+    args = surge_engine.parse_args(argv)
+    t0 = time.perf_counter()
+    payload = surge_engine.run_surge(args)
+    payload["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return payload
+
+
+def same(a: Any, b: Any, tol: float = 1e-9) -> bool:
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(same(a[k], b[k], tol) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(same(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, (int, float)) and not isinstance(b, bool):
+        return math.isclose(a, b, rel_tol=tol, abs_tol=tol)
+    return a == b
+
+
+def ranked_skus(sales_df) -> List[str]:
+    today = surge_engine.date_today(sales_df["date"])
+    frame = surge_engine.prioritized_frame(sales_df, today)
+    return frame["sku"].drop_duplicates().astype(str).tolist()
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    skus = int(opts.get("skus", 2000))
+    years = int(opts.get("years", 2))
+    engines = opts.get("engines", "sku,batch").split(",")
+    fractions = [float(f) for f in opts.get("fractions", "0.25,0.5").split(",")]
+    workers = int(opts.get("workers", 2))
+
+    warnings.simplefilter("ignore", FutureWarning)
+    logging.getLogger("surge_engine").setLevel(logging.WARNING)
+    os.environ.pop("DATABASE_URL", None)
+    data_dir = os.path.join(surge_engine.project_data_dir(), ".surge_bench", f"{skus}x{years}y_d1.0")
+    dataset = ensure_dataset(data_dir, skus, years, 1.0, regenerate=False)
+    os.environ["SURGE_DATA_DIR"] = data_dir
+    ranking = ranked_skus(surge_engine.load_sales_from_csv(None))
+    rank = {s: i for i, s in enumerate(ranking)}
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {"dataset": dataset, "engines": {}}
+    configs = {e: [f"--engine={e}"] + (["--decomp=fast"] if e == "sku" else []) for e in engines}
+    if workers > 1:
+        configs[f"sku_workers{workers}"] = ["--decomp=fast", f"--workers={workers}"]
+    for name, argv in configs.items():
+        full = run(argv)
+        by_sku = {r["sku"]: r for r in full["results"]}
+        # The largest ranking gap a chunked run may show: one chunk finishing out of order
+        slack = 1 if name == "sku" else surge_engine.DEADLINE_CHUNK_SKUS
+        runs = []
+        for frac in fractions + [100.0]:
+            budget = max(1, int(full["wall_ms"] * frac))
+            out = run(argv + [f"--deadline-ms={budget}"])
+            got = [r["sku"] for r in out["results"]]
+            runs.append({
+                "deadline_ms": budget,
+                "wall_ms": out["wall_ms"],
+                "overrun_ms": round(out["wall_ms"] - budget, 1),
+                "returned": len(got),
+                "skipped_skus": out["skipped_skus"],
+                "partial": out["partial"],
+            })
+            changed = [r["sku"] for r in out["results"] if not same(r, by_sku.get(r["sku"]))]
+            if changed:
+                failures.append(f"{name} @ {budget} ms: {len(changed)} results differ from the full run (first: {changed[0]})")
+            if got and max(rank[s] for s in got) >= len(got) + slack:
+                failures.append(f"{name} @ {budget} ms: returned SKUs are not the top of the ranking")
+            if out["total_skus"] != len(full["results"]) or out["skipped_skus"] + len(got) != out["total_skus"]:
+                failures.append(f"{name} @ {budget} ms: counts {out['total_skus']}/{out['skipped_skus']} do not add up")
+            if frac >= 100 and (out["partial"] or len(got) != len(full["results"])):
+                failures.append(f"{name}: a {budget} ms budget still returned a partial payload")
+        report["engines"][name] = {"full_ms": full["wall_ms"], "skus": len(full["results"]), "runs": runs}
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Deadline check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
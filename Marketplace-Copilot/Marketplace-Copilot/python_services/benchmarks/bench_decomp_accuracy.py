@@ -0,0 +1,135 @@
+"""
+Decomposition accuracy-vs-speed benchmark: the per-SKU engine with
+--decomp=exact (statsmodels seasonal_decompose, pandas peak grouping) against
+--decomp=fast (the numpy decomposition and peak kernels from surge_batch).
+
+Runs both modes over a synthetic seller (generated with surge_bench, cached
+under data/.surge_bench/) and, when the project data directory has sales CSVs,
+over that sample data too. Reports decomposition, peak detection and total
+compute seconds per mode and the max deviation of surge_multiplier,
+seasonal_index and adjusted_forecast plus spike/seasonal flag disagreements.
+Exits 1 when a deviation exceeds --tolerance.
+
+Usage:
+    python python_services/benchmarks/bench_decomp_accuracy.py [--skus=500] [--years=2] [--max-skus=N] [--tolerance=1e-6]
+"""
+
+import os
+import sys
+import json
+import time
+import warnings
+import logging
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import surge_engine
+from surge_bench import ensure_dataset
+from surge_profile import Profiler, profiling
+
+FLAGS = ("spike_flag", "seasonal_flag")
+
+
+def run_mode(sales_df, promos, today, decomp: str) -> Dict[str, Any]:
+    with profiling(Profiler()) as prof:
+        t0 = time.perf_counter()
+        results = surge_engine.compute_serial(sales_df, promos, today, 14, None, "sku", decomp_method=decomp)
+        seconds = time.perf_counter() - t0
+        spans = prof.snapshot()["spans"]
+    return {
+        "results": {r["sku"]: r for r in results},
+        "compute_s": round(seconds, 3),
+        "decomposition_s": spans.get("decomposition", {}).get("seconds", 0.0),
+        "peak_detection_s": spans.get("peak_detection", {}).get("seconds", 0.0),
+    }
+
+
+def deviations(exact: Dict[str, Any], fast: Dict[str, Any]) -> Dict[str, Any]:
+    common = sorted(set(exact) & set(fast))
+    out: Dict[str, Any] = {"skus_compared": len(common), "skus_missing": len(set(exact) ^ set(fast))}
+
+    def max_abs(get) -> float:
+        return float(max((abs(get(fast[s]) - get(exact[s])) for s in common), default=0.0))
+
+    out["surge_multiplier_max_abs"] = max_abs(lambda r: r["surge_multiplier"])
+    out["seasonal_index_max_abs"] = max_abs(lambda r: r["components"]["seasonal_index"])
+    out["adjusted_forecast_max_rel"] = float(max(
+        (abs(fast[s]["adjusted_forecast"] - exact[s]["adjusted_forecast"]) / max(1.0, abs(exact[s]["adjusted_forecast"])) for s in common),
+        default=0.0,
+    ))
+    for flag in FLAGS:
+        out[f"{flag}_mismatches"] = sum(1 for s in common if fast[s]["signals"][flag] != exact[s]["signals"][flag])
+    return out
+
+
+def compare_dataset(name: str, max_skus: Optional[int]) -> Dict[str, Any]:
+    sales_df = surge_engine.load_sales_from_csv(None)
+    today = surge_engine.date_today(sales_df["date"])
+    promos = surge_engine.PromotionIndex(surge_engine.fetch_promotions(None), today)
+    if max_skus:
+        keep = np.sort(sales_df["sku"].unique())[:max_skus]
+        sales_df = sales_df[sales_df["sku"].isin(keep)]
+
+    exact = run_mode(sales_df, promos, today, "exact")
+    fast = run_mode(sales_df, promos, today, "fast")
+    report = {
+        "dataset": name,
+        "rows": int(len(sales_df)),
+        "exact": {k: v for k, v in exact.items() if k != "results"},
+        "fast": {k: v for k, v in fast.items() if k != "results"},
+        "deviation": deviations(exact["results"], fast["results"]),
+    }
+    if fast["decomposition_s"] > 0:
+        report["decomposition_speedup"] = round(exact["decomposition_s"] / fast["decomposition_s"], 2)
+    if fast["peak_detection_s"] > 0:
+        report["peak_detection_speedup"] = round(exact["peak_detection_s"] / fast["peak_detection_s"], 2)
+    if fast["compute_s"] > 0:
+        report["compute_speedup"] = round(exact["compute_s"] / fast["compute_s"], 2)
+    return report
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    skus = int(opts.get("skus", 500))
+    years = int(opts.get("years", 2))
+    max_skus = int(opts["max-skus"]) if "max-skus" in opts else None
+    tolerance = float(opts.get("tolerance", 1e-6))
+
+    warnings.simplefilter("ignore", FutureWarning)
+    logging.getLogger("surge_engine").setLevel(logging.WARNING)
+    # The CSV fallback is what is being measured, so never pick up a database
+    os.environ.pop("DATABASE_URL", None)
+
+    reports: List[Dict[str, Any]] = []
+    sample_dir = surge_engine.project_data_dir()
+    if not surge_engine.load_sales_from_csv(None).empty:
+        reports.append(compare_dataset(f"sample:{sample_dir}", max_skus))
+
+    synth_dir = os.path.join(sample_dir, ".surge_bench", f"{skus}x{years}y_d1.0")
+    ensure_dataset(synth_dir, skus, years, 1.0, regenerate=False)
+    os.environ["SURGE_DATA_DIR"] = synth_dir
+    reports.append(compare_dataset(f"synthetic:{skus}x{years}y", max_skus))
+
+    print(json.dumps(reports, indent=2))
+
+    failures = []
+    for r in reports:
+        dev = r["deviation"]
+        for key in ("surge_multiplier_max_abs", "seasonal_index_max_abs", "adjusted_forecast_max_rel"):
+            if dev[key] > tolerance:
+                failures.append(f"{r['dataset']}: {key}={dev[key]:.3g}")
+        for flag in FLAGS:
+            if dev[f"{flag}_mismatches"]:
+                failures.append(f"{r['dataset']}: {dev[f'{flag}_mismatches']} {flag} mismatches")
+    if failures:
+        print("Fast decomposition deviates beyond tolerance %g:" % tolerance, file=sys.stderr)
+        for line in failures:
+            print("  " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
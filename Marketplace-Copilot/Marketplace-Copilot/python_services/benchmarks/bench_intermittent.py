@@ -0,0 +1,141 @@
+"""
+Intermittent-demand fast path benchmark: runs the per-SKU (--decomp=fast) and
+batch engines with and without --intermittent on a synthetic seller whose SKUs
+each keep a share of sale days drawn from [--min-density, --density], so the
+catalog mixes dense and sparse SKUs (generated with surge_bench, cached under
+data/.surge_bench/). It reports the
+share of SKUs classified intermittent, total and decomposition seconds, and the
+forecast error on a holdout. The last --holdout days are cut from the export,
+both runs forecast them (--lead=holdout), and the mean absolute error of
+base_forecast against the units actually sold is reported separately for
+intermittent and dense SKUs.
+
+It checks that both classes are non-empty and that dense SKUs get the same
+result with and without --intermittent (floats to a relative 1e-9: the batch
+engine sums over a matrix without the intermittent rows), and exits 1 when
+either fails. An
+engine that is slower with --intermittent (speedup below 1, as the batch engine
+can be on mostly dense catalogs) is listed under "slower_with_intermittent".
+
+Usage:
+    python python_services/benchmarks/bench_intermittent.py [--skus=2000] [--years=2] [--density=1.0]
+        [--min-density=0.05] [--holdout=28]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import warnings
+import logging
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import surge_engine
+from bench_deadline import same
+from surge_bench import ensure_dataset
+from surge_profile import Profiler, profiling
+
+REASON = "Intermittent demand (SBA rate)"
+
+
+def run_engine(argv: List[str]) -> Dict[str, Any]:
+    with profiling(Profiler()) as prof:
+        t0 = time.perf_counter()
+        payload = surge_engine.run_surge(surge_engine.parse_args(argv))
+        seconds = time.perf_counter() - t0
+        snap = prof.snapshot()
+    spans = snap["spans"]
+    return {
+        "results": {r["sku"]: r for r in payload["results"]},
+        "total_s": round(seconds, 3),
+        "decomposition_s": spans.get("decomposition", {}).get("seconds", 0.0),
+        "intermittent_s": spans.get("intermittent", {}).get("seconds", 0.0),
+        "skus_intermittent": snap["counters"].get("skus_intermittent", 0),
+    }
+
+
+def holdout_errors(data_dir: str, holdout: int) -> Dict[str, Any]:
+    """MAE of base_forecast over the held-out days, with and without --intermittent."""
+    sales = pd.read_csv(os.path.join(data_dir, "amazon_sales.csv"), parse_dates=["date"])
+    cutoff = sales["date"].max() - pd.Timedelta(days=holdout)
+    actual = sales[sales["date"] > cutoff].groupby("sku")["units_sold"].sum()
+    tmp = tempfile.mkdtemp(prefix="surge_holdout_")
+    try:
+        past = sales[sales["date"] <= cutoff]
+        past.assign(date=past["date"].dt.strftime("%Y-%m-%d")).to_csv(os.path.join(tmp, "amazon_sales.csv"), index=False)
+        shutil.copy(os.path.join(data_dir, "promotions.csv"), tmp)
+        os.environ["SURGE_DATA_DIR"] = tmp
+        argv = ["--decomp=fast", f"--lead={holdout}"]
+        full = run_engine(argv)["results"]
+        fast = run_engine(argv + ["--intermittent"])["results"]
+    finally:
+        os.environ["SURGE_DATA_DIR"] = data_dir
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    groups: Dict[str, Dict[str, List[float]]] = {"intermittent": {"decomposition": [], "sba": []}, "dense": {"decomposition": [], "sba": []}}
+    for sku, r in fast.items():
+        group = groups["intermittent" if REASON in r["reasons"] else "dense"]
+        sold = float(actual.get(sku, 0))
+        group["decomposition"].append(abs(full[sku]["base_forecast"] - sold))
+        group["sba"].append(abs(r["base_forecast"] - sold))
+    return {
+        name: {"skus": len(errs["sba"]), **{f"mae_{k}": round(float(np.mean(v)), 2) if v else None for k, v in errs.items()}}
+        for name, errs in groups.items()
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    skus = int(opts.get("skus", 2000))
+    years = int(opts.get("years", 2))
+    density = float(opts.get("density", 1.0))
+    min_density = float(opts.get("min-density", 0.05))
+    holdout = int(opts.get("holdout", 28))
+
+    warnings.simplefilter("ignore", FutureWarning)
+    logging.getLogger("surge_engine").setLevel(logging.WARNING)
+    os.environ.pop("DATABASE_URL", None)
+    data_dir = os.path.join(surge_engine.project_data_dir(), ".surge_bench", f"{skus}x{years}y_d{min_density}-{density}")
+    dataset = ensure_dataset(data_dir, skus, years, density, min_density=min_density)
+    os.environ["SURGE_DATA_DIR"] = data_dir
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {"dataset": dataset, "engines": {}}
+    for engine, argv in (("sku", ["--decomp=fast"]), ("batch", ["--engine=batch"])):
+        full = run_engine(argv)
+        fast = run_engine(argv + ["--intermittent"])
+        changed = [s for s, r in fast["results"].items() if REASON not in r["reasons"] and not same(r, full["results"].get(s))]
+        if changed or len(fast["results"]) != len(full["results"]):
+            failures.append(f"{engine}: {len(changed)} dense SKUs changed with --intermittent (first: {changed[:1]})")
+        if not 0 < fast["skus_intermittent"] < len(full["results"]):
+            failures.append(f"{engine}: {fast['skus_intermittent']} of {len(full['results'])} SKUs intermittent, "
+                            "so one class is empty; widen --min-density..--density")
+        report["engines"][engine] = {
+            "skus": len(full["results"]),
+            "intermittent_share": round(fast["skus_intermittent"] / max(1, len(full["results"])), 3),
+            "full": {k: full[k] for k in ("total_s", "decomposition_s")},
+            "intermittent": {k: fast[k] for k in ("total_s", "decomposition_s", "intermittent_s")},
+            "speedup": round(full["total_s"] / fast["total_s"], 2),
+        }
+    report["slower_with_intermittent"] = [e for e, r in report["engines"].items() if r["speedup"] < 1]
+    report["holdout"] = {"days": holdout, **holdout_errors(data_dir, holdout)}
+    for name in ("intermittent", "dense"):
+        if not report["holdout"][name]["skus"]:
+            failures.append(f"holdout: no {name} SKUs, so its forecast error is not measured")
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Intermittent check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Out-of-core sales loading check: generates an order-level sales export larger
+than a memory cap and loads it through the chunked CSV fallback with
+--memory-mb sized chunks, in a fresh subprocess so peak RSS is measured in
+isolation. Verifies that
+
+  - the export is larger than the cap,
+  - peak RSS growth during the load, less the folded frame it returns (which
+    scales with distinct SKU-days and has to fit regardless), stays under the cap,
+  - the folded frame has one row per (sku, day) and the generated unit total.
+
+Then runs the batch engine on the folded frame and reports its time. Exits 1
+when a check fails.
+
+Usage:
+    python python_services/benchmarks/bench_out_of_core.py [--orders=8000000] [--skus=2000] [--days=730] [--memory-mb=64]
+        [--compare-uncapped] [--regenerate]
+
+--memory-mb below surge_engine.MIN_MEMORY_MB (16) is rejected, as the engine
+rejects it. --compare-uncapped also loads the export in a single chunk to show
+the memory the cap saves. Exports are cached under data/.surge_bench/.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+from datetime import date
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import surge_engine
+
+END_DATE = date(2025, 10, 20)
+ROWS_PER_WRITE = 1_000_000
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); elsewhere peak_rss_mb() keeps the process-wide peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    # VmHWM belongs to this process image; ru_maxrss also carries the peak of a parent across fork + exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def generate_orders(out_dir: str, orders: int, skus: int, days: int, seed: int = 11) -> Dict[str, Any]:
+    """One row per order (1-3 units) with the extra columns a marketplace export carries."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = np.array([f"SKU{i:05d}" for i in range(skus)], dtype=object)
+    dates = np.asarray(pd.date_range(end=pd.Timestamp(END_DATE), periods=days, freq="D").strftime("%Y-%m-%d"), dtype=object)
+    # Skewed popularity so some SKUs get many orders per day and others few
+    weights = rng.pareto(1.5, skus) + 0.05
+    weights /= weights.sum()
+
+    path = os.path.join(out_dir, "amazon_sales.csv")
+    total_units = 0
+    sku_days = set()
+    with open(path, "w", newline="") as f:
+        for lo in range(0, orders, ROWS_PER_WRITE):
+            n = min(ROWS_PER_WRITE, orders - lo)
+            sku = rng.choice(skus, n, p=weights)
+            day = rng.integers(0, days, n)
+            units = rng.integers(1, 4, n)
+            total_units += int(units.sum())
+            sku_days.update(np.unique(sku.astype(np.int64) * days + day).tolist())
+            pd.DataFrame({
+                "order_id": np.arange(lo, lo + n),
+                "sku": names[sku],
+                "date": dates[day],
+                "units_sold": units,
+                "city": rng.choice(np.array(["Mumbai", "Delhi", "Bengaluru", "Chennai", "Kolkata"], dtype=object), n),
+                "pincode": rng.integers(110001, 855118, n),
+                "selling_price": np.round(rng.uniform(99, 4999, n), 2),
+                "platform_fee": np.round(rng.uniform(5, 250, n), 2),
+            }).to_csv(f, header=(lo == 0), index=False)
+
+    meta = {
+        "orders": orders, "skus": skus, "days": days, "seed": seed,
+        "units": total_units, "sku_days": len(sku_days),
+        "file_mb": round(os.path.getsize(path) / 2**20, 1),
+    }
+    with open(os.path.join(out_dir, "dataset.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ensure_orders(out_dir: str, orders: int, skus: int, days: int, regenerate: bool) -> Dict[str, Any]:
+    meta_path = os.path.join(out_dir, "dataset.json")
+    if not regenerate and os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (meta.get("orders"), meta.get("skus"), meta.get("days")) == (orders, skus, days):
+            return meta
+    return generate_orders(out_dir, orders, skus, days)
+
+
+def warm_up(chunk_rows: int):
+    """Load a tiny export first so lazy imports and allocator arenas are not counted as load growth."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pd.DataFrame({"sku": ["A", "B"], "date": ["2025-01-01", "2025-01-02"], "units_sold": [1, 2]}).to_csv(
+            os.path.join(tmp, "amazon_sales.csv"), index=False
+        )
+        os.environ["SURGE_DATA_DIR"] = tmp
+        surge_engine.load_sales_from_csv(None, chunk_rows)
+
+
+def run_load(data_dir: str, chunk_rows: int) -> Dict[str, Any]:
+    os.environ.pop("DATABASE_URL", None)
+    warm_up(chunk_rows)
+    os.environ["SURGE_DATA_DIR"] = data_dir
+    shutil.rmtree(surge_engine.sales_cache_dir(), ignore_errors=True)
+
+    reset_peak_rss()
+    before = current_rss_mb()
+    t0 = time.perf_counter()
+    df = surge_engine.load_sales_from_csv(None, chunk_rows)
+    load_s = time.perf_counter() - t0
+    load_peak = peak_rss_mb()
+    frame_mb = df.memory_usage(index=False).sum() / 2**20
+
+    today = surge_engine.date_today(df["date"])
+    promos = surge_engine.PromotionIndex(surge_engine.fetch_promotions(None), today)
+    t0 = time.perf_counter()
+    results = surge_engine.compute_serial(df, promos, today, 14, None, "batch")
+    compute_s = time.perf_counter() - t0
+    return {
+        "chunk_rows": chunk_rows,
+        "rows": int(len(df)),
+        "duplicate_sku_days": int(df.duplicated(["sku", "day"]).sum()),
+        "units": int(df["units"].sum()),
+        "load_s": round(load_s, 2),
+        "load_rss_growth_mb": round(load_peak - before, 1),
+        "frame_mb": round(frame_mb, 1),
+        "compute_s": round(compute_s, 2),
+        "results": len(results),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) if "=" in a else (a[2:], "1") for a in sys.argv[1:] if a.startswith("--"))
+    orders = int(opts.get("orders", 8_000_000))
+    skus = int(opts.get("skus", 2_000))
+    days = int(opts.get("days", 730))
+    memory_mb = int(opts.get("memory-mb", 64))
+    data_dir = opts.get("data-dir") or os.path.join(
+        surge_engine.project_data_dir(), ".surge_bench", f"orders_{orders}x{skus}x{days}"
+    )
+
+    if "chunk-rows" in opts:
+        # Child process: one load, reported as a JSON line
+        print(json.dumps(run_load(data_dir, int(opts["chunk-rows"]))))
+        return
+
+    try:
+        capped_rows = surge_engine.chunk_rows_for_budget(memory_mb)
+    except ValueError as e:
+        sys.exit(str(e))
+    dataset = ensure_orders(data_dir, orders, skus, days, "regenerate" in opts)
+    modes = {"capped": capped_rows}
+    if "compare-uncapped" in opts:
+        modes["uncapped"] = orders + 1
+
+    report: Dict[str, Any] = {"dataset": dataset, "memory_mb": memory_mb, "runs": {}}
+    for name, chunk_rows in modes.items():
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), f"--chunk-rows={chunk_rows}", f"--data-dir={data_dir}"],
+            capture_output=True, text=True, check=True
+        )
+        report["runs"][name] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+    capped = report["runs"]["capped"]
+    failures = []
+    if dataset["file_mb"] <= memory_mb:
+        failures.append(f"export is {dataset['file_mb']} MB, not larger than the {memory_mb} MB cap; raise --orders")
+    working_mb = capped["load_rss_growth_mb"] - capped["frame_mb"]
+    if working_mb > memory_mb:
+        failures.append(f"load used {working_mb:.1f} MB beyond its {capped['frame_mb']} MB result, over the {memory_mb} MB cap")
+    if capped["units"] != dataset["units"]:
+        failures.append(f"units {capped['units']} != generated {dataset['units']}")
+    if capped["rows"] != dataset["sku_days"] or capped["duplicate_sku_days"]:
+        failures.append(f"rows {capped['rows']} != distinct sku-days {dataset['sku_days']}")
+    if failures:
+        for line in failures:
+            print("Out-of-core check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Page parser benchmark: parses every page in benchmarks/fixtures/ (generated by
+page_fixtures.py, plus any saved product_*.html / search_*.html) with the
+BeautifulSoup reference (soup_product_page, soup_search_results) and with the
+lxml parser (parse_product_page, parse_search_results).
+
+It checks that both give the same fields for every page and, for generated
+fixtures, that they match fixtures/expected.json. Then it times --rounds passes
+over the corpus with each parser and reports pages/second and CPU ms per page
+(process time, so other load on the machine does not count), per page type.
+It exits 1 on any mismatch.
+
+Usage:
+    python python_services/benchmarks/bench_page_parser.py [--rounds=5] [--regenerate=1]
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import logging
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_parser import parse_product_page, parse_search_results, soup_product_page, soup_search_results
+from page_fixtures import FIXTURES_DIR, SEARCH_MAX_RESULTS, write_fixtures
+
+
+def load_pages() -> List[Tuple[str, bytes]]:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html.gz"))):
+        with gzip.open(path) as f:
+            pages.append((os.path.basename(path), f.read()))
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def extract(name: str, content: bytes, product: Callable, search: Callable) -> Any:
+    if name.startswith("product_"):
+        result = product(content, name)
+        return asdict(result) if result else None
+    return search(content, SEARCH_MAX_RESULTS)
+
+
+def timed(pages: List[Tuple[str, bytes]], rounds: int, product: Callable, search: Callable) -> Dict[str, Any]:
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(rounds):
+        for name, content in pages:
+            extract(name, content, product, search)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    n = len(pages) * rounds
+    return {
+        "pages_per_s": round(n / wall, 1),
+        "cpu_ms_per_page": round(cpu * 1000 / n, 2),
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    rounds = int(opts.get("rounds", 5))
+
+    logging.getLogger("page_parser").setLevel(logging.ERROR)
+    expected_path = os.path.join(FIXTURES_DIR, "expected.json")
+    if opts.get("regenerate") == "1" or not os.path.exists(expected_path):
+        write_fixtures()
+    with open(expected_path) as f:
+        expected = json.load(f)["pages"]
+
+    pages = load_pages()
+    failures: List[str] = []
+    for name, content in pages:
+        old = extract(name, content, soup_product_page, soup_search_results)
+        new = extract(name, content, parse_product_page, parse_search_results)
+        if new != old:
+            failures.append(f"{name}: lxml {new!r} != BeautifulSoup {old!r}")
+        if name in expected and old != expected[name]:
+            failures.append(f"{name}: BeautifulSoup result no longer matches expected.json")
+
+    report: Dict[str, Any] = {
+        "pages": len(pages),
+        "avg_page_kb": round(sum(len(c) for _, c in pages) / len(pages) / 1024, 1),
+        "rounds": rounds,
+        "mismatches": len(failures),
+    }
+    for kind in ("product", "search"):
+        subset = [(name, content) for name, content in pages if name.startswith(kind + "_")]
+        if not subset:
+            continue
+        old = timed(subset, rounds, soup_product_page, soup_search_results)
+        new = timed(subset, rounds, parse_product_page, parse_search_results)
+        report[kind] = {
+            "pages": len(subset),
+            "beautifulsoup": old,
+            "lxml": new,
+            "speedup": round(old["cpu_ms_per_page"] / new["cpu_ms_per_page"], 1),
+        }
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Parser check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Surge payload encoding benchmark: JSON (the default output) against the
+msgpack and arrow formats from surge_codec.py.
+
+Builds a synthetic payload of --skus results (default 50k) with
+assemble_sku_result() and aggregate_for_dashboard(), then reports payload size
+and encode/decode time per format as JSON. Arrow is decoded twice: to the
+Arrow table only (what a columnar consumer reads) and back to Python objects.
+
+Usage:
+    python python_services/benchmarks/bench_payload_codec.py [--skus=50000] [--repeat=3]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import surge_engine
+from surge_codec import encode_payload, decode_payload, _msgpack, _pyarrow
+
+logging.getLogger("surge_engine").setLevel(logging.WARNING)
+
+
+def synthetic_payload(n_skus: int, seed: int = 7) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    today = date(2025, 10, 20)
+    results: List[Dict[str, Any]] = []
+    for i in range(n_skus):
+        trend_last = rng.uniform(0.5, 200.0)
+        peaks = []
+        for _ in range(rng.randrange(0, 8)):
+            d = today + timedelta(days=rng.randrange(-20, 120))
+            peaks.append({
+                "start_date": d.strftime("%m-%d"),
+                "end_date": (d + timedelta(days=2)).strftime("%m-%d"),
+                "magnitude": rng.uniform(0.0, trend_last),
+                "duration_days": rng.randrange(1, 6),
+            })
+        signals = {
+            "seasonal_mult": rng.uniform(0.7, 1.8),
+            "spike_flag": np.bool_(rng.random() < 0.1),
+            "spike_mult": rng.uniform(1.0, 1.6),
+            "trend_mult": rng.uniform(0.6, 1.6),
+            "trend_flag": np.bool_(rng.random() < 0.3),
+            "accel": rng.uniform(-0.4, 0.6),
+            "trend_last": trend_last,
+            "strength": rng.random(),
+            "base_daily": trend_last,
+        }
+        promo = rng.random() < 0.2
+        results.append(surge_engine.assemble_sku_result(
+            f"SKU{i:06d}", signals, peaks, 1.0 + 0.3 * promo, promo, today, 14, None
+        ))
+    return {"results": results, "dashboard": surge_engine.aggregate_for_dashboard(results, today)}
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    n_skus = int(opts.get("skus", 50_000))
+    repeat = int(opts.get("repeat", 3))
+
+    payload = synthetic_payload(n_skus)
+    report: Dict[str, Any] = {"skus": n_skus, "formats": {}}
+
+    text = json.dumps(payload, default=str)
+    report["formats"]["json"] = {
+        "bytes": len(text.encode("utf-8")),
+        "encode_s": round(best_of(lambda: json.dumps(payload, default=str), repeat), 4),
+        "decode_s": round(best_of(lambda: json.loads(text), repeat), 4),
+    }
+
+    for fmt in ("msgpack", "arrow"):
+        try:
+            data = encode_payload(payload, fmt)
+        except RuntimeError as e:
+            report["formats"][fmt] = {"skipped": str(e)}
+            continue
+        entry = {
+            "bytes": len(data),
+            "encode_s": round(best_of(lambda: encode_payload(payload, fmt), repeat), 4),
+            "decode_s": round(best_of(lambda: decode_payload(data), repeat), 4),
+        }
+        if fmt == "arrow":
+            pa = _pyarrow()
+
+            def table_only():
+                envelope = _msgpack().unpackb(data, raw=False)
+                return pa.ipc.open_stream(envelope["results"]).read_all()
+
+            entry["decode_table_s"] = round(best_of(table_only, repeat), 4)
+        report["formats"][fmt] = entry
+
+    base = report["formats"]["json"]
+    for fmt, entry in report["formats"].items():
+        if "bytes" in entry:
+            entry["size_vs_json"] = round(entry["bytes"] / base["bytes"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
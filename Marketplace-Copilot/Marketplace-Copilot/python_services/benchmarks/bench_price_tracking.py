@@ -0,0 +1,153 @@
+"""
+Price tracking throughput benchmark: starts the local mock marketplace
+(mock_marketplace.py) in a background thread and tracks --asins competitor
+mappings with AsyncPriceTracker against it, with --concurrency pages in flight
+and a --rate / --burst token bucket for the host. Storage goes to memory
+instead of Postgres (store_price_data is overridden), so only scraping is timed.
+The run is repeated for each --parse-workers value (0 parses on the event loop)
+to show how throughput scales with parse processes until the token bucket or
+the fetch side becomes the bound; each run reports the pipeline's stage
+latencies and queue depths.
+
+The sequential PriceTracker is timed on --sync-sample ASINs against the same
+server (one page at a time, paced by the same host bucket) and projected to
+--asins for comparison. It checks that
+
+  - stats of every run are {'total','success','failed'} with the expected counts (--missing
+    of the ASINs 404 or have no price),
+  - every stored PriceData matches what the server rendered,
+  - the server saw no more than --rate plus --burst requests in any second
+    (plus mock_marketplace.ARRIVAL_SLACK_S of arrival jitter) and did not
+    have to throttle,
+
+and exits 1 when a check fails.
+
+Usage:
+    python python_services/benchmarks/bench_price_tracking.py [--asins=2000] [--concurrency=64] [--rate=200]
+        [--burst=20] [--latency-ms=100] [--page-kb=20] [--missing=0.05] [--sync-sample=2] [--parse-workers=0,4]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from dataclasses import asdict
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_tracker import AsyncPriceTracker
+from price_tracker import PriceTracker, PriceData, CompetitorMapping
+from mock_marketplace import MockMarketplace, product, start_in_thread
+
+
+class MemoryTracker(AsyncPriceTracker):
+    """AsyncPriceTracker storing price history in a dict instead of Postgres"""
+
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.stored: Dict[int, PriceData] = {}
+
+    def store_price_data(self, mapping_id: int, price_data: PriceData):
+        self.stored[mapping_id] = price_data
+
+
+def mappings(n: int, missing: float) -> List[CompetitorMapping]:
+    every = round(1 / missing) if missing else 0
+    out = []
+    for i in range(n):
+        prefix = ("MISSING" if i % (2 * every) == 0 else "NOPRICE") if every and i % every == 0 else "B0"
+        out.append(CompetitorMapping(id=i, sku=f"SKU{i // 5}", competitor_asin=f"{prefix}{i:08d}", competitor_title=""))
+    return out
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    n = int(opts.get("asins", 2000))
+    concurrency = int(opts.get("concurrency", 64))
+    rate = float(opts.get("rate", 200))
+    burst = float(opts.get("burst", 20))
+    latency_ms = float(opts.get("latency-ms", 100))
+    page_kb = int(opts.get("page-kb", 20))
+    missing = float(opts.get("missing", 0.05))
+    sync_sample = int(opts.get("sync-sample", 2))
+    parse_workers = [int(w) for w in opts.get("parse-workers", f"0,{os.cpu_count() or 1}").split(",")]
+
+    logging.getLogger("price_tracker").setLevel(logging.CRITICAL)
+    logging.getLogger("async_tracker").setLevel(logging.CRITICAL)
+    logging.getLogger("page_parser").setLevel(logging.CRITICAL)
+    marketplace = MockMarketplace(latency_ms, page_kb, rate, burst)
+    url, _ = start_in_thread(marketplace)
+    competitors = mappings(n, missing)
+    expected = {c.id: product(c.competitor_asin) for c in competitors}
+
+    failures: List[str] = []
+    want = {"total": n, "success": sum(p is not None for p in expected.values())}
+    want["failed"] = n - want["success"]
+    runs = []
+    for workers in parse_workers:
+        marketplace.reset()
+        tracker = MemoryTracker(concurrency=concurrency, product_url=url, parse_workers=workers,
+                                host_limits={url.split("/")[2]: {"rate": rate, "burst": burst}})
+        if workers:
+            # Start the parse processes outside the timed run, as the scheduler's long-lived tracker has them
+            tracker.parse_executor().submit(int).result()
+        t0 = time.perf_counter()
+        stats = asyncio.run(tracker.track_competitors(competitors))
+        seconds = time.perf_counter() - t0
+        tracker.close()
+
+        if stats != want:
+            failures.append(f"parse_workers={workers}: stats {stats} != expected {want}")
+        wrong = [i for i, p in expected.items() if p is not None and (i not in tracker.stored or asdict(tracker.stored[i]) != p)]
+        if wrong:
+            failures.append(f"parse_workers={workers}: {len(wrong)} stored prices differ from the served pages (first: mapping {wrong[0]})")
+        if marketplace.stats["throttled"] or marketplace.stats["max_per_second"] > marketplace.limit:
+            failures.append(f"parse_workers={workers}: rate limit exceeded: {marketplace.stats}")
+        runs.append({
+            "parse_workers": workers,
+            "stats": stats,
+            "seconds": round(seconds, 2),
+            "pages_per_s": round(n / seconds, 1),
+            "server": dict(marketplace.stats),
+            "pipeline": tracker.metrics.summary(),
+        })
+
+    # Sequential baseline: one page at a time through the same host bucket
+    sync = PriceTracker({})
+    sync.product_url = url
+    sync.host_limits = dict(tracker.host_limits)
+    t0 = time.perf_counter()
+    for c in competitors[1:sync_sample + 1]:
+        sync.scrape_amazon_product(c.competitor_asin)
+    sync_per_asin = (time.perf_counter() - t0) / max(1, sync_sample)
+
+    report: Dict[str, Any] = {
+        "asins": n,
+        "concurrency": concurrency,
+        "host_rate": rate,
+        "host_burst": burst,
+        "latency_ms": latency_ms,
+        "page_kb": page_kb,
+        # Upper bound from the token bucket and from concurrency / latency
+        "bound_pages_per_s": round(min(rate, concurrency / (latency_ms / 1000)) if latency_ms else rate, 1),
+        "cpus": os.cpu_count(),
+        "runs": runs,
+        "sequential": {
+            "sample": sync_sample,
+            "seconds_per_asin": round(sync_per_asin, 2),
+            "projected_seconds": round(sync_per_asin * n, 1),
+        },
+        "speedup": round(sync_per_asin * n / min(r["seconds"] for r in runs), 1),
+    }
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Price tracking check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Price history write benchmark: inserts synthetic PriceData rows into
+competitor_price_history on the configured Postgres (config.DB_CONFIG, DB_*
+environment variables) through the per-row path
+(PriceTracker.store_price_data: an INSERT and a commit per row) and through
+PriceHistoryWriter, and reports rows/second for both.
+
+Rows go to the first existing competitor_mapping and are tagged with a seller
+name, so they can be deleted again at the end. Halfway through the writer run
+the writer's pooled backends are terminated, so a flush fails and is retried,
+and one row for a mapping that does not exist is added, so a batch fails its
+foreign key. It checks that every other row reached the table and that only
+the bad row was dropped, and exits 1 otherwise.
+
+Usage:
+    python python_services/benchmarks/bench_price_writer.py [--rows=20000] [--per-row=500] [--batch=500] [--threads=4]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from config import DB_CONFIG
+from price_tracker import PriceTracker, PriceData
+from price_writer import PriceHistoryWriter
+
+TAG = "__bench_price_writer__"
+
+
+def price_rows(n: int) -> List[PriceData]:
+    return [
+        PriceData(price=100 + i % 5000, availability="in_stock", seller_rating=4.2,
+                  seller_name=TAG, shipping_cost=float(i % 3 * 40))
+        for i in range(n)
+    ]
+
+
+def tagged_rows(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM competitor_price_history WHERE seller_name = %s", (TAG,))
+        return cur.fetchone()[0]
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    n = int(opts.get("rows", 20000))
+    per_row = int(opts.get("per-row", 500))
+    batch = int(opts.get("batch", 500))
+    threads = int(opts.get("threads", 4))
+
+    logging.getLogger("price_writer").setLevel(logging.ERROR)
+    admin = psycopg2.connect(**DB_CONFIG)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT id FROM competitor_mapping ORDER BY id LIMIT 1")
+        row = cur.fetchone()
+    if row is None:
+        print("bench_price_writer needs at least one competitor_mapping row", file=sys.stderr)
+        sys.exit(1)
+    mapping_id = row[0]
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {"rows": n, "per_row_rows": per_row, "batch_size": batch, "threads": threads}
+    try:
+        # Per-row path: an INSERT and a commit per row
+        tracker = PriceTracker(DB_CONFIG)
+        rows = price_rows(per_row)
+        t0 = time.perf_counter()
+        for price_data in rows:
+            tracker.store_price_data(mapping_id, price_data)
+        per_row_s = time.perf_counter() - t0
+
+        # Buffered writer fed from several threads, as the async tracker does
+        before = tagged_rows(admin)
+        rows = price_rows(n)
+        writer = PriceHistoryWriter(DB_CONFIG, batch_size=batch)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda p: writer.add(mapping_id, p), rows[:n // 2]))
+            # A mapping deleted since it was scraped: its batch is bisected and the row dropped
+            writer.add(-1, rows[0])
+            # Kill the pooled backends under the writer: its next flush fails and is retried
+            with admin.cursor() as cur:
+                for conn, _ in list(writer.pool.idle):
+                    cur.execute("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(),))
+            list(pool.map(lambda p: writer.add(mapping_id, p), rows[n // 2:]))
+        writer.close()
+        writer_s = time.perf_counter() - t0
+        landed = tagged_rows(admin) - before
+
+        if landed < n:
+            failures.append(f"{n - landed} of {n} buffered rows never reached the table")
+        if writer.stats['rows_dropped'] != 1:
+            failures.append(f"{writer.stats['rows_dropped']} rows dropped, expected only the one without a mapping")
+        report.update({
+            "per_row": {"seconds": round(per_row_s, 2), "rows_per_s": round(per_row / per_row_s, 1)},
+            "writer": {
+                "seconds": round(writer_s, 2),
+                "rows_per_s": round(n / writer_s, 1),
+                "rows_in_table": landed,
+                **writer.stats,
+            },
+            "speedup": round((n / writer_s) / (per_row / per_row_s), 1),
+        })
+    finally:
+        with admin.cursor() as cur:
+            cur.execute("DELETE FROM competitor_price_history WHERE seller_name = %s", (TAG,))
+        admin.close()
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Price writer check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
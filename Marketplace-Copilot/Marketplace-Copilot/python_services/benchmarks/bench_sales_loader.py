@@ -0,0 +1,134 @@
+"""
+Sales loader benchmark: the previous fetchall()/RealDictCursor loader against
+the streaming server-side cursor loader (surge_engine.stream_sales) and the
+daily_sales rollup loader (surge_engine.stream_daily_sales).
+
+Each loader runs in a fresh subprocess so peak RSS is measured in isolation.
+Needs DATABASE_URL pointing at a database with sales/products rows.
+
+Usage:
+    python python_services/benchmarks/bench_sales_loader.py [--user=ID] [--sku=SKU] [--chunk=ROWS]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import surge_engine
+
+
+def legacy_fetch_sales(conn, user_id: Optional[str], sku_filter: Optional[str]) -> pd.DataFrame:
+    """fetch_sales() as it was before the streaming loader."""
+    q = """
+    SELECT p.sku, s.date::date AS date, s.quantity::int AS units
+    FROM sales s
+    JOIN products p ON p.id = s.product_id
+    WHERE 1=1
+    """
+    params: List[Any] = []
+    if user_id:
+        q += " AND s.user_id = %s"
+        params.append(user_id)
+    if sku_filter:
+        q += " AND p.sku = %s"
+        params.append(sku_filter)
+    q += " ORDER BY p.sku, s.date::date"
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(q, params)
+            rows = cur.fetchall()
+    if not rows:
+        return pd.DataFrame(columns=["sku", "date", "units"])
+    df = pd.DataFrame(rows)
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    df["units"] = pd.to_numeric(df["units"], errors="coerce").fillna(0).astype(int)
+    return df
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_one(loader: str, user_id: Optional[str], sku: Optional[str], chunk: int) -> Dict[str, Any]:
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], cursor_factory=RealDictCursor)
+    before = peak_rss_mb()
+    t0 = time.perf_counter()
+    if loader == "legacy":
+        df = legacy_fetch_sales(conn, user_id, sku)
+    elif loader == "rollup":
+        df = surge_engine.stream_daily_sales(conn, user_id, sku, chunk_rows=chunk)
+    else:
+        df = surge_engine.stream_sales(conn, user_id, sku, chunk_rows=chunk)
+    seconds = time.perf_counter() - t0
+    conn.close()
+    return {
+        "loader": loader,
+        "rows": int(len(df)),
+        "skus": int(df["sku"].nunique()) if len(df) else 0,
+        "units": int(df["units"].sum()) if len(df) else 0,
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "load_rss_mb": round(peak_rss_mb() - before, 1),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 1e6, 1),
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    user_id = opts.get("user")
+    sku = opts.get("sku")
+    chunk = int(opts.get("chunk", 100_000))
+    if not os.environ.get("DATABASE_URL"):
+        print("DATABASE_URL is not set", file=sys.stderr)
+        sys.exit(2)
+
+    if "loader" in opts:
+        print(json.dumps(run_one(opts["loader"], user_id, sku, chunk)))
+        return
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    loaders = ["legacy", "stream"]
+    if surge_engine.has_daily_rollup(conn):
+        loaders.append("rollup")
+    conn.close()
+
+    report = []
+    for loader in loaders:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), f"--loader={loader}"] + sys.argv[1:],
+            capture_output=True, text=True, check=True
+        )
+        report.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps(report, indent=2))
+
+    legacy = report[0]
+    if report[1]["rows"] != legacy["rows"]:
+        print(f"Row count mismatch: legacy={legacy['rows']} stream={report[1]['rows']}", file=sys.stderr)
+        sys.exit(1)
+    for r in report[1:]:
+        if r["units"] != legacy["units"]:
+            print(f"Units mismatch: legacy={legacy['units']} {r['loader']}={r['units']}", file=sys.stderr)
+            sys.exit(1)
+        if r["seconds"] > 0 and r["load_rss_mb"] > 0:
+            print(
+                f"{r['loader']} vs legacy: {legacy['seconds'] / r['seconds']:.2f}x faster, "
+                f"{legacy['load_rss_mb'] / r['load_rss_mb']:.2f}x less peak load memory, "
+                f"{legacy['rows'] / max(1, r['rows']):.1f}x fewer rows",
+                file=sys.stderr
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Series store benchmark: per-SKU daily series from the memory-mapped
+series_store against rebuilding them from sale rows (groupby + asfreq, the
+per-SKU engine's series_prep) and pivoting them (the batch engine's
+build_sales_matrix).
+
+On a synthetic seller (generated with surge_bench, cached under
+data/.surge_bench/) it reports store build time and size, open time, per-SKU
+series access time both ways, and series_prep / total seconds of the per-SKU
+and batch engines with and without --series-store. It also checks that
+
+  - both engines produce the same payload from the store as from sale rows,
+  - a store built from older sales and then appended to (new days in place,
+    new SKUs and more days than the spare columns through a rewrite) equals a
+    store built from all sales at once,
+
+and exits 1 when a check fails.
+
+Usage:
+    python python_services/benchmarks/bench_series_store.py [--skus=2000] [--years=2] [--sample=500]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import warnings
+import logging
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import surge_engine
+import series_store
+from series_store import SeriesStore
+from surge_bench import ensure_dataset
+from surge_batch import build_sales_matrix
+from surge_profile import Profiler, profiling
+
+
+def rebuild_daily(sdf: pd.DataFrame) -> pd.Series:
+    """compute_for_sku()'s series_prep without a store."""
+    df = sdf.copy().sort_values("date")
+    df = df.groupby("date", as_index=False)["units"].sum()
+    return df.set_index("date")["units"].asfreq("D").fillna(0)
+
+
+def same_store(a: SeriesStore, b: SeriesStore) -> List[str]:
+    diffs = []
+    if a.skus.tolist() != b.skus.tolist():
+        return ["sku lists differ"]
+    if a.origin != b.origin or a.n_days != b.n_days:
+        diffs.append(f"origin/days {a.origin}/{a.n_days} vs {b.origin}/{b.n_days}")
+    if not (np.array_equal(a.first, b.first) and np.array_equal(a.last, b.last)):
+        diffs.append("first/last days differ")
+    if not np.array_equal(a.units[:, :a.n_days], b.units[:, :b.n_days]):
+        diffs.append("units differ")
+    return diffs
+
+
+def run_engine(args: Dict[str, Any]) -> Dict[str, Any]:
+    with profiling(Profiler()) as prof:
+        t0 = time.perf_counter()
+        payload = surge_engine.run_surge(args)
+        seconds = time.perf_counter() - t0
+        spans = prof.snapshot()["spans"]
+    payload.pop("timings", None)
+    return {
+        "payload": payload,
+        "total_s": round(seconds, 3),
+        "fetch_sales_s": spans.get("fetch_sales", {}).get("seconds", 0.0),
+        "series_prep_s": spans.get("series_prep", {}).get("seconds", 0.0),
+    }
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    skus = int(opts.get("skus", 2000))
+    years = int(opts.get("years", 2))
+    sample = int(opts.get("sample", 500))
+
+    warnings.simplefilter("ignore", FutureWarning)
+    logging.getLogger("surge_engine").setLevel(logging.WARNING)
+    os.environ.pop("DATABASE_URL", None)
+    data_dir = os.path.join(surge_engine.project_data_dir(), ".surge_bench", f"{skus}x{years}y_d1.0")
+    dataset = ensure_dataset(data_dir, skus, years, 1.0, regenerate=False)
+    os.environ["SURGE_DATA_DIR"] = data_dir
+    sales_df = surge_engine.load_sales_from_csv(None)
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {"dataset": dataset}
+    tmp = tempfile.mkdtemp(prefix="surge_series_")
+    try:
+        path = os.path.join(tmp, "full")
+        t0 = time.perf_counter()
+        store = SeriesStore.build(path, sales_df)
+        report["build_s"] = round(time.perf_counter() - t0, 3)
+        report["store_mb"] = round(os.path.getsize(store.data_path()) / 2**20, 1)
+        t0 = time.perf_counter()
+        store = SeriesStore.open(path)
+        report["open_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        # Appends: new days in place, then new SKUs / a longer range through a rewrite
+        for name, cut in (("append_in_place", 10), ("append_rewrite", series_store.SPARE_DAYS + 60)):
+            cut_day = int(sales_df["day"].max()) - cut
+            part = os.path.join(tmp, name)
+            partial = SeriesStore.build(part, sales_df[sales_df["day"] < cut_day])
+            data_before = partial.header["data"]
+            since = partial.end_day
+            t0 = time.perf_counter()
+            appended = partial.append(sales_df[sales_df["day"] >= since], since_day=since)
+            report[f"{name}_s"] = round(time.perf_counter() - t0, 3)
+            report[f"{name}_rewrote"] = appended.header["data"] != data_before
+            failures += [f"{name}: {d}" for d in same_store(appended, store)]
+
+        # Per-SKU series access
+        names = store.skus[store.present_rows()][:sample].tolist()
+        groups = {s: g[["date", "units"]] for s, g in sales_df[sales_df["sku"].isin(names)].groupby("sku", observed=True)}
+        t0 = time.perf_counter()
+        rebuilt = {s: rebuild_daily(groups[s]) for s in names}
+        rebuild_us = (time.perf_counter() - t0) / len(names) * 1e6
+        t0 = time.perf_counter()
+        sliced = {s: store.daily(s) for s in names}
+        slice_us = (time.perf_counter() - t0) / len(names) * 1e6
+        report["series_access_us"] = {"groupby_asfreq": round(rebuild_us, 1), "store_slice": round(slice_us, 1), "speedup": round(rebuild_us / slice_us, 1)}
+        mismatched = [s for s in names if not np.array_equal(rebuilt[s].to_numpy(), sliced[s].to_numpy()) or not rebuilt[s].index.equals(sliced[s].index)]
+        if mismatched:
+            failures.append(f"{len(mismatched)} SKU series differ from groupby + asfreq (first: {mismatched[0]})")
+
+        t0 = time.perf_counter()
+        build_sales_matrix(sales_df)
+        pivot_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        store.sales_matrix()
+        report["matrix_s"] = {"pivot": round(pivot_s, 4), "store_map": round(time.perf_counter() - t0, 4)}
+
+        # Engines, from sale rows and from the store (synced, so the store path includes its refresh)
+        engines = {}
+        for engine in ("sku", "batch"):
+            args = surge_engine.parse_args([f"--engine={engine}", "--decomp=fast"] if engine == "sku" else [f"--engine={engine}"])
+            rows = run_engine(args)
+            args.update(series_store=True, series_dir=os.path.join(tmp, "engine"))
+            run_engine(args)  # first run builds the store
+            mapped = run_engine(args)
+            if rows["payload"] != mapped["payload"]:
+                failures.append(f"{engine} engine payload differs with --series-store")
+            engines[engine] = {
+                "rows": {k: v for k, v in rows.items() if k != "payload"},
+                "store": {k: v for k, v in mapped.items() if k != "payload"},
+            }
+        report["engines"] = engines
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for line in failures:
+            print("Series store check failed: " + line, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Local mock marketplace for the price tracker: serves synthetic Amazon-style
+product pages at /dp/{asin} with the elements parse_product_page() reads
+(price, availability, rating, seller, delivery), padded to --page-kb, after
+--latency-ms. Price and the other fields are derived from the ASIN, so a
+client can check what it stored with product(asin).
+
+ASINs starting with MISSING get a 404 and ones starting with NOPRICE a page
+without a price. The server enforces its own limit of --rate requests per second
+plus --burst (what a token bucket of that rate and burst can send in any one
+second), counted on arrival. Requests leave a client on the bucket's schedule
+but arrive with some jitter (the first burst opens its connections while later
+requests reuse them), so ARRIVAL_SLACK_S seconds' worth of rate is tolerated on
+top. Requests over it get a 429 with Retry-After: 1 and are counted.
+
+Usage:
+    python python_services/benchmarks/mock_marketplace.py [--port=8081] [--latency-ms=100] [--page-kb=20]
+        [--rate=0] [--burst=10]
+"""
+
+import sys
+import time
+import zlib
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+# Arrival jitter tolerated by the server's limit, in seconds of --rate
+ARRIVAL_SLACK_S = 0.05
+
+
+def product(asin: str) -> Optional[Dict[str, Any]]:
+    """The fields served for an ASIN (None when its page has no price)"""
+    if asin.startswith(("MISSING", "NOPRICE")):
+        return None
+    h = zlib.crc32(asin.encode())
+    return {
+        "price": float(100 + h % 90000),
+        "availability": ("in_stock", "in_stock", "in_stock", "out_of_stock", "temporarily_unavailable")[h % 5],
+        "seller_rating": round(1 + (h >> 8) % 41 / 10, 1),
+        "seller_name": f"Seller {(h >> 16) % 500}",
+        "shipping_cost": float((h >> 4) % 3 * 40),
+    }
+
+
+def render(asin: str, page_kb: int) -> bytes:
+    p = product(asin)
+    availability = {
+        "in_stock": "In stock",
+        "out_of_stock": "Currently unavailable.",
+        "temporarily_unavailable": "Temporarily sold out.",
+    }
+    parts = [f"<html><head><title>Product {asin}</title></head><body><div id=\"dp\">"]
+    if p:
+        shipping = f"₹{p['shipping_cost']:.0f} delivery" if p["shipping_cost"] else "FREE delivery"
+        parts += [
+            f"<span data-a-color=\"secondary\">{shipping} Monday, 3 March</span>",
+            f"<span class=\"a-price\"><span class=\"a-price-symbol\">₹</span><span class=\"a-price-whole\">{p['price']:,.0f}</span></span>",
+            f"<div id=\"availability\"><span>{availability[p['availability']]}</span></div>",
+            f"<i class=\"a-icon a-icon-star\"><span class=\"a-icon-alt\">{p['seller_rating']} out of 5 stars</span></i>",
+            f"<a id=\"sellerProfileTriggerId\" href=\"/seller\">{p['seller_name']}</a>",
+        ]
+    filler = "<div class=\"a-section\"><p>Product details and customer reviews.</p></div>"
+    body = "".join(parts)
+    parts.append(filler * max(0, (page_kb * 1024 - len(body)) // len(filler)))
+    parts.append("</div></body></html>")
+    return "".join(parts).encode()
+
+
+class MockMarketplace:
+    def __init__(self, latency_ms: float = 100, page_kb: int = 20, rate: float = 0, burst: float = 10):
+        self.latency = latency_ms / 1000
+        self.page_kb = page_kb
+        self.limit = rate * (1 + ARRIVAL_SLACK_S) + burst if rate else 0
+        self.recent: deque = deque()
+        self.stats = {"requests": 0, "throttled": 0, "max_per_second": 0}
+        self.pages: Dict[str, bytes] = {}
+
+    def reset(self):
+        """Clear the stats and the rate window between runs (rendered pages are kept)"""
+        self.recent.clear()
+        self.stats = {"requests": 0, "throttled": 0, "max_per_second": 0}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        self.stats["requests"] += 1
+        self.recent.append(now)
+        while self.recent and self.recent[0] <= now - 1:
+            self.recent.popleft()
+        if self.limit and len(self.recent) > self.limit:
+            self.recent.pop()
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        self.stats["max_per_second"] = max(self.stats["max_per_second"], len(self.recent))
+        await asyncio.sleep(self.latency)
+        asin = request.match_info["asin"]
+        if asin.startswith("MISSING"):
+            return web.Response(status=404)
+        if asin not in self.pages:
+            self.pages[asin] = render(asin, self.page_kb)
+        return web.Response(body=self.pages[asin], content_type="text/html", charset="utf-8")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/dp/{asin}", self.handle)
+        return app
+
+
+def start_in_thread(marketplace: MockMarketplace, port: int = 0) -> Tuple[str, threading.Thread]:
+    """Serve on 127.0.0.1 from a daemon thread; returns (product URL template, thread)"""
+    ready = threading.Event()
+    bound: Dict[str, int] = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(marketplace.app(), access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        bound["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait()
+    return f"http://127.0.0.1:{bound['port']}/dp/{{asin}}", thread
+
+
+if __name__ == "__main__":
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    marketplace = MockMarketplace(float(opts.get("latency-ms", 100)), int(opts.get("page-kb", 20)),
+                                  float(opts.get("rate", 0)), float(opts.get("burst", 10)))
+    web.run_app(marketplace.app(), host="127.0.0.1", port=int(opts.get("port", 8081)), access_log=None)
@@ -0,0 +1,306 @@
+"""
+Generator of the page parser fixture corpus in benchmarks/fixtures/.
+
+Writes Amazon-style product pages (product_*.html.gz) and search result pages
+(search_*.html.gz) of 300-500 KB, laid out like saved amazon.in pages:
+- head scripts and styles, some with markup inside strings
+- a navigation mega-menu
+- image blocks with long JSON attributes
+- the core price block, availability, delivery and seller
+- feature bullets, spec tables, comparison widgets and customer reviews
+  carrying their own star ratings
+- comments and entities
+
+The cases vary what the extractors depend on:
+- legacy priceblock, deal-only and missing prices
+- a price inside a <template>
+- availability wording
+- a secondary-colour span before the delivery line
+- a page without a charset declaration and one declared as windows-1252
+- ad slots without an ASIN, cards without a price, malformed markup
+
+bench_page_parser.py parses every fixture with both parsers. It compares them
+with each other and with fixtures/expected.json, which holds the
+BeautifulSoup results recorded when the corpus was generated. Saved real pages
+dropped into fixtures/ as product_*.html or search_*.html are compared between
+the parsers too.
+
+Usage:
+    python python_services/benchmarks/page_fixtures.py [--out=python_services/benchmarks/fixtures]
+"""
+
+import os
+import sys
+import gzip
+import json
+import random
+from dataclasses import asdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_parser import soup_product_page, soup_search_results
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SEARCH_MAX_RESULTS = 60
+
+WORDS = (
+    "wireless bluetooth headphones noise cancelling stainless steel water bottle cotton kurta "
+    "smart watch fitness tracker gaming mouse mechanical keyboard usb charger fast charging "
+    "cable pressure cooker non stick kadai induction base led bulb air fryer mixer grinder "
+    "backpack laptop sleeve trimmer beard kit protein powder yoga mat running shoes saree "
+    "silk cushion cover bedsheet double king size storage box organiser power bank pack"
+).split()
+SELLERS = ["Appario Retail Private Ltd", "Cocoblu Retail", "Clicktech Retail Private Ltd",
+           "RetailEZ Pvt Ltd", "Darshita Etel", "SuperComNet", "Café Bazaar & Co."]
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def head(rng: random.Random, title: str, charset: str = "utf-8") -> str:
+    meta = f'<meta charset="{charset}">' if charset else ""
+    scripts = "".join(
+        f"<script type=\"text/javascript\">var ue_t{i}=+new Date();P.when('A').execute(function(A){{"
+        f"var tpl='<span class=\"a-price-whole\">{rng.randint(1, 99)}</span><div id=\"availability\">x</div>';"
+        f"A.state('d{i}', {{\"k\":\"{words(rng, 12)}\"}});}});</script>\n"
+        for i in range(40)
+    )
+    styles = "".join(
+        f"<style>.a-box-{i}{{display:block;border-radius:8px;padding:{i % 14}px}} "
+        f".s-{i} > span[data-a-color='secondary']{{color:#565959}}</style>\n"
+        for i in range(25)
+    )
+    return (
+        "<!doctype html><html lang=\"en-in\" class=\"a-no-js\" data-19ax5a9jf=\"dingo\"><head>"
+        f"{meta}<title>{title}</title>\n{styles}{scripts}</head>\n"
+    )
+
+
+def nav(rng: random.Random) -> str:
+    menus = []
+    for m in range(18):
+        links = "".join(
+            f"<li><a href=\"/s?k={rng.choice(WORDS)}&amp;ref=nav_{m}_{i}\" class=\"hmenu-item\">{words(rng, 3).title()}</a></li>"
+            for i in range(24)
+        )
+        menus.append(f"<ul class=\"hmenu hmenu-translateX\" data-menu-id=\"{m}\"><li><div class=\"hmenu-title\">{words(rng, 2).title()}</div></li>{links}</ul>")
+    return (
+        "<header id=\"navbar-main\"><div id=\"nav-belt\"><a href=\"/ref=nav_logo\" class=\"nav-logo-link\" aria-label=\"Amazon.in\">"
+        "<span class=\"nav-sprite nav-logo-base\"></span></a><span id=\"glow-ingress-line2\">Select your address</span></div>"
+        f"<div id=\"hmenu-content\">{''.join(menus)}</div></header>\n"
+    )
+
+
+def image_block(rng: random.Random) -> str:
+    images = ",".join(f"&quot;https://m.media-amazon.com/images/I/{rng.getrandbits(40):x}._SX{s}_.jpg&quot;:[{s},{s}]" for s in range(300, 1500, 50))
+    thumbs = "".join(f"<li class=\"a-spacing-small item\"><span class=\"a-button-thumbnail\"><img alt=\"\" src=\"https://m.media-amazon.com/images/I/{rng.getrandbits(40):x}._SS40_.jpg\"></span></li>" for _ in range(12))
+    return f"<div id=\"imageBlock\"><img id=\"landingImage\" data-a-dynamic-image=\"{{{images}}}\"><ul class=\"a-unordered-list\">{thumbs}</ul></div>\n"
+
+
+def stars(rating: float) -> str:
+    return f"<i class=\"a-icon a-icon-star a-star-{int(rating)}\"><span class=\"a-icon-alt\">{rating} out of 5 stars</span></i>"
+
+
+def reviews(rng: random.Random, n: int) -> str:
+    out = []
+    for i in range(n):
+        out.append(
+            f"<div id=\"R{rng.getrandbits(48):X}\" data-hook=\"review\" class=\"a-section review aok-relative\">"
+            f"<div class=\"a-profile-content\"><span class=\"a-profile-name\">{words(rng, 2).title()}</span></div>"
+            f"<a class=\"a-link-normal\" href=\"/review/{i}\">{stars(rng.choice([1.0, 2.0, 3.0, 4.0, 5.0]))}</a>"
+            f"<span data-hook=\"review-date\" class=\"a-size-base a-color-secondary\">Reviewed in India on {rng.randint(1, 28)} May 2024</span>"
+            f"<div class=\"a-row a-spacing-small review-data\"><span data-hook=\"review-body\"><span>{words(rng, 60)}<br><br>{words(rng, 30)}</span></span></div>"
+            f"<!-- review-footer {i} --><span class=\"cr-vote\"><span data-a-color=\"tertiary\">{rng.randint(2, 90)} people found this helpful</span></span></div>\n"
+        )
+    return f"<div id=\"cm-cr-dp-review-list\">{''.join(out)}</div>\n"
+
+
+def details(rng: random.Random) -> str:
+    bullets = "".join(f"<li><span class=\"a-list-item\"> {words(rng, 25)} </span></li>" for _ in range(7))
+    rows = "".join(f"<tr><th class=\"a-color-secondary a-size-base prodDetSectionEntry\"> {words(rng, 2).title()} </th><td class=\"a-size-base prodDetAttrValue\"> {words(rng, 4)} </td></tr>" for _ in range(30))
+    compare = "".join(
+        f"<td class=\"comparison_table_image_row\"><a href=\"/dp/B0{rng.getrandbits(32):08X}\">{words(rng, 6)}</a>"
+        f"<span class=\"a-price\"><span class=\"a-offscreen\">₹{rng.randint(200, 9000):,}</span></span>{stars(round(rng.uniform(3, 5), 1))}</td>"
+        for _ in range(5)
+    )
+    return (
+        f"<div id=\"feature-bullets\" class=\"a-section a-spacing-medium\"><ul class=\"a-unordered-list a-vertical a-spacing-mini\">{bullets}</ul></div>\n"
+        f"<div id=\"productDetails_feature_div\"><table id=\"productDetails_techSpec_section_1\" class=\"a-keyvalue prodDetTable\">{rows}</table></div>\n"
+        f"<div id=\"HLCXComparisonWidget_feature_div\"><table><tr>{compare}</tr></table></div>\n"
+        f"<div id=\"productDescription\"><p><span>{words(rng, 150)}</span></p><p>{words(rng, 80)}<p>{words(rng, 40)}</div>\n"
+    )
+
+
+def pad(rng: random.Random, parts: List[str], target_kb: int) -> None:
+    """Recommendation carousels up to target_kb; a few repeat, as widgets do on real pages"""
+    carousels = [
+        f"<div class=\"celwidget\"><h2>{words(rng, 4).title()}</h2><ol class=\"a-carousel\">"
+        + "".join(f"<li class=\"a-carousel-card\"><a href=\"/dp/B0{rng.getrandbits(32):08X}\"><span>{words(rng, 8)}</span></a></li>" for _ in range(10))
+        + "</ol></div>"
+        for _ in range(12)
+    ]
+    size = sum(len(p) for p in parts)
+    i = 0
+    while size < target_kb * 1024:
+        block = f"<div class=\"a-section a-spacing-none\" data-csa-c-id=\"w{i}\"><!-- sp:feature:{i} -->{carousels[i % len(carousels)]}</div>\n"
+        parts.append(block)
+        size += len(block)
+        i += 1
+
+
+PRODUCT_CASES = [
+    {"name": "core_price"},
+    {"name": "core_price_large", "price": 124999, "kb": 480},
+    {"name": "legacy_priceblock", "legacy": "priceblock_ourprice"},
+    {"name": "deal_price_only", "legacy": "priceblock_dealprice"},
+    {"name": "unparseable_whole_falls_back", "whole_text": "See price in cart", "legacy": "priceblock_ourprice"},
+    {"name": "price_in_template", "template_price": True},
+    {"name": "no_price_captcha", "no_price": True},
+    {"name": "currently_unavailable", "availability": "Currently unavailable."},
+    {"name": "temporarily_out_of_stock", "availability": "Temporarily out of stock."},
+    {"name": "dispatch_days", "availability": "Usually dispatched in 3 to 4 days."},
+    {"name": "paid_delivery", "delivery": 1250},
+    {"name": "secondary_span_before_delivery", "secondary_first": True, "delivery": 40},
+    {"name": "no_charset", "charset": ""},
+    {"name": "windows_1252", "charset": "windows-1252", "seller": "Café Bazaar & Co."},
+    {"name": "malformed_markup", "malformed": True},
+    {"name": "no_seller_no_rating", "no_seller": True, "no_rating": True},
+]
+
+
+def product_page(rng: random.Random, case: Dict) -> bytes:
+    title = words(rng, 10).title()
+    price = case.get("price", rng.randint(199, 9999))
+    rating = round(rng.uniform(2.5, 4.9), 1)
+    seller = case.get("seller", rng.choice(SELLERS[:-1]))
+    charset = case.get("charset", "utf-8")
+
+    parts = [head(rng, f"Amazon.in: {title}", charset), "<body class=\"a-m-in a-aui_72554-c\">", nav(rng)]
+    if case.get("no_price"):
+        parts.append(
+            "<div class=\"a-container a-padding-double-large\"><h4>Enter the characters you see below</h4>"
+            "<p class=\"a-last\">Sorry, we just need to make sure you're not a robot.</p></div>"
+        )
+    parts += ["<div id=\"dp\" class=\"electronics en_IN\"><div id=\"dp-container\" class=\"a-container\">", image_block(rng)]
+    parts.append(f"<div id=\"centerCol\"><div id=\"titleSection\"><h1 id=\"title\"><span id=\"productTitle\" class=\"a-size-large\">        {title}       </span></h1></div>")
+    if not case.get("no_rating"):
+        parts.append(f"<div id=\"averageCustomerReviews\"><span class=\"a-declarative\"><a href=\"#customerReviews\">{stars(rating)}</a></span>"
+                     f"<span id=\"acrCustomerReviewText\">{rng.randint(10, 90000):,} ratings</span></div>")
+    if case.get("template_price"):
+        parts.append("<template id=\"twister-price-tpl\"><span class=\"a-price\"><span class=\"a-price-whole\">999</span></span></template>")
+        case = dict(case, legacy="priceblock_ourprice")
+    if not case.get("no_price"):
+        if case.get("legacy"):
+            parts.append(f"<table class=\"a-lineitem\"><tr><td class=\"a-color-secondary\">Price:</td><td><span id=\"{case['legacy']}\" class=\"a-size-medium a-color-price\">₹&nbsp;{price:,}.00</span></td></tr></table>")
+        if case.get("whole_text") or not case.get("legacy"):
+            whole = case.get("whole_text", f"{price:,}")
+            parts.append(
+                "<div id=\"corePriceDisplay_desktop_feature_div\"><div class=\"a-section a-spacing-none aok-align-center\">"
+                f"<span class=\"a-price aok-align-center reinventPricePriceToPayMargin priceToPay\"><span class=\"a-offscreen\">₹{price:,}.00</span>"
+                f"<span aria-hidden=\"true\"><span class=\"a-price-symbol\">₹</span><span class=\"a-price-whole\">{whole}<span class=\"a-price-decimal\">.</span></span></span></span>"
+                "</div></div>"
+            )
+    if case.get("secondary_first"):
+        parts.append("<div id=\"mrp\"><span data-a-color=\"secondary\" class=\"a-size-small\">M.R.P.: <span class=\"a-text-strike\">₹2,999</span></span></div>")
+    delivery = case.get("delivery")
+    if delivery:
+        line = f"<span data-csa-c-type=\"element\" data-a-color=\"secondary\" data-csa-c-delivery-price=\"₹{delivery:,}\">₹{delivery:,} delivery <span class=\"a-text-bold\">Tuesday, 5 March</span></span>"
+    else:
+        line = "<span data-csa-c-type=\"element\" data-a-color=\"secondary\" data-csa-c-delivery-price=\"FREE\"> FREE delivery <span class=\"a-text-bold\">Tuesday, 5 March</span> on your first order.</span>"
+    parts.append(f"<div id=\"mir-layout-DELIVERY_BLOCK\">{line}</div>")
+    availability = case.get("availability", "In stock")
+    parts.append(f"<div id=\"availability\" class=\"a-section a-spacing-base\">\n  <span class=\"a-size-medium a-color-success\">\n    {availability}\n  </span>\n  <br>\n</div>")
+    if not case.get("no_seller"):
+        parts.append(f"<div id=\"merchant-info\">Sold by <a id=\"sellerProfileTriggerId\" href=\"/gp/help/seller/at-a-glance.html?seller=A{rng.getrandbits(40):X}\">{seller.replace('&', '&amp;')}</a></div>")
+    if case.get("malformed"):
+        parts.append("<div class=\"a-row\"><p>Unclosed paragraph <b><i>misnested</b></i><span>stray close</span></span></div></div>"
+                     "<table><tr><td>no tbody<td>cell<tr><td>row</table><ul><li>one<li>two</ul><img src=x alt=unquoted>")
+    parts.append("</div>")
+    parts.append(details(rng))
+    parts.append(reviews(rng, 40))
+    pad(rng, parts, case.get("kb", 380))
+    parts.append("</div></div><div id=\"navFooter\"><a href=\"/gp/help\">Help</a></div></body></html>")
+    return "".join(parts).encode(charset or "utf-8", errors="xmlcharrefreplace")
+
+
+SEARCH_CASES = [
+    {"name": "results", "cards": 48},
+    {"name": "sponsored_and_ad_slots", "cards": 60, "ads": True},
+    {"name": "cards_without_price", "cards": 40, "no_price_every": 3},
+    {"name": "malformed_cards", "cards": 30, "malformed": True},
+]
+
+
+def search_card(rng: random.Random, i: int, case: Dict) -> str:
+    asin = f"B0{rng.getrandbits(32):08X}"
+    if case.get("ads") and i % 7 == 3:
+        asin = ""
+    price = "" if case.get("no_price_every") and i % case["no_price_every"] == 0 else (
+        f"<div class=\"a-row a-size-base a-color-base\"><a class=\"a-link-normal s-no-hover\" href=\"/dp/{asin}\">"
+        f"<span class=\"a-price\" data-a-size=\"xl\" data-a-color=\"base\"><span class=\"a-offscreen\">₹{rng.randint(199, 9999):,}</span>"
+        f"<span aria-hidden=\"true\"><span class=\"a-price-symbol\">₹</span><span class=\"a-price-whole\">{rng.randint(199, 9999):,}</span></span></span></a>"
+        f"<span class=\"a-price a-text-price\" data-a-strike=\"true\"><span class=\"a-offscreen\">₹{rng.randint(10000, 20000):,}</span></span></div>"
+    )
+    rating = "" if i % 5 == 4 else f"<div class=\"a-row a-size-small\"><span aria-label=\"4.1 out of 5 stars\">{stars(round(rng.uniform(2, 5), 1))}</span></div>"
+    sponsored = "<span class=\"puis-label-popover-default\"><span class=\"a-color-secondary\">Sponsored</span></span>" if case.get("ads") and i % 4 == 0 else ""
+    title = words(rng, 14).title().replace(" And ", " &amp; ")
+    close = "" if case.get("malformed") and i % 4 == 1 else "</div>"
+    return (
+        f"<div data-asin=\"{asin}\" data-index=\"{i + 2}\" data-uuid=\"{rng.getrandbits(64):x}\" data-component-type=\"s-search-result\" "
+        f"class=\"sg-col-4-of-24 sg-col-4-of-12 s-result-item s-asin sg-col-4-of-16 sg-col s-widget-spacing-small sg-col-4-of-20\">"
+        f"<div class=\"sg-col-inner\"><div cel_widget_id=\"MAIN-SEARCH_RESULTS-{i}\" class=\"s-widget-container s-spacing-small\">"
+        f"<span class=\"rush-component\"><img class=\"s-image\" src=\"https://m.media-amazon.com/images/I/{rng.getrandbits(40):x}._AC_UL320_.jpg\"></span>"
+        f"{sponsored}<div data-cy=\"title-recipe\"><h2 aria-label=\"{title}\" class=\"a-size-mini a-spacing-none a-color-base s-line-clamp-2\">"
+        f"<a class=\"a-link-normal s-line-clamp-2 s-link-style a-text-normal\" href=\"/dp/{asin}\"><span>{title}</span></a></h2></div>"
+        f"{rating}{price}<div class=\"a-row\"><span data-a-color=\"secondary\">FREE delivery <span class=\"a-text-bold\">Sat, 9 Mar</span></span></div>"
+        f"</div></div>{close}\n"
+    )
+
+
+def search_page(rng: random.Random, case: Dict) -> bytes:
+    query = words(rng, 3)
+    parts = [head(rng, f"Amazon.in : {query}"), "<body class=\"a-m-in\">", nav(rng)]
+    parts.append(f"<div id=\"search\"><span data-component-type=\"s-result-info-bar\">1-{case['cards']} of over 3,000 results for \"{query}\"</span>")
+    parts.append("<div class=\"s-main-slot s-result-list s-search-results sg-row\">")
+    for i in range(case["cards"]):
+        parts.append(search_card(rng, i, case))
+        if i % 12 == 11:
+            parts.append(f"<div data-component-type=\"s-impression-logger\" class=\"s-widget\"><h2 class=\"a-size-medium-plus\">{words(rng, 4).title()}</h2>"
+                         + "".join(f"<a href=\"/dp/B0{rng.getrandbits(32):08X}\">{stars(4.0)}<span class=\"a-price-whole\">1</span></a>" for _ in range(6))
+                         + "</div>")
+    parts.append("</div><span class=\"s-pagination-strip\"><a class=\"s-pagination-item\" href=\"?page=2\">2</a></span></div>")
+    pad(rng, parts, case.get("kb", 450))
+    parts.append("</body></html>")
+    return "".join(parts).encode()
+
+
+def write_gzip(path: str, data: bytes) -> None:
+    # mtime=0 and no file name in the header: regenerating gives identical files
+    with open(path, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=9, mtime=0) as f:
+        f.write(data)
+
+
+def write_fixtures(out_dir: str = FIXTURES_DIR) -> Dict[str, object]:
+    os.makedirs(out_dir, exist_ok=True)
+    expected: Dict[str, object] = {"search_max_results": SEARCH_MAX_RESULTS, "pages": {}}
+    for i, case in enumerate(PRODUCT_CASES):
+        name = f"product_{i:02d}_{case['name']}.html.gz"
+        page = product_page(random.Random(1000 + i), case)
+        write_gzip(os.path.join(out_dir, name), page)
+        result = soup_product_page(page, name)
+        expected["pages"][name] = asdict(result) if result else None
+    for i, case in enumerate(SEARCH_CASES):
+        name = f"search_{i:02d}_{case['name']}.html.gz"
+        page = search_page(random.Random(2000 + i), case)
+        write_gzip(os.path.join(out_dir, name), page)
+        expected["pages"][name] = soup_search_results(page, SEARCH_MAX_RESULTS)
+    with open(os.path.join(out_dir, "expected.json"), "w") as f:
+        json.dump(expected, f, indent=1, ensure_ascii=False)
+    return expected
+
+
+if __name__ == "__main__":
+    opts = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    write_fixtures(opts.get("out", FIXTURES_DIR))
@@ -0,0 +1,298 @@
+"""
+Surge engine benchmark suite.
+
+Generates a synthetic seller (daily sales with trend, annual/monthly/weekly
+seasonality, random spikes and late-launched SKUs, plus promotions.csv), then
+runs the CSV pipeline stage by stage:
+
+    load       load_sales_from_csv() with an empty data/.surge_cache (CSV parse)
+    load_cached load_sales_from_csv() again, from the columnar cache
+    promotions fetch_promotions() + PromotionIndex
+    compute    compute_for_sku() for every SKU (or the batch engine)
+    aggregate  aggregate_for_dashboard()
+
+and prints a JSON report with wall time, per-stage seconds and peak RSS, and
+SKUs/second. With --baseline it compares stage times against a stored report
+and exits 1 when any stage is slower than the threshold.
+
+Every run also checks each result's promo_flag and promo_multiplier against
+the original CSV semantics: both CSVs read with pandas' own type inference,
+and promotions matched per SKU by equality. --numeric-skus names SKUs with
+plain numbers, which pandas reads as int64. The run exits 1 on any mismatch.
+
+Usage:
+    python python_services/benchmarks/surge_bench.py --scale=1k [--engine=sku|batch] [--max-skus=N]
+        [--out=report.json] [--save-baseline=FILE] [--baseline=FILE] [--threshold=0.25]
+    python python_services/benchmarks/surge_bench.py --skus=5000 --years=2 --density=0.5
+    python python_services/benchmarks/surge_bench.py --scale=1k --numeric-skus
+
+Datasets are cached under data/.surge_bench/ and reused while their parameters match.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import warnings
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import surge_engine
+
+# Days with sales kept per SKU; the largest scale is sparser so its CSV stays ~11M rows
+SCALES = {
+    "1k": {"skus": 1_000, "years": 1, "density": 1.0},
+    "10k": {"skus": 10_000, "years": 2, "density": 0.5},
+    "100k": {"skus": 100_000, "years": 3, "density": 0.1},
+}
+END_DATE = date(2025, 10, 20)
+# Stages faster than this are too noisy to gate on
+MIN_GATED_SECONDS = 0.05
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def generate_dataset(out_dir: str, skus: int, years: int, density: float, numeric_skus: bool = False, seed: int = 42,
+                     min_density: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Write amazon_sales.csv and promotions.csv for a synthetic catalog into out_dir.
+    With min_density, each SKU keeps its own share of sale days, drawn uniformly
+    from [min_density, density], so the catalog mixes dense and sparse SKUs.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_days = int(round(365 * years))
+    dates = pd.date_range(end=pd.Timestamp(END_DATE), periods=n_days, freq="D")
+    date_str = np.asarray(dates.strftime("%Y-%m-%d"), dtype=object)
+    t = np.arange(n_days, dtype=np.float64)
+    names = np.array([str(100_000 + i) if numeric_skus else f"SKU{i:06d}" for i in range(skus)], dtype=object)
+
+    sales_path = os.path.join(out_dir, "amazon_sales.csv")
+    chunk = max(1, 2_000_000 // n_days)
+    rows = 0
+    with open(sales_path, "w", newline="") as f:
+        for lo in range(0, skus, chunk):
+            k = min(chunk, skus - lo)
+            base = rng.lognormal(1.0, 1.0, (k, 1))
+            trend = 1.0 + rng.uniform(-0.5, 1.0, (k, 1)) * t / n_days
+            seasonal = (
+                rng.uniform(0.0, 0.5, (k, 1)) * np.sin(2 * np.pi * (t + rng.uniform(0, 365, (k, 1))) / 365.25)
+                + rng.uniform(0.0, 0.3, (k, 1)) * np.sin(2 * np.pi * (t + rng.uniform(0, 30, (k, 1))) / 30)
+                + rng.uniform(0.0, 0.2, (k, 1)) * np.sin(2 * np.pi * t / 7)
+            )
+            lam = np.maximum(0.01, base * trend * (1.0 + seasonal))
+            spikes = rng.random((k, n_days)) < 0.005
+            lam[spikes] *= rng.uniform(2.0, 6.0, int(spikes.sum()))
+            units = rng.poisson(lam).astype(np.int32)
+
+            keep = units > 0
+            if min_density is not None:
+                keep &= rng.random((k, n_days)) < rng.uniform(min_density, density, (k, 1))
+            elif density < 1.0:
+                keep &= rng.random((k, n_days)) < density
+            # ~30% of SKUs launched part-way through the window
+            launch = np.where(rng.random(k) < 0.3, rng.integers(0, n_days // 2 + 1, k), 0)
+            keep &= t[None, :] >= launch[:, None]
+
+            r, c = np.nonzero(keep)
+            pd.DataFrame({
+                "sku": names[lo + r],
+                "date": date_str[c],
+                "units_sold": units[r, c],
+            }).to_csv(f, header=(lo == 0), index=False)
+            rows += len(r)
+
+    n_promos = rng.poisson(2 * years, skus)
+    promo_sku = np.repeat(names, n_promos)
+    # Spread over the history plus the next month so some promotions are active or upcoming
+    start = rng.integers(-n_days, 30, len(promo_sku))
+    start_dates = pd.Timestamp(END_DATE) + pd.to_timedelta(start, unit="D")
+    end_dates = start_dates + pd.to_timedelta(rng.integers(3, 21, len(promo_sku)), unit="D")
+    pd.DataFrame({
+        "sku": promo_sku,
+        "start_date": start_dates.strftime("%Y-%m-%d"),
+        "end_date": end_dates.strftime("%Y-%m-%d"),
+        "discount_pct": rng.integers(5, 51, len(promo_sku)).astype(float),
+    }).to_csv(os.path.join(out_dir, "promotions.csv"), index=False)
+
+    meta = {"skus": skus, "years": years, "density": density, "min_density": min_density, "numeric_skus": numeric_skus,
+            "seed": seed, "rows": rows, "promotions": int(len(promo_sku))}
+    with open(os.path.join(out_dir, "dataset.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ensure_dataset(data_dir: str, skus: int, years: int, density: float, numeric_skus: bool = False, regenerate: bool = False,
+                   min_density: Optional[float] = None) -> Dict[str, Any]:
+    meta_path = os.path.join(data_dir, "dataset.json")
+    if not regenerate and os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        params = (meta.get("skus"), meta.get("years"), meta.get("density"), meta.get("min_density"), meta.get("numeric_skus", False))
+        if params == (skus, years, density, min_density, numeric_skus):
+            return meta
+    return generate_dataset(data_dir, skus, years, density, numeric_skus, min_density=min_density)
+
+
+def run_pipeline(data_dir: str, engine: str, max_skus: Optional[int], lead_time: int = 14) -> Dict[str, Any]:
+    # The CSV path is what is being measured, so never pick up a database
+    os.environ.pop("DATABASE_URL", None)
+    os.environ["SURGE_DATA_DIR"] = data_dir
+
+    stages: Dict[str, Dict[str, float]] = {}
+
+    def timed(name: str, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        stages[name] = {"seconds": round(time.perf_counter() - t0, 4), "peak_rss_mb": round(peak_rss_mb(), 1)}
+        return out
+
+    shutil.rmtree(surge_engine.sales_cache_dir(), ignore_errors=True)
+    wall0 = time.perf_counter()
+    timed("load", lambda: surge_engine.load_sales_from_csv(None))
+    sales_df = timed("load_cached", lambda: surge_engine.load_sales_from_csv(None))
+    today = surge_engine.date_today(sales_df["date"])
+    promos = timed("promotions", lambda: surge_engine.PromotionIndex(surge_engine.fetch_promotions(None), today))
+
+    if max_skus:
+        keep = np.sort(sales_df["sku"].unique())[:max_skus]
+        sales_df = sales_df[sales_df["sku"].isin(keep)]
+    n_skus = int(sales_df["sku"].nunique())
+
+    results = timed("compute", lambda: surge_engine.compute_serial(sales_df, promos, today, lead_time, None, engine))
+    timed("aggregate", lambda: surge_engine.aggregate_for_dashboard(results, today))
+    wall = time.perf_counter() - wall0
+    mismatches = promo_mismatches(data_dir, results, today)
+
+    compute_s = stages["compute"]["seconds"]
+    return {
+        "engine": engine,
+        "rows": int(len(sales_df)),
+        "skus": n_skus,
+        "results": len(results),
+        "stages": stages,
+        "wall_s": round(wall, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "skus_per_s": round(n_skus / compute_s, 1) if compute_s > 0 else None,
+        "promo_flags": sum(bool(r["signals"]["promo_flag"]) for r in results),
+        "promo_mismatches": len(mismatches),
+        "first_promo_mismatch": mismatches[0] if mismatches else None,
+    }
+
+
+def promo_mismatches(data_dir: str, results: List[Dict[str, Any]], today: date, lead_days: int = 14) -> List[str]:
+    """
+    Results whose promo fields differ from the original CSV semantics: sales
+    and promotions.csv read with plain pd.read_csv, so SKU dtypes are whatever
+    pandas infers, and each SKU matched against promotions by equality. A
+    promotion applies when it has not ended and starts within lead_days, and
+    the lift is 1 + 0.02 * the max active discount.
+    """
+    sales_skus = pd.read_csv(os.path.join(data_dir, "amazon_sales.csv"), usecols=["sku"])["sku"].unique()
+    promos = pd.read_csv(os.path.join(data_dir, "promotions.csv"))
+    t = pd.Timestamp(today)
+    start = pd.to_datetime(promos["start_date"])
+    end = pd.to_datetime(promos["end_date"])
+    active = promos[(end >= t) & ((start - t).dt.days <= lead_days)]
+    best = active.groupby("sku")["discount_pct"].max().clip(lower=0.0)
+    expected = {}
+    for sku in sales_skus:
+        # Keyed by the text form only to find the result; the match itself is on the inferred dtype
+        if sku in best.index:
+            expected[str(sku)] = (True, round(1.0 + float(best[sku]) * 0.02, 3))
+        else:
+            expected[str(sku)] = (False, 1.0)
+    out = []
+    for r in results:
+        got = (bool(r["signals"]["promo_flag"]), round(r["components"]["promo_multiplier"], 3))
+        want = expected.get(str(r["sku"]))
+        if want is not None and got != want:
+            out.append(f"{r['sku']}: promo_flag/promo_multiplier {got} != {want}")
+    return out
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Stage regressions where the time grew by more than `threshold` (0.25 == 25%)."""
+    regressions = []
+    for name, base in baseline.get("stages", {}).items():
+        cur = report["stages"].get(name)
+        if cur is None or base["seconds"] < MIN_GATED_SECONDS:
+            continue
+        ratio = cur["seconds"] / base["seconds"]
+        report["stages"][name]["vs_baseline"] = round(ratio, 3)
+        if ratio > 1.0 + threshold:
+            regressions.append(f"{name}: {cur['seconds']:.3f}s vs baseline {base['seconds']:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) if "=" in a else (a[2:], "1") for a in sys.argv[1:] if a.startswith("--"))
+    cfg = dict(SCALES[opts.get("scale", "1k")])
+    for key, cast in (("skus", int), ("years", int), ("density", float)):
+        if key in opts:
+            cfg[key] = cast(opts[key])
+    engine = opts.get("engine", "sku")
+    max_skus = int(opts["max-skus"]) if "max-skus" in opts else None
+    threshold = float(opts.get("threshold", 0.25))
+
+    data_dir = opts.get("data-dir") or os.path.join(
+        surge_engine.project_data_dir(), ".surge_bench",
+        f"{cfg['skus']}x{cfg['years']}y_d{cfg['density']}" + ("_num" if "numeric-skus" in opts else "")
+    )
+
+    warnings.simplefilter("ignore", FutureWarning)
+    logging.getLogger("surge_engine").setLevel(logging.WARNING)
+
+    t0 = time.perf_counter()
+    dataset = ensure_dataset(data_dir, cfg["skus"], cfg["years"], cfg["density"], "numeric-skus" in opts, "regenerate" in opts)
+    gen_s = time.perf_counter() - t0
+
+    report = {
+        "config": {**cfg, "engine": engine, "max_skus": max_skus, "data_dir": data_dir},
+        "dataset": dataset,
+        "generate_s": round(gen_s, 2),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+    }
+    report.update(run_pipeline(data_dir, engine, max_skus))
+
+    regressions: List[str] = []
+    if "baseline" in opts:
+        with open(opts["baseline"]) as f:
+            regressions = compare(report, json.load(f), threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (opts.get("out"), opts.get("save-baseline")):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+    if report["promo_mismatches"]:
+        print(f"Promotion check failed for {report['promo_mismatches']} SKUs, first: {report['first_promo_mismatch']}", file=sys.stderr)
+    if regressions:
+        print("Surge benchmark regressions (threshold %.0f%%):" % (threshold * 100), file=sys.stderr)
+        for line in regressions:
+            print("  " + line, file=sys.stderr)
+    if regressions or report["promo_mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
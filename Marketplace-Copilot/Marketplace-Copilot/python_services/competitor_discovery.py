@@ -7,15 +7,16 @@ import re
 import logging
 from typing import List, Dict, Optional
 from dataclasses import dataclass
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
-from bs4 import BeautifulSoup
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import time
 import random
 
+from db_pool import get_pool
+from page_parser import parse_search_results
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -56,14 +57,15 @@ class CompetitorDiscovery:
     
     def __init__(self, db_config: Dict[str, str]):
         self.db_config = db_config
+        self.pool = get_pool(db_config)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection for one transaction"""
+        return self.pool.connection()
     
     def fetch_product(self, sku: str) -> Optional[Product]:
         """Fetch product data from database"""
@@ -122,56 +124,7 @@ class CompetitorDiscovery:
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find product cards
-            products = soup.find_all('div', {'data-component-type': 's-search-result'})
-            
-            for product in products[:max_results]:
-                try:
-                    # Extract ASIN
-                    asin = product.get('data-asin')
-                    if not asin:
-                        continue
-                    
-                    # Extract title
-                    title_elem = product.find('h2', class_='s-line-clamp-2')
-                    title = title_elem.get_text(strip=True) if title_elem else None
-                    
-                    # Extract price
-                    price_elem = product.find('span', class_='a-price-whole')
-                    price = None
-                    if price_elem:
-                        price_text = price_elem.get_text(strip=True).replace(',', '').replace('₹', '')
-                        try:
-                            price = float(price_text)
-                        except ValueError:
-                            pass
-                    
-                    # Extract rating
-                    rating_elem = product.find('span', class_='a-icon-alt')
-                    rating = None
-                    if rating_elem:
-                        rating_text = rating_elem.get_text(strip=True)
-                        match = re.search(r'(\d+\.?\d*)', rating_text)
-                        if match:
-                            rating = float(match.group(1))
-                    
-                    # Build product link
-                    link = f"https://www.amazon.in/dp/{asin}"
-                    
-                    if title and price:
-                        results.append({
-                            'asin': asin,
-                            'title': title,
-                            'price': price,
-                            'rating': rating,
-                            'link': link
-                        })
-                
-                except Exception as e:
-                    logger.warning(f"Error parsing product: {e}")
-                    continue
+            results = parse_search_results(response.content, max_results)
             
             logger.info(f"Scraped {len(results)} products from Amazon")
             
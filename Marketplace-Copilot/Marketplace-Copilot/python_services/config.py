@@ -13,13 +13,40 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', '5432'))
 }
 
+# Shared connection pool (db_pool.py), one per db_config and process
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', '1')),  # Idle connections kept open
+    'max_size': int(os.getenv('DB_POOL_MAX', '10')),  # Connections open at most
+    'wait_timeout': 30,  # Seconds to wait for a free connection before PoolTimeout
+    'health_check_after': 30,  # Check connections idle for longer with SELECT 1
+    'max_idle': 300  # Seconds before an idle connection above min_size is closed
+}
+
 # Scraping configuration
 SCRAPING_CONFIG = {
     'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     'rate_limit_min': 1,  # Minimum seconds between requests
     'rate_limit_max': 3,  # Maximum seconds between requests
     'timeout': 10,  # Request timeout in seconds
-    'max_retries': 3
+    'max_retries': 3,
+    # Async tracker (async_tracker.py): pages in flight and a token bucket per marketplace host
+    'concurrency': int(os.getenv('SCRAPE_CONCURRENCY', '32')),
+    'host_rate': float(os.getenv('SCRAPE_HOST_RATE', '6')),  # Requests per second per host
+    'host_burst': int(os.getenv('SCRAPE_HOST_BURST', '10')),  # Requests a host may get back to back
+    'host_limits': {
+        # Per-host overrides, e.g. 'www.amazon.in': {'rate': 6, 'burst': 10}
+    },
+    # Pages are parsed in a process pool; 0 parses on the event loop instead
+    'parse_workers': int(os.getenv('SCRAPE_PARSE_WORKERS', str(os.cpu_count() or 1))),
+    'queue_size': int(os.getenv('SCRAPE_QUEUE_SIZE', '64'))  # Pages waiting per stage before fetching pauses
+}
+
+# Price history writer (price_writer.py)
+WRITER_CONFIG = {
+    'batch_size': 500,  # Rows per INSERT; a full buffer is flushed right away
+    'flush_interval': 5,  # Seconds between background flushes
+    'max_retries': 3,  # Retries of a failed flush before its rows wait for the next one
+    'max_buffered': 50000  # Rows kept while the database is unreachable; newer ones are dropped
 }
 
 # Competitor discovery configuration
@@ -0,0 +1,210 @@
+"""
+Database Connection Pool
+One thread-safe psycopg2 connection pool per db_config, shared by every
+component in the process (discovery, tracking, price history writes,
+intelligence, the scheduler) instead of a TCP connect and auth handshake per
+method call.
+
+    with get_pool(db_config).connection() as conn:
+        ...
+
+connection() behaves like `with psycopg2.connect(...) as conn`: the transaction
+is committed on success and rolled back on error. Then the connection goes back
+to the pool instead of being left to close. Connections are opened lazily, up to
+max_size. When all are in use a caller waits up to wait_timeout seconds, and the
+wait is counted. A connection that was idle longer than health_check_after is
+checked with SELECT 1 before it is handed out. Broken connections are dropped
+and replaced. Idle connections above min_size are closed after max_idle
+seconds.
+
+Borrowing blocks, so asyncio code borrows from a thread (asyncio.to_thread).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from config import POOL_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    """No connection became free within wait_timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of psycopg2 connections with health checks and usage stats"""
+
+    def __init__(self, db_config: Dict[str, Any], min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 wait_timeout: Optional[float] = None, health_check_after: Optional[float] = None,
+                 max_idle: Optional[float] = None):
+        self.db_config = db_config
+        self.min_size = POOL_CONFIG['min_size'] if min_size is None else min_size
+        self.max_size = max(1, max_size or POOL_CONFIG['max_size'])
+        self.wait_timeout = POOL_CONFIG['wait_timeout'] if wait_timeout is None else wait_timeout
+        self.health_check_after = POOL_CONFIG['health_check_after'] if health_check_after is None else health_check_after
+        self.max_idle = POOL_CONFIG['max_idle'] if max_idle is None else max_idle
+        # (connection, time it was returned), most recently returned last
+        self.idle: deque = deque()
+        self.size = 0
+        self.cond = threading.Condition()
+        self.counters = {
+            'borrowed': 0, 'created': 0, 'discarded': 0, 'waits': 0,
+            'wait_seconds': 0.0, 'timeouts': 0, 'health_check_failures': 0,
+        }
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Borrow a connection, waiting up to `timeout` (default wait_timeout) when all are in use"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        with self.cond:
+            if not self.idle and self.size >= self.max_size:
+                self.counters['waits'] += 1
+                start = time.monotonic()
+                free = self.cond.wait_for(lambda: self.idle or self.size < self.max_size, timeout)
+                self.counters['wait_seconds'] += time.monotonic() - start
+                if not free:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f"no database connection free after {timeout}s ({self.max_size} in use)")
+            self.counters['borrowed'] += 1
+            if self.idle:
+                conn, returned_at = self.idle.pop()
+            else:
+                conn, returned_at = None, None
+            # Reserve the slot now; connecting and health checks happen outside the lock
+            if conn is None:
+                self.size += 1
+
+        if conn is not None and (conn.closed or time.monotonic() - returned_at > self.health_check_after):
+            if self._healthy(conn):
+                return conn
+            with self.cond:
+                self.counters['health_check_failures'] += 1
+            self._close(conn)
+            # The slot stays ours for the replacement
+        elif conn is not None:
+            return conn
+        try:
+            conn = psycopg2.connect(**self.db_config)
+        except Exception:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+        with self.cond:
+            self.counters['created'] += 1
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a borrowed connection; broken or discarded ones are closed and free their slot"""
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        now = time.monotonic()
+        expired = []
+        with self.cond:
+            if discard or conn.closed:
+                self.size -= 1
+                self.counters['discarded'] += 1
+                expired.append(conn)
+            else:
+                self.idle.append((conn, now))
+            # Trim connections idle for max_idle, oldest first, down to min_size
+            while self.idle and self.size > self.min_size and now - self.idle[0][1] > self.max_idle:
+                expired.append(self.idle.popleft()[0])
+                self.size -= 1
+            self.cond.notify()
+        for old in expired:
+            self._close(old)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Borrow a connection for one transaction: commit on success, roll back on error"""
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, connections in use and idle, and borrow/wait counters"""
+        with self.cond:
+            return {
+                'size': self.size,
+                'in_use': self.size - len(self.idle),
+                'idle': len(self.idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **self.counters,
+                'wait_seconds': round(self.counters['wait_seconds'], 3),
+            }
+
+    def closeall(self):
+        """Close the idle connections (borrowed ones still return to the pool)"""
+        with self.cond:
+            idle = [conn for conn, _ in self.idle]
+            self.idle.clear()
+            self.size -= len(idle)
+            self.cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Dropping unhealthy pooled connection: {e}")
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config: Dict[str, Any]) -> ConnectionPool:
+    """The process-wide pool for a db_config, created on first use"""
+    key = tuple(sorted(db_config.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(db_config)
+        return _pools[key]
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """stats() of every pool, keyed by database host/name"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {f"{p.db_config.get('host')}/{p.db_config.get('database')}": p.stats() for p in pools}
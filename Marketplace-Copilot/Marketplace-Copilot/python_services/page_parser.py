@@ -0,0 +1,329 @@
+"""
+Page Parser
+Field extraction for Amazon product pages (price tracking) and search result
+pages (competitor discovery).
+
+parse_product_page() and parse_search_results() parse with lxml (libxml2, in
+C) and look up only the nodes they need with XPath expressions compiled once at
+import. A 300-500 KB page no longer gets a pure-Python html.parser tree and
+repeated soup.find() scans. The BeautifulSoup extraction they replace is kept as
+soup_product_page() and soup_search_results(). Those are the reference the fast
+path must match field for field on the fixture corpus
+(benchmarks/bench_page_parser.py).
+
+To give the same results the lxml side mirrors BeautifulSoup's semantics:
+- a class matches any one of the element's whitespace-separated classes
+- find() takes the first match in document order
+- get_text() leaves out strings inside script, style, template, rt and rp
+  elements and comments
+- bytes are decoded the way UnicodeDammit would for pages that have a byte
+  order mark, declare their charset or are UTF-8; anything else falls back to
+  UnicodeDammit itself
+"""
+
+import re
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector, UnicodeDammit
+
+logger = logging.getLogger(__name__)
+
+RATING_RE = re.compile(r'(\d+\.?\d*)')
+SHIPPING_RE = re.compile(r'₹\s*(\d+(?:,\d+)*(?:\.\d+)?)')
+
+
+@dataclass
+class PriceData:
+    price: float
+    availability: str
+    seller_rating: Optional[float]
+    seller_name: Optional[str]
+    shipping_cost: float
+
+
+def soup_product_page(content: bytes, asin: str) -> Optional[PriceData]:
+    """Extract price, availability, rating, seller and shipping from a product page"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Extract price
+    price = None
+    price_selectors = [
+        ('span', {'class': 'a-price-whole'}),
+        ('span', {'id': 'priceblock_ourprice'}),
+        ('span', {'id': 'priceblock_dealprice'}),
+    ]
+
+    for tag, attrs in price_selectors:
+        price_elem = soup.find(tag, attrs)
+        if price_elem:
+            price_text = price_elem.get_text(strip=True).replace(',', '').replace('₹', '')
+            try:
+                price = float(price_text)
+                break
+            except ValueError:
+                continue
+
+    if not price:
+        logger.warning(f"Could not extract price for ASIN {asin}")
+        return None
+
+    # Extract availability
+    availability = 'in_stock'
+    availability_elem = soup.find('div', {'id': 'availability'})
+    if availability_elem:
+        avail_text = availability_elem.get_text(strip=True).lower()
+        if 'out of stock' in avail_text or 'unavailable' in avail_text:
+            availability = 'out_of_stock'
+        elif 'temporarily' in avail_text:
+            availability = 'temporarily_unavailable'
+
+    # Extract seller rating
+    seller_rating = None
+    rating_elem = soup.find('span', {'class': 'a-icon-alt'})
+    if rating_elem:
+        rating_text = rating_elem.get_text(strip=True)
+        match = re.search(r'(\d+\.?\d*)', rating_text)
+        if match:
+            seller_rating = float(match.group(1))
+
+    # Extract seller name
+    seller_name = None
+    seller_elem = soup.find('a', {'id': 'sellerProfileTriggerId'})
+    if seller_elem:
+        seller_name = seller_elem.get_text(strip=True)
+
+    # Extract shipping cost (simplified)
+    shipping_cost = 0.0
+    shipping_elem = soup.find('span', {'data-a-color': 'secondary'})
+    if shipping_elem and 'delivery' in shipping_elem.get_text().lower():
+        # Try to extract shipping cost if mentioned
+        shipping_text = shipping_elem.get_text()
+        match = re.search(r'₹\s*(\d+(?:,\d+)*(?:\.\d+)?)', shipping_text)
+        if match:
+            try:
+                shipping_cost = float(match.group(1).replace(',', ''))
+            except ValueError:
+                pass
+
+    return PriceData(
+        price=price,
+        availability=availability,
+        seller_rating=seller_rating,
+        seller_name=seller_name,
+        shipping_cost=shipping_cost
+    )
+
+
+def soup_search_results(content: bytes, max_results: int = 20) -> List[Dict]:
+    """Extract ASIN, title, price, rating and link of each search result card"""
+    results = []
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Find product cards
+    products = soup.find_all('div', {'data-component-type': 's-search-result'})
+
+    for product in products[:max_results]:
+        try:
+            # Extract ASIN
+            asin = product.get('data-asin')
+            if not asin:
+                continue
+
+            # Extract title
+            title_elem = product.find('h2', class_='s-line-clamp-2')
+            title = title_elem.get_text(strip=True) if title_elem else None
+
+            # Extract price
+            price_elem = product.find('span', class_='a-price-whole')
+            price = None
+            if price_elem:
+                price_text = price_elem.get_text(strip=True).replace(',', '').replace('₹', '')
+                try:
+                    price = float(price_text)
+                except ValueError:
+                    pass
+
+            # Extract rating
+            rating_elem = product.find('span', class_='a-icon-alt')
+            rating = None
+            if rating_elem:
+                rating_text = rating_elem.get_text(strip=True)
+                match = re.search(r'(\d+\.?\d*)', rating_text)
+                if match:
+                    rating = float(match.group(1))
+
+            # Build product link
+            link = f"https://www.amazon.in/dp/{asin}"
+
+            if title and price:
+                results.append({
+                    'asin': asin,
+                    'title': title,
+                    'price': price,
+                    'rating': rating,
+                    'link': link
+                })
+
+        except Exception as e:
+            logger.warning(f"Error parsing product: {e}")
+            continue
+
+    return results
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# First match in document order, as soup.find()
+PRICE_XPATHS = [
+    etree.XPath(f"(//span[{_has_class('a-price-whole')}])[1]"),
+    etree.XPath("(//span[@id='priceblock_ourprice'])[1]"),
+    etree.XPath("(//span[@id='priceblock_dealprice'])[1]"),
+]
+AVAILABILITY_XPATH = etree.XPath("(//div[@id='availability'])[1]")
+RATING_XPATH = etree.XPath(f"(//span[{_has_class('a-icon-alt')}])[1]")
+SELLER_XPATH = etree.XPath("(//a[@id='sellerProfileTriggerId'])[1]")
+SHIPPING_XPATH = etree.XPath("(//span[@data-a-color='secondary'])[1]")
+RESULTS_XPATH = etree.XPath("//div[@data-component-type='s-search-result']")
+RESULT_TITLE_XPATH = etree.XPath(f"(.//h2[{_has_class('s-line-clamp-2')}])[1]")
+RESULT_PRICE_XPATH = etree.XPath(f"(.//span[{_has_class('a-price-whole')}])[1]")
+RESULT_RATING_XPATH = etree.XPath(f"(.//span[{_has_class('a-icon-alt')}])[1]")
+# get_text(): strings inside these are not text to BeautifulSoup
+TEXT_XPATH = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template or ancestor::rt or ancestor::rp)]")
+
+_parsers: Dict[str, lxml.html.HTMLParser] = {}
+
+
+def _document(content: bytes):
+    """lxml tree of a page, decoded as BeautifulSoup would"""
+    data, encoding = EncodingDetector.strip_byte_order_mark(content)
+    candidates = [encoding, EncodingDetector.find_declared_encoding(data, is_html=True), 'utf-8']
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            data.decode(candidate)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        if candidate not in _parsers:
+            _parsers[candidate] = lxml.html.HTMLParser(encoding=candidate)
+        try:
+            return lxml.html.document_fromstring(data, parser=_parsers[candidate])
+        except LookupError:
+            # An encoding Python knows and libxml2 does not: hand lxml text instead
+            return lxml.html.document_fromstring(data.decode(candidate))
+    return lxml.html.document_fromstring(UnicodeDammit(content, is_html=True).unicode_markup)
+
+
+def _text(elem, strip: bool = False) -> str:
+    """BeautifulSoup get_text() of an element"""
+    if strip:
+        return ''.join(s.strip() for s in TEXT_XPATH(elem) if s.strip())
+    return ''.join(TEXT_XPATH(elem))
+
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def parse_product_page(content: bytes, asin: str) -> Optional[PriceData]:
+    """soup_product_page() on lxml with precompiled XPath"""
+    doc = _document(content)
+
+    price = None
+    for xpath in PRICE_XPATHS:
+        price_elem = _first(xpath, doc)
+        if price_elem is not None:
+            try:
+                price = float(_text(price_elem, strip=True).replace(',', '').replace('₹', ''))
+                break
+            except ValueError:
+                continue
+
+    if not price:
+        logger.warning(f"Could not extract price for ASIN {asin}")
+        return None
+
+    availability = 'in_stock'
+    availability_elem = _first(AVAILABILITY_XPATH, doc)
+    if availability_elem is not None:
+        avail_text = _text(availability_elem, strip=True).lower()
+        if 'out of stock' in avail_text or 'unavailable' in avail_text:
+            availability = 'out_of_stock'
+        elif 'temporarily' in avail_text:
+            availability = 'temporarily_unavailable'
+
+    seller_rating = None
+    rating_elem = _first(RATING_XPATH, doc)
+    if rating_elem is not None:
+        match = RATING_RE.search(_text(rating_elem, strip=True))
+        if match:
+            seller_rating = float(match.group(1))
+
+    seller_elem = _first(SELLER_XPATH, doc)
+    seller_name = _text(seller_elem, strip=True) if seller_elem is not None else None
+
+    shipping_cost = 0.0
+    shipping_elem = _first(SHIPPING_XPATH, doc)
+    if shipping_elem is not None:
+        shipping_text = _text(shipping_elem)
+        if 'delivery' in shipping_text.lower():
+            match = SHIPPING_RE.search(shipping_text)
+            if match:
+                try:
+                    shipping_cost = float(match.group(1).replace(',', ''))
+                except ValueError:
+                    pass
+
+    return PriceData(
+        price=price,
+        availability=availability,
+        seller_rating=seller_rating,
+        seller_name=seller_name,
+        shipping_cost=shipping_cost
+    )
+
+
+def parse_search_results(content: bytes, max_results: int = 20) -> List[Dict]:
+    """soup_search_results() on lxml with precompiled XPath"""
+    results = []
+    for product in RESULTS_XPATH(_document(content))[:max_results]:
+        asin = product.get('data-asin')
+        if not asin:
+            continue
+
+        title_elem = _first(RESULT_TITLE_XPATH, product)
+        title = _text(title_elem, strip=True) if title_elem is not None else None
+
+        price = None
+        price_elem = _first(RESULT_PRICE_XPATH, product)
+        if price_elem is not None:
+            try:
+                price = float(_text(price_elem, strip=True).replace(',', '').replace('₹', ''))
+            except ValueError:
+                pass
+
+        rating = None
+        rating_elem = _first(RESULT_RATING_XPATH, product)
+        if rating_elem is not None:
+            match = RATING_RE.search(_text(rating_elem, strip=True))
+            if match:
+                rating = float(match.group(1))
+
+        if title and price:
+            results.append({
+                'asin': asin,
+                'title': title,
+                'price': price,
+                'rating': rating,
+                'link': f"https://www.amazon.in/dp/{asin}"
+            })
+
+    return results
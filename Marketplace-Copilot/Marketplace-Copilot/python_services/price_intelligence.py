@@ -6,10 +6,11 @@ Calculates price intelligence metrics and provides insights.
 import logging
 from typing import Dict, List, Optional
 from dataclasses import dataclass, asdict
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import json
 
+from db_pool import get_pool
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -32,10 +33,11 @@ class PriceIntelligenceEngine:
     
     def __init__(self, db_config: Dict[str, str]):
         self.db_config = db_config
+        self.pool = get_pool(db_config)
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection for one transaction"""
+        return self.pool.connection()
     
     def get_price_intelligence(self, sku: str) -> Optional[PriceIntelligence]:
         """Get comprehensive price intelligence for a SKU"""
@@ -132,27 +134,22 @@ class PriceIntelligenceEngine:
         results = []
         
         try:
-            with self.get_db_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    if skus:
-                        # Get specific SKUs
-                        for sku in skus:
-                            intelligence = self.get_price_intelligence(sku)
-                            if intelligence:
-                                results.append(intelligence)
-                    else:
-                        # Get all products with competitors
+            if not skus:
+                # Get all products with competitors
+                with self.get_db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
                         cur.execute("""
                             SELECT DISTINCT sku
                             FROM competitor_mapping
                             WHERE is_active = TRUE
                         """)
-                        rows = cur.fetchall()
-                        
-                        for row in rows:
-                            intelligence = self.get_price_intelligence(row['sku'])
-                            if intelligence:
-                                results.append(intelligence)
+                        skus = [row['sku'] for row in cur.fetchall()]
+            
+            # The listing connection is back in the pool: each SKU reuses it
+            for sku in skus:
+                intelligence = self.get_price_intelligence(sku)
+                if intelligence:
+                    results.append(intelligence)
         
         except Exception as e:
             logger.error(f"Error getting bulk intelligence: {e}")
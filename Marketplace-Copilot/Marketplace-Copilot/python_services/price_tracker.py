@@ -3,16 +3,20 @@ Price Tracker Module
 Tracks competitor prices periodically and stores historical data.
 """
 
+import asyncio
 import logging
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from dataclasses import dataclass
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
-from bs4 import BeautifulSoup
 import time
-import random
-import re
+from urllib.parse import urlsplit
+
+from config import SCRAPING_CONFIG
+from db_pool import get_pool
+from page_parser import PriceData, parse_product_page
+from price_writer import PriceHistoryWriter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,28 +28,72 @@ class CompetitorMapping:
     competitor_asin: str
     competitor_title: str
 
-@dataclass
-class PriceData:
-    price: float
-    availability: str
-    seller_rating: Optional[float]
-    seller_name: Optional[str]
-    shipping_cost: float
+class TokenBucket:
+    """Allows `rate` requests per second on average and up to `burst` back to back"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Tokens may go negative: later callers queue behind the ones already waiting
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def wait(self) -> float:
+        """Block until a token is available; returns the seconds waited"""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds waited"""
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
 
 class PriceTracker:
     """Tracks competitor prices and stores historical data"""
     
     def __init__(self, db_config: Dict[str, str]):
         self.db_config = db_config
+        self.pool = get_pool(db_config)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept-Language': 'en-US,en;q=0.9',
         })
+        self.product_url = 'https://www.amazon.in/dp/{asin}'
+        # Requests to each host are paced by its token bucket (SCRAPING_CONFIG host_rate / host_limits)
+        self.host_limits = dict(SCRAPING_CONFIG['host_limits'])
+        self.buckets: Dict[str, TokenBucket] = {}
+        # Set to a long-lived PriceHistoryWriter to share it across runs (see buffered_writes)
+        self.writer: Optional[PriceHistoryWriter] = None
+    
+    def bucket_for(self, url: str) -> TokenBucket:
+        """Token bucket of the URL's host, created from host_limits or the defaults"""
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            limits = self.host_limits.get(host, {})
+            self.buckets[host] = TokenBucket(
+                limits.get('rate', SCRAPING_CONFIG['host_rate']),
+                limits.get('burst', SCRAPING_CONFIG['host_burst'])
+            )
+        return self.buckets[host]
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection for one transaction"""
+        return self.pool.connection()
     
     def fetch_active_competitors(self, sku: Optional[str] = None) -> List[CompetitorMapping]:
         """Fetch active competitor mappings from database"""
@@ -75,82 +123,13 @@ class PriceTracker:
     def scrape_amazon_product(self, asin: str) -> Optional[PriceData]:
         """Scrape product page for current price and availability"""
         try:
-            # Rate limiting
-            time.sleep(random.uniform(2, 4))
-            
-            url = f"https://www.amazon.in/dp/{asin}"
+            # Rate limiting: the host's token bucket, shared with AsyncPriceTracker's config
+            url = self.product_url.format(asin=asin)
+            self.bucket_for(url).wait()
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract price
-            price = None
-            price_selectors = [
-                ('span', {'class': 'a-price-whole'}),
-                ('span', {'id': 'priceblock_ourprice'}),
-                ('span', {'id': 'priceblock_dealprice'}),
-            ]
-            
-            for tag, attrs in price_selectors:
-                price_elem = soup.find(tag, attrs)
-                if price_elem:
-                    price_text = price_elem.get_text(strip=True).replace(',', '').replace('₹', '')
-                    try:
-                        price = float(price_text)
-                        break
-                    except ValueError:
-                        continue
-            
-            if not price:
-                logger.warning(f"Could not extract price for ASIN {asin}")
-                return None
-            
-            # Extract availability
-            availability = 'in_stock'
-            availability_elem = soup.find('div', {'id': 'availability'})
-            if availability_elem:
-                avail_text = availability_elem.get_text(strip=True).lower()
-                if 'out of stock' in avail_text or 'unavailable' in avail_text:
-                    availability = 'out_of_stock'
-                elif 'temporarily' in avail_text:
-                    availability = 'temporarily_unavailable'
-            
-            # Extract seller rating
-            seller_rating = None
-            rating_elem = soup.find('span', {'class': 'a-icon-alt'})
-            if rating_elem:
-                rating_text = rating_elem.get_text(strip=True)
-                match = re.search(r'(\d+\.?\d*)', rating_text)
-                if match:
-                    seller_rating = float(match.group(1))
-            
-            # Extract seller name
-            seller_name = None
-            seller_elem = soup.find('a', {'id': 'sellerProfileTriggerId'})
-            if seller_elem:
-                seller_name = seller_elem.get_text(strip=True)
-            
-            # Extract shipping cost (simplified)
-            shipping_cost = 0.0
-            shipping_elem = soup.find('span', {'data-a-color': 'secondary'})
-            if shipping_elem and 'delivery' in shipping_elem.get_text().lower():
-                # Try to extract shipping cost if mentioned
-                shipping_text = shipping_elem.get_text()
-                match = re.search(r'₹\s*(\d+(?:,\d+)*(?:\.\d+)?)', shipping_text)
-                if match:
-                    try:
-                        shipping_cost = float(match.group(1).replace(',', ''))
-                    except ValueError:
-                        pass
-            
-            return PriceData(
-                price=price,
-                availability=availability,
-                seller_rating=seller_rating,
-                seller_name=seller_name,
-                shipping_cost=shipping_cost
-            )
+            return parse_product_page(response.content, asin)
         
         except requests.RequestException as e:
             logger.error(f"Request error for ASIN {asin}: {e}")
@@ -184,6 +163,46 @@ class PriceTracker:
             logger.error(f"Error storing price data: {e}")
             raise
     
+    def record_price(self, mapping_id: int, price_data: PriceData):
+        """Queue price data on the bulk writer, or store it directly without one"""
+        if self.writer is not None:
+            self.writer.add(mapping_id, price_data)
+        else:
+            self.store_price_data(mapping_id, price_data)
+    
+    @contextmanager
+    def buffered_writes(self, stats: Dict[str, int]):
+        """
+        Route record_price() through a PriceHistoryWriter for a tracking run.
+        Without a long-lived writer one is opened and closed for the run; with
+        one, it is flushed and keeps failed rows for its next flush. Rows still
+        unwritten at the end, and rows the writer dropped during the run, move
+        from success to failed in stats.
+        """
+        own_writer = self.writer is None
+        if own_writer:
+            self.writer = PriceHistoryWriter(self.db_config)
+        writer = self.writer
+        dropped = writer.stats['rows_dropped']
+        try:
+            yield writer
+        finally:
+            if own_writer:
+                self.writer = None
+            try:
+                if own_writer:
+                    writer.close()
+                else:
+                    writer.flush()
+            except Exception as e:
+                unwritten = min(writer.pending(), stats['success'])
+                stats['success'] -= unwritten
+                stats['failed'] += unwritten
+                logger.error(f"{unwritten} tracked prices could not be written: {e}")
+            dropped = min(writer.stats['rows_dropped'] - dropped, stats['success'])
+            stats['success'] -= dropped
+            stats['failed'] += dropped
+    
     def track_prices(self, sku: Optional[str] = None) -> Dict[str, int]:
         """Track prices for all active competitors or specific SKU"""
         stats = {'total': 0, 'success': 0, 'failed': 0}
@@ -193,24 +212,25 @@ class PriceTracker:
         
         logger.info(f"Tracking prices for {stats['total']} competitors")
         
-        for competitor in competitors:
-            try:
-                logger.info(f"Scraping ASIN {competitor.competitor_asin} for SKU {competitor.sku}")
-                
-                price_data = self.scrape_amazon_product(competitor.competitor_asin)
+        with self.buffered_writes(stats):
+            for competitor in competitors:
+                try:
+                    logger.info(f"Scraping ASIN {competitor.competitor_asin} for SKU {competitor.sku}")
+                    
+                    price_data = self.scrape_amazon_product(competitor.competitor_asin)
+                    
+                    if price_data:
+                        self.record_price(competitor.id, price_data)
+                        stats['success'] += 1
+                        logger.info(f"Successfully tracked price: ₹{price_data.price}")
+                    else:
+                        stats['failed'] += 1
+                        logger.warning(f"Failed to scrape ASIN {competitor.competitor_asin}")
                 
-                if price_data:
-                    self.store_price_data(competitor.id, price_data)
-                    stats['success'] += 1
-                    logger.info(f"Successfully tracked price: ₹{price_data.price}")
-                else:
+                except Exception as e:
                     stats['failed'] += 1
-                    logger.warning(f"Failed to scrape ASIN {competitor.competitor_asin}")
+                    logger.error(f"Error tracking competitor {competitor.id}: {e}")
             
-            except Exception as e:
-                stats['failed'] += 1
-                logger.error(f"Error tracking competitor {competitor.id}: {e}")
-        
         logger.info(f"Price tracking complete: {stats}")
         return stats
     
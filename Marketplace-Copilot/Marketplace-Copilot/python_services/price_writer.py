@@ -0,0 +1,173 @@
+"""
+Price History Writer
+Buffers competitor_price_history rows and inserts them in batches with
+execute_values over a connection from the shared pool (db_pool.py), instead
+of a connection and a commit per scraped price. The buffer is flushed when it
+reaches batch_size, every flush_interval seconds from a background thread, and
+on close() (also registered with atexit).
+
+Delivery is at-least-once: rows leave the buffer only after their batch is
+committed. A flush that fails on the connection (OperationalError,
+InterfaceError) is retried max_retries times; a broken connection is dropped
+from the pool, so the retry gets another one. If it still fails the rows stay
+buffered for the next flush. A batch whose commit succeeded but was not
+acknowledged can be written twice.
+
+A batch the table rejects (IntegrityError, DataError: a deleted mapping, a
+rating or name that does not fit its column) is bisected down to the bad
+rows, which are logged and dropped so they cannot block later flushes. The
+buffer holds at most max_buffered rows; while the database is unreachable,
+newer rows beyond that are dropped. Both count in stats['rows_dropped'].
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import WRITER_CONFIG
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = """
+    INSERT INTO competitor_price_history (
+        competitor_mapping_id, price, availability,
+        seller_rating, seller_name, shipping_cost, scraped_at
+    )
+    VALUES %s
+"""
+
+
+class PriceHistoryWriter:
+    """Batched, thread-safe writer for competitor_price_history"""
+
+    def __init__(self, db_config: Dict[str, str], batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_retries: Optional[int] = None,
+                 max_buffered: Optional[int] = None):
+        self.db_config = db_config
+        self.pool = get_pool(db_config)
+        self.batch_size = batch_size or WRITER_CONFIG['batch_size']
+        self.flush_interval = flush_interval or WRITER_CONFIG['flush_interval']
+        self.max_retries = WRITER_CONFIG['max_retries'] if max_retries is None else max_retries
+        self.max_buffered = max(max_buffered or WRITER_CONFIG['max_buffered'], self.batch_size)
+        self.buffer: List[Tuple] = []
+        self.stats = {'rows_written': 0, 'flushes': 0, 'failed_flushes': 0, 'rows_dropped': 0}
+        # Set while the buffer is full, so an outage logs one warning rather than one per row
+        self.overflowing = False
+        # buffer_lock guards the buffer, flush_lock lets one flush run at a time
+        self.buffer_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.stopping = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_periodically, name='price-writer', daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, mapping_id: int, price_data, scraped_at: Optional[datetime] = None):
+        """Buffer one scraped price; scraped_at defaults to now, not to the flush time"""
+        row = (
+            mapping_id,
+            price_data.price,
+            price_data.availability,
+            price_data.seller_rating,
+            price_data.seller_name,
+            price_data.shipping_cost,
+            scraped_at or datetime.now(timezone.utc)
+        )
+        with self.buffer_lock:
+            overflow = len(self.buffer) >= self.max_buffered
+            if overflow:
+                self.stats['rows_dropped'] += 1
+            else:
+                self.buffer.append(row)
+            warn = overflow and not self.overflowing
+            self.overflowing = overflow
+            full = len(self.buffer) >= self.batch_size
+        if warn:
+            logger.warning(f"Price history buffer full ({self.max_buffered} rows), dropping new prices until a flush succeeds")
+        if full:
+            try:
+                self.flush()
+            except Exception as e:
+                # The rows are still buffered; the next flush retries them
+                logger.error(f"Price history flush failed, {self.pending()} rows kept: {e}")
+
+    def pending(self) -> int:
+        """Rows buffered and not yet committed"""
+        with self.buffer_lock:
+            return len(self.buffer)
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the rows written, raises when retries run out"""
+        written = 0
+        with self.flush_lock:
+            while True:
+                with self.buffer_lock:
+                    batch = self.buffer[:self.batch_size]
+                if not batch:
+                    return written
+                written += self._write(batch)
+                with self.buffer_lock:
+                    # Rows added meanwhile were appended behind the batch
+                    del self.buffer[:len(batch)]
+
+    def close(self):
+        """Stop the background flusher and flush what is left"""
+        if self.closed:
+            return
+        self.closed = True
+        self.stopping.set()
+        self.flusher.join()
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Price history writer closed with {self.pending()} unwritten rows: {e}")
+            raise
+
+    def _write(self, batch: List[Tuple]) -> int:
+        """Insert one batch; returns the rows written, which excludes rows the table rejected"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        execute_values(cur, INSERT_SQL, batch, page_size=len(batch))
+                self.stats['rows_written'] += len(batch)
+                self.stats['flushes'] += 1
+                return len(batch)
+            except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                # Retrying cannot help: find the bad rows and drop them
+                self.stats['failed_flushes'] += 1
+                if len(batch) == 1:
+                    self.stats['rows_dropped'] += 1
+                    logger.error(f"Dropped price history row {batch[0]!r}: {e}")
+                    return 0
+                half = len(batch) // 2
+                return self._write(batch[:half]) + self._write(batch[half:])
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self.stats['failed_flushes'] += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.warning(f"Price history flush of {len(batch)} rows failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _flush_periodically(self):
+        while not self.stopping.wait(self.flush_interval):
+            if self.pending():
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Price history flush failed, {self.pending()} rows kept: {e}")
@@ -8,11 +8,12 @@ import schedule
 import time
 from datetime import datetime
 from typing import Dict
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from db_pool import get_pool, pool_stats
 from competitor_discovery import CompetitorDiscovery
-from price_tracker import PriceTracker
+from async_tracker import AsyncPriceTracker
+from price_writer import PriceHistoryWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,12 +26,15 @@ class CompetitorScheduler:
     
     def __init__(self, db_config: Dict[str, str]):
         self.db_config = db_config
+        self.pool = get_pool(db_config)
         self.discovery = CompetitorDiscovery(db_config)
-        self.tracker = PriceTracker(db_config)
+        self.tracker = AsyncPriceTracker(db_config)
+        # One writer for all tracking runs: rows a failed flush kept go out with the next run
+        self.tracker.writer = PriceHistoryWriter(db_config)
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection for one transaction"""
+        return self.pool.connection()
     
     def get_all_skus(self) -> list:
         """Fetch all SKUs from products table"""
@@ -87,6 +91,7 @@ class CompetitorScheduler:
             f"Price tracking complete: {stats['success']} success, {stats['failed']} failed, "
             f"{duration:.1f}s total"
         )
+        logger.info(f"Connection pools: {pool_stats()}")
     
     def cleanup_old_data(self):
         """Clean up old price history data"""
@@ -131,6 +136,9 @@ class CompetitorScheduler:
         except Exception as e:
             logger.error(f"Scheduler error: {e}")
             raise
+        finally:
+            self.tracker.writer.close()
+            self.tracker.close()
 
 
 # CLI usage
@@ -0,0 +1,459 @@
+"""
+Daily Series Store
+Per-SKU daily unit series for one user, kept on disk as a memory-mapped int32
+SKU x day matrix, so loading a SKU's history is a slice of a mapped row instead
+of a sales query plus a groupby / asfreq. Several processes (warm workers, pool
+workers, model scripts) can open the same store read-only and share its pages
+through the page cache.
+
+A store directory holds
+
+    index.npz         sorted SKU labels (row order), first/last day column with a
+                      sale row per SKU, and a JSON header (date origin, days
+                      stored, row width, data file name)
+    units.<gen>.i32   the matrix: one fixed-width row of `capacity` int32 day
+                      cells per SKU, day column 0 == origin
+
+Rows are SKU-major so one SKU's history is contiguous. Each row has spare day
+columns, so appending new days writes into the existing file; a new SKU, a day
+before the origin or running out of columns rewrites the matrix into the next
+generation's file, which readers pick up on their next open() while maps of the
+old file stay valid. Retired files are removed after each index write and at
+the next sync; where a reader's map blocks removal (Windows), the file is left
+for a later sweep. Index updates are atomic (temp file + rename); writers
+serialize on a lock file.
+
+Each sync compares per-day totals with the database and re-reads sales from the
+first day that differs; --rebuild covers changes that keep every day's totals
+(a renamed SKU).
+
+Usage:
+    python python_services/series_store.py [--user=<id>] [--store-dir=DIR] [--source=auto|sales|rollup] [--rebuild]
+"""
+
+import os
+import re
+import sys
+import json
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from surge_engine import logger, project_data_dir, fetch_sales, fetch_day_totals, sales_frame, DailyUnits
+from surge_batch import SalesMatrix
+
+STORE_VERSION = 1
+# Spare day columns given to every row when the matrix is (re)written
+SPARE_DAYS = 92
+# Rows per block when a rewrite copies the old matrix into a new file or rows are summed
+BLOCK_ROWS = 4096
+
+
+def _daily_cells(sales_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(sorted SKU labels, int32 codes into them, int32 day numbers, int32 units), one row per (sku, day)."""
+    codes, skus = pd.factorize(sales_df["sku"], sort=True)
+    if "day" in sales_df:
+        days = sales_df["day"].to_numpy(dtype=np.int32)
+    else:
+        days = pd.to_datetime(sales_df["date"]).to_numpy().astype("datetime64[D]").astype(np.int32)
+    units = sales_df["units"].to_numpy(dtype=np.int32)
+    valid = codes >= 0
+    acc = DailyUnits()
+    acc.add(codes[valid].astype(np.int32), days[valid], units[valid])
+    codes, days, units = acc.arrays()
+    return np.asarray(skus, dtype=str), codes, days, units
+
+
+def _row_bounds(codes: np.ndarray, days: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Min and max day per code for (code, day)-sorted cells; -1 for codes without cells."""
+    first = np.full(n_rows, -1, dtype=np.int32)
+    last = np.full(n_rows, -1, dtype=np.int32)
+    if len(codes):
+        starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+        ends = np.r_[starts[1:], len(codes)] - 1
+        first[codes[starts]] = days[starts]
+        last[codes[ends]] = days[ends]
+    return first, last
+
+
+class SeriesStore:
+    """
+    An opened store: index arrays in memory plus the matrix mapped read-only.
+    Use open() / build() / sync_store() rather than the constructor.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any], skus: np.ndarray, first: np.ndarray, last: np.ndarray):
+        self.path = path
+        self.header = header
+        self.skus = skus
+        self.first = first
+        self.last = last
+        self.origin = int(header["origin"])
+        self.n_days = int(header["n_days"])
+        self.capacity = int(header["capacity"])
+        self.units = np.memmap(self.data_path(), dtype=np.int32, mode="r", shape=(len(skus), self.capacity))
+        self._rows: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def path_for(store_dir: Optional[str], user_id: Optional[str]) -> str:
+        store_dir = store_dir or os.path.join(project_data_dir(), ".surge_series")
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id or "all")
+        return os.path.join(store_dir, name)
+
+    @classmethod
+    def open(cls, path: str) -> Optional["SeriesStore"]:
+        """The store at `path`, or None when there is none (or it is unreadable / another version)."""
+        # A writer may retire the data file between reading the index and mapping it; the next index names the new one
+        for _ in range(3):
+            try:
+                with np.load(os.path.join(path, "index.npz"), allow_pickle=False) as z:
+                    header = json.loads(str(z["header"]))
+                    if header.get("version") != STORE_VERSION:
+                        return None
+                    return cls(path, header, z["skus"], z["first"], z["last"])
+            except FileNotFoundError:
+                if not os.path.isfile(os.path.join(path, "index.npz")):
+                    return None
+            except Exception as e:
+                logger.warning("Ignoring unreadable series store %s: %s", path, e)
+                return None
+        return None
+
+    def data_path(self) -> str:
+        return os.path.join(self.path, self.header["data"])
+
+    # ---- reads -------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    @property
+    def end_day(self) -> int:
+        """Last stored day number (days since 1970-01-01)."""
+        return self.origin + self.n_days - 1
+
+    def row(self, sku: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {s: i for i, s in enumerate(self.skus.tolist())}
+        i = self._rows.get(sku)
+        if i is None or self.last[i] < 0:
+            return None
+        return i
+
+    def present_rows(self, sku: Optional[str] = None) -> np.ndarray:
+        """Rows of SKUs with stored sales, in SKU order; just `sku`'s row when given."""
+        if sku is not None:
+            i = self.row(sku)
+            return np.array([] if i is None else [i], dtype=np.int64)
+        return np.flatnonzero(self.last >= 0)
+
+    def last_date(self, sku: Optional[str] = None) -> Optional[date]:
+        """Date of the latest sale row, for one SKU or the whole store."""
+        rows = self.present_rows(sku)
+        if not len(rows):
+            return None
+        return np.datetime64(self.origin + int(self.last[rows].max()), "D").astype(date)
+
+    def series(self, sku: str) -> Optional[np.ndarray]:
+        """Zero-copy int32 view of a SKU's daily units from its first to its last sale row."""
+        i = self.row(sku)
+        if i is None:
+            return None
+        return self.units[i, self.first[i]:self.last[i] + 1]
+
+    def daily(self, sku: str) -> Optional[pd.Series]:
+        """series() as the date-indexed daily Series that compute_for_sku() builds with groupby + asfreq."""
+        values = self.series(sku)
+        if values is None:
+            return None
+        start = np.datetime64(self.origin + int(self.first[self.row(sku)]), "D")
+        index = pd.date_range(start, periods=len(values), freq="D", unit="s", name="date")
+        return pd.Series(values, index=index, name="units")
+
+    def row_totals(self, since_day: Optional[int] = None, days_with_sales: bool = False) -> np.ndarray:
+        """
+        Units per row (every SKU), or the number of days with sales, counting only
+        days >= since_day when given. Summed in blocks of rows so the mapped
+        matrix is never copied whole.
+        """
+        start = 0 if since_day is None else min(max(since_day - self.origin, 0), self.n_days)
+        totals = np.zeros(len(self.skus), dtype=np.int64)
+        for lo in range(0, len(self.skus), BLOCK_ROWS):
+            block = self.units[lo:lo + BLOCK_ROWS, start:self.n_days]
+            totals[lo:lo + len(block)] = (block > 0).sum(axis=1) if days_with_sales else block.sum(axis=1, dtype=np.int64)
+        return totals
+
+    def day_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Units and the number of SKUs with non-zero units per stored day, summed in blocks of rows."""
+        units = np.zeros(self.n_days, dtype=np.int64)
+        skus = np.zeros(self.n_days, dtype=np.int64)
+        for lo in range(0, len(self.skus), BLOCK_ROWS):
+            block = self.units[lo:lo + BLOCK_ROWS, :self.n_days]
+            units += block.sum(axis=0, dtype=np.int64)
+            skus += (block != 0).sum(axis=0)
+        return units, skus
+
+    def nonzero_days(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(position in `rows`, day number, units) of every day with sales, sorted by position, then day."""
+        parts = []
+        for lo in range(0, len(rows), BLOCK_ROWS):
+            block = np.asarray(self.units[rows[lo:lo + BLOCK_ROWS], :self.n_days])
+            r, c = np.nonzero(block > 0)
+            parts.append((r + lo, c.astype(np.int64) + self.origin, block[r, c].astype(np.int64)))
+        if not parts:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        return tuple(np.concatenate(p) for p in zip(*parts))
+
+    def sales_matrix(self, sku: Optional[str] = None, rows: Optional[np.ndarray] = None) -> SalesMatrix:
+        """The surge_batch SalesMatrix over the mapped rows (no pivot); `rows` (sorted) picks a subset."""
+        if rows is None:
+            rows = self.present_rows(sku)
+        if len(rows) == len(self.skus):
+            units = self.units[:, :self.n_days]
+        elif len(rows) == 1:
+            units = self.units[rows[0]:rows[0] + 1, :self.n_days]
+        else:
+            units = self.units[rows, :self.n_days]
+        return SalesMatrix(
+            skus=self.skus[rows].astype(object),
+            units=units,
+            first=self.first[rows].astype(np.int64),
+            last=self.last[rows].astype(np.int64),
+            origin=np.datetime64(self.origin, "D"),
+        )
+
+    def sales_frame(self, sku: Optional[str] = None) -> pd.DataFrame:
+        """
+        A (sku, date, day, units) frame for engines that work from sale rows:
+        one row per non-zero day plus each SKU's first and last day.
+        """
+        rows = self.present_rows(sku)
+        if not len(rows):
+            return sales_frame(np.empty(0, np.int32), self.skus, np.empty(0, np.int32), np.empty(0, np.int32))
+        block = np.asarray(self.units[rows, :self.n_days])
+        keep = block != 0
+        keep[np.arange(len(rows)), self.first[rows]] = True
+        keep[np.arange(len(rows)), self.last[rows]] = True
+        r, c = np.nonzero(keep)
+        return sales_frame(
+            rows[r].astype(np.int32), self.skus.astype(object),
+            (c + self.origin).astype(np.int32), block[r, c]
+        )
+
+    # ---- writes ------------------------------------------------------------
+
+    @classmethod
+    def build(cls, path: str, sales_df: pd.DataFrame) -> Optional["SeriesStore"]:
+        """Write a store holding exactly sales_df (replacing any store at `path`)."""
+        skus, codes, days, units = _daily_cells(sales_df)
+        if not len(codes):
+            return None
+        origin = int(days.min())
+        n_days = int(days.max()) - origin + 1
+        first, last = _row_bounds(codes, days - origin, len(skus))
+        data = _next_data_name(path)
+        matrix = _new_matrix(path, data, len(skus), n_days + SPARE_DAYS)
+        matrix[codes, days - origin] = units
+        matrix.flush()
+        del matrix
+        _write_index(path, {"origin": origin, "n_days": n_days, "capacity": n_days + SPARE_DAYS, "data": data}, skus, first, last)
+        return cls.open(path)
+
+    def append(self, sales_df: pd.DataFrame, since_day: Optional[int] = None) -> "SeriesStore":
+        """
+        Store the daily totals of sales_df for every day from `since_day` (default:
+        its first day) on, replacing what the store held for those days, so
+        re-running an append with the same or newer rows is harmless. sales_df must
+        hold every sale on or after `since_day`. Returns the reopened store.
+        """
+        new_skus, codes, days, units = _daily_cells(sales_df)
+        if since_day is None:
+            if not len(codes):
+                return self
+            since_day = int(days.min())
+        if len(codes) and days.min() < since_day:
+            raise ValueError(f"sales before since_day {since_day} passed to append()")
+
+        skus = np.union1d(self.skus, new_skus) if len(new_skus) else self.skus
+        origin = min(self.origin, since_day)
+        end = max(self.end_day, int(days.max()) if len(codes) else self.end_day)
+        width = end - origin + 1
+        rewrite = len(skus) != len(self.skus) or origin != self.origin or width > self.capacity
+
+        old_rows = np.searchsorted(skus, self.skus)
+        shift = self.origin - origin
+        first = np.full(len(skus), -1, dtype=np.int32)
+        last = np.full(len(skus), -1, dtype=np.int32)
+        present = self.last >= 0
+        first[old_rows[present]] = self.first[present] + shift
+        last[old_rows[present]] = self.last[present] + shift
+
+        if rewrite:
+            data = _next_data_name(self.path)
+            capacity = width + SPARE_DAYS
+            matrix = _new_matrix(self.path, data, len(skus), capacity)
+            for lo in range(0, len(self.skus), BLOCK_ROWS):
+                hi = min(lo + BLOCK_ROWS, len(self.skus))
+                matrix[old_rows[lo:hi], shift:shift + self.n_days] = self.units[lo:hi, :self.n_days]
+        else:
+            data, capacity = self.header["data"], self.capacity
+            matrix = np.memmap(self.data_path(), dtype=np.int32, mode="r+", shape=(len(skus), capacity))
+
+        # Replace every SKU's days from since_day on
+        col = since_day - origin
+        touched = np.flatnonzero(last >= col)
+        if len(touched):
+            matrix[touched, col:width] = 0
+        new_rows = np.searchsorted(skus, new_skus)[codes]
+        matrix[new_rows, days - origin] = units
+
+        new_first, new_last = _row_bounds(new_rows, days - origin, len(skus))
+        has_new = new_last >= 0
+        # Rows whose stored history started inside the replaced range only keep what sales_df brought
+        first[(first >= col) & ~has_new] = -1
+        first = np.where(has_new & ((first < 0) | (first >= col)), new_first, first)
+        for i in np.flatnonzero((last >= col) & ~has_new & (first >= 0)):
+            nz = np.flatnonzero(matrix[i, first[i]:col])
+            last[i] = first[i] + (nz[-1] if len(nz) else 0)
+        last[(last >= col) & ~has_new & (first < 0)] = -1
+        last = np.where(has_new, new_last, last)
+
+        matrix.flush()
+        del matrix
+        n_days = int(last.max()) + 1 if (last >= 0).any() else 1
+        _write_index(self.path, {"origin": origin, "n_days": n_days, "capacity": capacity, "data": data}, skus, first, last)
+        return SeriesStore.open(self.path)
+
+
+def _next_data_name(path: str) -> str:
+    gens = [int(m.group(1)) for m in (re.match(r"units\.(\d+)\.i32$", n) for n in os.listdir(path)) if m] if os.path.isdir(path) else []
+    return f"units.{max(gens, default=0) + 1}.i32"
+
+
+def _new_matrix(path: str, data: str, rows: int, capacity: int) -> np.memmap:
+    os.makedirs(path, exist_ok=True)
+    return np.memmap(os.path.join(path, data), dtype=np.int32, mode="w+", shape=(max(rows, 1), capacity))
+
+
+def _write_index(path: str, header: Dict[str, Any], skus: np.ndarray, first: np.ndarray, last: np.ndarray):
+    header = {"version": STORE_VERSION, **header}
+    fd, tmp = tempfile.mkstemp(dir=path, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, header=np.array(json.dumps(header)), skus=np.asarray(skus, dtype=str), first=first, last=last)
+    os.replace(tmp, os.path.join(path, "index.npz"))
+    _remove_retired(path, header["data"])
+
+
+def _remove_retired(path: str, current: str):
+    """
+    Delete data files of older generations. On POSIX, processes that still map
+    one keep it until they close it; Windows refuses to delete a mapped file,
+    so it stays until a later sweep finds it unmapped.
+    """
+    for name in os.listdir(path):
+        if re.match(r"units\.\d+\.i32$", name) and name != current:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError as e:
+                logger.debug("Keeping retired series data %s for now: %s", name, e)
+
+
+def _lock_file(f, exclusive: bool):
+    """Block on (or release) an exclusive lock on an open file: flock on POSIX, msvcrt.locking on Windows."""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        if not exclusive:
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        while True:
+            try:
+                # LK_LOCK gives up after ~10 s of retries; keep waiting like flock does
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_UN)
+
+
+@contextmanager
+def store_lock(path: str) -> Iterator[None]:
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "w") as f:
+        _lock_file(f, True)
+        try:
+            yield
+        finally:
+            _lock_file(f, False)
+
+
+def first_changed_day(store: SeriesStore, days: np.ndarray, units: np.ndarray, skus: np.ndarray) -> Optional[int]:
+    """
+    The first day before store.end_day whose fetch_day_totals() row (units, SKUs
+    with sales) differs from what the store holds, or None when all match.
+    """
+    stored_units, stored_skus = store.day_totals()
+    lo = min(store.origin, int(days[0])) if len(days) else store.origin
+    width = store.end_day - lo
+    if width <= 0:
+        return None
+    held = np.zeros((2, width), dtype=np.int64)
+    held[:, store.origin - lo:] = np.stack([stored_units, stored_skus])[:, :store.n_days - 1]
+    fetched = np.zeros((2, width), dtype=np.int64)
+    fetched[:, days - lo] = np.stack([units, skus])
+    diff = np.flatnonzero((held != fetched).any(axis=0))
+    return lo + int(diff[0]) if len(diff) else None
+
+
+def sync_store(store_dir: Optional[str], user_id: Optional[str], source: str = "auto", memory_mb: Optional[int] = None, rebuild: bool = False) -> Optional[SeriesStore]:
+    """
+    Open the user's store, bringing it up to date first: build it from all sales
+    when missing (or with rebuild), otherwise re-read sales from the last stored
+    day on, so a partially stored last day is completed and new days are
+    appended. Sales inserted or changed for older days are found by comparing
+    per-day totals (units and SKUs with sales, summed in the database) with the
+    store, and sales are re-read from the first day that differs. A change that
+    keeps both totals of every day, such as a SKU renamed, still needs a rebuild.
+    """
+    path = SeriesStore.path_for(store_dir, user_id)
+    with store_lock(path):
+        store = None if rebuild else SeriesStore.open(path)
+        if store is not None:
+            _remove_retired(path, store.header["data"])
+        if store is None:
+            return SeriesStore.build(path, fetch_sales(user_id, None, source, memory_mb))
+        since = store.end_day
+        changed = first_changed_day(store, *fetch_day_totals(user_id, source, until_day=since))
+        if changed is not None:
+            since = changed
+            logger.warning("Sales on or after %s changed since the series store was synced; re-reading from there",
+                           np.datetime64(since, "D"))
+        recent = fetch_sales(user_id, None, source, memory_mb, since_day=since)
+        return store.append(recent, since_day=since)
+
+
+def main():
+    opts = dict(a[2:].split("=", 1) if "=" in a else (a[2:], "1") for a in sys.argv[1:] if a.startswith("--"))
+    store = sync_store(opts.get("store-dir"), opts.get("user"), opts.get("source", "auto"), rebuild="rebuild" in opts)
+    if store is None:
+        print(json.dumps({"error": "no sales"}))
+        return
+    print(json.dumps({
+        "path": store.path,
+        "skus": len(store.present_rows()),
+        "days": store.n_days,
+        "capacity": store.capacity,
+        "origin": str(np.datetime64(store.origin, "D")),
+        "end": str(store.last_date()),
+        "data_mb": round(os.path.getsize(store.data_path()) / 2**20, 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Batch Surge Engine
+Computes surge intelligence for a whole catalog at once. Sales are pivoted into a
+dense SKU x day units matrix, SKUs are bucketed by series length, and each bucket
+goes through the additive decomposition, spike/trend signals and recurring-peak
+detection as array operations instead of one statsmodels call per SKU.
+
+Matches compute_for_sku(): the decomposition reproduces statsmodels
+seasonal_decompose(model='additive', extrapolate_trend='freq') and the unrounded
+signals agree to a relative tolerance of 1e-9 (floating-point summation order is
+the only difference), so the rounded payload fields are identical.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from surge_engine import logger, assemble_sku_result, promotion_multiplier_logic, PromotionIndex, Scenario
+from surge_profile import active
+
+PERIOD = 30
+PEAK_QUANTILE = 0.90
+PEAK_MAX_GAP_DAYS = 3
+
+# "%m-%d" labels indexed by month * 32 + day, so peak dates never go through strftime
+_MD_LABELS = np.array([f"{m:02d}-{d:02d}" for m in range(13) for d in range(32)], dtype=object)
+
+
+@dataclass
+class SalesMatrix:
+    skus: np.ndarray  # SKU labels, sorted as groupby("sku") would iterate them
+    units: np.ndarray  # int32 [sku, day] units sold, day 0 == origin
+    first: np.ndarray  # first day column with a sale row, per SKU
+    last: np.ndarray  # last day column with a sale row, per SKU
+    origin: np.datetime64  # calendar day of column 0
+
+
+def build_sales_matrix(sales_df: pd.DataFrame) -> SalesMatrix:
+    """Pivot (sku, date, units) rows into a dense SKU x day matrix in one pass."""
+    codes, skus = pd.factorize(sales_df["sku"], sort=True)
+    if "day" in sales_df:
+        days = sales_df["day"].to_numpy(dtype=np.int64)
+    else:
+        days = pd.to_datetime(sales_df["date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    units = sales_df["units"].to_numpy(dtype=np.int64)
+    valid = codes >= 0
+    codes, days, units = codes[valid], days[valid], units[valid]
+
+    origin = days.min()
+    width = int(days.max() - origin) + 1
+    keys = codes.astype(np.int64) * width + (days - origin)
+    summed = pd.Series(units).groupby(keys).sum()
+    keys = summed.index.to_numpy()
+
+    matrix = np.zeros((len(skus), width), dtype=np.int32)
+    matrix.ravel()[keys] = summed.to_numpy()
+
+    # Keys are sorted, so each SKU's first/last key bound its date range
+    sku_of = keys // width
+    bounds = np.flatnonzero(np.diff(sku_of)) + 1
+    first = keys[np.r_[0, bounds]] % width
+    last = keys[np.r_[bounds - 1, len(keys) - 1]] % width
+
+    return SalesMatrix(
+        skus=np.asarray(skus, dtype=object),
+        units=matrix,
+        first=first,
+        last=last,
+        origin=np.datetime64(int(origin), "D"),
+    )
+
+
+def linear_extrapolate(trend: np.ndarray, fit_from: int, fit_to: int, at: np.ndarray, offset: int = 0) -> np.ndarray:
+    """
+    Least-squares line through the trend at series indices fit_from .. fit_to - 1,
+    per row, evaluated at series indices `at`. Column 0 of `trend` is index `offset`.
+    """
+    idx = np.arange(fit_from, fit_to, dtype=np.float64)
+    design = np.column_stack([idx, np.ones_like(idx)])
+    coef = trend[:, fit_from - offset:fit_to - offset] @ np.linalg.pinv(design).T
+    return coef[:, :1] * at + coef[:, 1:]
+
+
+def centered_ma(x: np.ndarray, period: int = PERIOD) -> np.ndarray:
+    """
+    Centered moving average of every row, from cumulative sums. Returns the
+    n - 2 * (period // 2) values for centers period // 2 .. n - period // 2 - 1.
+    Even periods use the 2 x period MA (period + 1 points, ends at half weight).
+    """
+    k, n = x.shape
+    csum = np.zeros((k, n + 1))
+    np.cumsum(x, axis=1, out=csum[:, 1:])
+    if period % 2 == 0:
+        window = csum[:, period + 1:] - csum[:, :n - period]
+        return (window - 0.5 * (x[:, :n - period] + x[:, period:])) / period
+    return (csum[:, period:] - csum[:, :n - period + 1]) / period
+
+
+def decompose_rows(x: np.ndarray, period: int = PERIOD) -> Dict[str, np.ndarray]:
+    """
+    Additive decomposition of every row of x (equal-length daily series, at least
+    2 * period long). Same steps as statsmodels seasonal_decompose with
+    extrapolate_trend='freq': centered moving-average trend, linear extrapolation
+    of the trend ends, phase-mean seasonal profile.
+    """
+    k, n = x.shape
+    half = period // 2
+
+    trend = np.full((k, n), np.nan)
+    trend[:, half:n - half] = centered_ma(x, period)
+
+    front, back = half, n - half - 1
+    trend[:, :front] = linear_extrapolate(trend, front, min(front + period, back), np.arange(front))
+    trend[:, back + 1:] = linear_extrapolate(trend, max(front, back - period), back, np.arange(back + 1, n))
+
+    detrended = x - trend
+    profile = phase_sums(detrended, 0, period) / phase_counts(n, period)
+    profile -= profile.mean(axis=1, keepdims=True)
+    seasonal = profile[:, np.arange(n) % period]
+    resid = detrended - seasonal
+
+    var_seasonal = seasonal.var(axis=1, ddof=1)
+    var_resid = resid.var(axis=1, ddof=1)
+
+    return {
+        "trend": trend,
+        "seasonal": seasonal,
+        "residual": resid,
+        "profile": profile,
+        "strength": seasonality_strength(var_seasonal, var_resid),
+    }
+
+
+def phase_sums(values: np.ndarray, t0: int, period: int = PERIOD) -> np.ndarray:
+    """Per-row sums of values[:, j] grouped by phase (t0 + j) % period."""
+    k, m = values.shape
+    lead = t0 % period
+    cycles = -(-(lead + m) // period)
+    padded = np.zeros((k, cycles * period))
+    padded[:, lead:lead + m] = values
+    return padded.reshape(k, cycles, period).sum(axis=1)
+
+
+def phase_counts(n: int, period: int = PERIOD) -> np.ndarray:
+    """How many of the indices 0 .. n - 1 fall on each phase."""
+    return n // period + (np.arange(period) < n % period)
+
+
+def seasonality_strength(var_seasonal: np.ndarray, var_resid: np.ndarray) -> np.ndarray:
+    total = var_seasonal + var_resid
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, np.maximum(0.0, 1.0 - var_resid / total), 0.0)
+
+
+def fallback_rows(x: np.ndarray) -> Dict[str, np.ndarray]:
+    """perform_decomposition() fallback for series shorter than two periods."""
+    zeros = np.zeros_like(x)
+    return {"trend": x, "seasonal": zeros, "residual": zeros, "strength": np.zeros(x.shape[0])}
+
+
+def recurring_peaks_rows(seasonal: np.ndarray, first_day: np.ndarray) -> List[List[Dict[str, Any]]]:
+    """
+    detect_recurring_peaks() for every row: days above the row's 90th percentile
+    seasonal value, grouped into runs whose gaps are at most 3 days.
+    """
+    k = seasonal.shape[0]
+    peaks: List[List[Dict[str, Any]]] = [[] for _ in range(k)]
+    if seasonal.shape[1] == 0:
+        return peaks
+
+    threshold = np.quantile(seasonal, PEAK_QUANTILE, axis=1)
+    mask = seasonal > threshold[:, None]
+    mask[seasonal.max(axis=1) == 0] = False
+    rows, cols = np.nonzero(mask)
+    if not len(rows):
+        return peaks
+
+    starts_group = np.ones(len(rows), dtype=bool)
+    starts_group[1:] = (rows[1:] != rows[:-1]) | (np.diff(cols) > PEAK_MAX_GAP_DAYS)
+    starts = np.flatnonzero(starts_group)
+    ends = np.r_[starts[1:], len(rows)] - 1
+    magnitude = np.maximum.reduceat(seasonal[rows, cols], starts)
+
+    group_rows = rows[starts]
+    start_md = _md_labels(first_day[group_rows] + cols[starts])
+    end_md = _md_labels(first_day[group_rows] + cols[ends])
+    duration = ends - starts + 1
+    for g, r in enumerate(group_rows):
+        peaks[r].append({
+            "start_date": start_md[g],
+            "end_date": end_md[g],
+            "magnitude": float(magnitude[g]),
+            "duration_days": int(duration[g]),
+        })
+    return peaks
+
+
+def _md_labels(days: np.ndarray) -> np.ndarray:
+    dates = days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    month = months.astype(np.int64) % 12 + 1
+    day = (dates - months).astype(np.int64) + 1
+    return _MD_LABELS[month * 32 + day]
+
+
+def tail_stats_rows(x: np.ndarray, decomp: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """The per-SKU scalars decomposition_signals() reads off a decomposition."""
+    k, n = x.shape
+    trend, resid = decomp["trend"], decomp["residual"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        resid_std = resid.std(axis=1, ddof=1) if n > 1 else np.full(k, np.nan)
+    return {
+        "length": np.full(k, n),
+        "trend_last": trend[:, -1],
+        "prev_trend": trend[:, -30] if n > 30 else np.full(k, np.nan),
+        "seasonal_last": decomp["seasonal"][:, -1],
+        "resid_last": resid[:, -1],
+        "resid_std": resid_std,
+        "mean_units": x.mean(axis=1),
+        "strength": decomp["strength"],
+    }
+
+
+def signals_rows(stats: Dict[str, np.ndarray], ends_today: np.ndarray) -> List[Dict[str, Any]]:
+    """decomposition_signals() for every row of tail stats, keeping its scalar types and branches."""
+    trend_last = stats["trend_last"]
+    seasonal_last = stats["seasonal_last"]
+    resid_last = stats["resid_last"]
+    resid_std = stats["resid_std"]
+    prev_trend = stats["prev_trend"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spike_ratio = np.fmax(1.0, (trend_last + seasonal_last + resid_last) / (trend_last + seasonal_last))
+
+    out: List[Dict[str, Any]] = []
+    for j in range(len(trend_last)):
+        t_last = trend_last[j]
+
+        seasonal_mult = 1.0
+        if ends_today[j] and t_last > 0:
+            seasonal_mult = (t_last + seasonal_last[j]) / t_last
+
+        spike_flag = resid_last[j] > (2 * resid_std[j]) if resid_std[j] > 0 else False
+        spike_mult = spike_ratio[j] if spike_flag else 1.0
+
+        trend_mult = 1.0
+        trend_flag = False
+        accel = 0.0
+        if stats["length"][j] > 30 and prev_trend[j] > 0:
+            trend_mult = t_last / prev_trend[j]
+            trend_flag = trend_mult > 1.1
+            accel = (t_last - prev_trend[j]) / prev_trend[j]
+
+        out.append({
+            "seasonal_mult": seasonal_mult,
+            "spike_flag": spike_flag,
+            "spike_mult": spike_mult,
+            "trend_mult": trend_mult,
+            "trend_flag": trend_flag,
+            "accel": accel,
+            "trend_last": t_last,
+            "strength": float(stats["strength"][j]),
+            "base_daily": float(t_last if not np.isnan(t_last) else stats["mean_units"][j]),
+        })
+    return out
+
+
+def length_buckets(lengths: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+    """Row indices grouped by series length, so each group decomposes as one matrix."""
+    order = np.argsort(lengths, kind="stable")
+    bounds = np.flatnonzero(np.diff(lengths[order])) + 1
+    return [(int(lengths[rows[0]]), rows) for rows in np.split(order, bounds)]
+
+
+def assemble_rows(skus: np.ndarray, signals: List[Dict[str, Any]], peaks: List[List[Dict[str, Any]]], promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None) -> List[Dict[str, Any]]:
+    """assemble_sku_result() for every SKU in order, isolating per-SKU failures like the serial loop."""
+    prof = active()
+    results: List[Dict[str, Any]] = []
+    for i, sku in enumerate(skus):
+        try:
+            promo_mult, promo_flag = promotion_multiplier_logic(None, promos, sku, today)
+            results.append(assemble_sku_result(sku, signals[i], peaks[i], promo_mult, promo_flag, today, lead_time, safety_stock, scenarios=scenarios))
+        except Exception as e:
+            logger.exception("Failed to compute for sku=%s: %s", sku, e)
+            prof.count("skus_failed")
+    prof.count("skus_processed", len(results))
+    return results
+
+
+def compute_batch(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], period: int = PERIOD, scenarios: Optional[List[Scenario]] = None) -> List[Dict[str, Any]]:
+    """Batch equivalent of calling compute_for_sku() for every SKU in sales_df, in the same order."""
+    if sales_df.empty:
+        return []
+    with active().span("series_prep"):
+        matrix = build_sales_matrix(sales_df)
+    return compute_matrix(matrix, promos, today, lead_time, safety_stock, period, scenarios)
+
+
+def compute_matrix(matrix: SalesMatrix, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], period: int = PERIOD, scenarios: Optional[List[Scenario]] = None) -> List[Dict[str, Any]]:
+    """compute_batch() from an already built SalesMatrix (e.g. a series_store.SeriesStore mapping)."""
+    if not len(matrix.skus):
+        return []
+    prof = active()
+    today_col = int((np.datetime64(today, "D") - matrix.origin).astype(np.int64))
+    lengths = matrix.last - matrix.first + 1
+    first_day = matrix.first + matrix.origin.astype(np.int64)
+
+    signals: List[Any] = [None] * len(matrix.skus)
+    peaks: List[Any] = [None] * len(matrix.skus)
+    for length, rows in length_buckets(lengths):
+        with prof.span("decomposition"):
+            x = matrix.units[rows[:, None], matrix.first[rows, None] + np.arange(length)].astype(np.float64)
+            decomp = decompose_rows(x, period) if length >= 2 * period else fallback_rows(x)
+        with prof.span("peak_detection"):
+            bucket_peaks = recurring_peaks_rows(decomp["seasonal"], first_day[rows])
+        with prof.span("signals"):
+            bucket_signals = signals_rows(tail_stats_rows(x, decomp), matrix.last[rows] == today_col)
+        for j, i in enumerate(rows):
+            signals[i] = bucket_signals[j]
+            peaks[i] = bucket_peaks[j]
+    return assemble_rows(matrix.skus, signals, peaks, promos, today, lead_time, safety_stock, scenarios)
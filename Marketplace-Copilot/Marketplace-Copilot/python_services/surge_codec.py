@@ -0,0 +1,114 @@
+"""
+Surge Payload Codecs
+Binary alternatives to the JSON surge payload, selected with --format:
+
+- msgpack: the payload as one MessagePack map (same structure as the JSON).
+- arrow:   a MessagePack envelope {"format", "results", "event_shapes",
+           "upcoming_events", "dashboard", "extra"} where "results" is an Arrow IPC stream with
+           one row per SKU (flat fields plus struct columns for signals/metadata/
+           components). The nested per-SKU event lists and the dashboard stay
+           MessagePack; events are packed as [shape, *values] arrays against the
+           shared key lists in "event_shapes" instead of repeating keys per event.
+           "extra" keeps the payload's other top-level fields (timings,
+           the --deadline-ms fields).
+
+Unlike the JSON path (json.dumps(default=str)), numpy scalars are written as
+native bools/numbers rather than strings. pyarrow and msgpack are optional and
+only imported when a binary format is requested.
+"""
+
+import io
+import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+FORMATS = ("json", "msgpack", "arrow")
+ARROW_ENVELOPE = "surge-arrow/1"
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError("msgpack is required for binary surge output (pip install msgpack)")
+    return msgpack
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise RuntimeError("pyarrow is required for --format=arrow (pip install pyarrow)")
+    return pa
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def encode_payload(payload: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == "msgpack":
+        return _msgpack().packb(payload, default=_default, use_bin_type=True)
+    if fmt == "arrow":
+        return _encode_arrow(payload)
+    raise ValueError(f"Unknown surge payload format: {fmt}")
+
+
+def decode_payload(data: bytes) -> Dict[str, Any]:
+    """Inverse of encode_payload() for either binary format."""
+    msg = _msgpack().unpackb(data, raw=False)
+    if isinstance(msg, dict) and msg.get("format") == ARROW_ENVELOPE:
+        return _decode_arrow(msg)
+    return msg
+
+
+def _encode_arrow(payload: Dict[str, Any]) -> bytes:
+    pa = _pyarrow()
+    msgpack = _msgpack()
+    results = payload.get("results", [])
+    shapes: Dict[tuple, int] = {}
+    events: List[Any] = []
+    rows: List[Dict[str, Any]] = []
+    for r in results:
+        row = dict(r)
+        packed = []
+        for ev in row.pop("upcoming_events", []):
+            keys = tuple(ev)
+            shape = shapes.setdefault(keys, len(shapes))
+            packed.append([shape, *ev.values()])
+        events.append(packed)
+        rows.append(row)
+    # pyarrow converts numpy scalars itself while inferring the schema
+    table = pa.Table.from_pylist(rows)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return msgpack.packb({
+        "format": ARROW_ENVELOPE,
+        "results": sink.getvalue(),
+        "event_shapes": [list(k) for k in shapes],
+        "upcoming_events": events,
+        "dashboard": payload.get("dashboard", {}),
+        "extra": {k: v for k, v in payload.items() if k not in ("results", "dashboard")},
+    }, default=_default, use_bin_type=True)
+
+
+def _decode_arrow(msg: Dict[str, Any]) -> Dict[str, Any]:
+    pa = _pyarrow()
+    results = pa.ipc.open_stream(msg["results"]).read_all().to_pylist()
+    shapes = msg["event_shapes"]
+    for row, events in zip(results, msg["upcoming_events"]):
+        row["upcoming_events"] = [dict(zip(shapes[ev[0]], ev[1:])) for ev in events]
+    return {"results": results, "dashboard": msg["dashboard"], **msg.get("extra", {})}
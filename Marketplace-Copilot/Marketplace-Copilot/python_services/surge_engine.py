@@ -2,15 +2,26 @@ import os
 import sys
 import json
 import math
+import base64
+import ctypes
+import heapq
+import hashlib
+import time
+import tempfile
+import zipfile
 import logging
+import functools
+import itertools
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from surge_profile import active, profiler_for, profiling, reset_in_worker
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,6 +29,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("surge_engine")
 
+# (lead_time, safety_stock) pair; safety_stock None means 20% of lead-time base demand
+Scenario = Tuple[int, Optional[int]]
+
 
 DEFAULTS = {
     "spike_sigma": 2.0,
@@ -32,48 +46,343 @@ DEFAULTS = {
 }
 
 
-def parse_args() -> Dict[str, Any]:
+def parse_args(argv: Optional[List[str]] = None) -> Dict[str, Any]:
     args = {
         "user_id": None,
         "lead_time": 14,
         "safety_stock": None,
-        "sku": None
+        "scenarios": None,
+        "sku": None,
+        "engine": "sku",
+        "decomp": "exact",
+        "workers": 1,
+        "state_dir": None,
+        "source": "auto",
+        "memory_mb": None,
+        "series_store": False,
+        "series_dir": None,
+        "deadline_ms": None,
+        "intermittent": False,
+        "stream": False,
+        "format": "json",
+        "profile": None,
+        "cprofile": None,
+        "serve": False
     }
-    for a in sys.argv[1:]:
-        if a.startswith("--user="):
+    leads: List[Optional[int]] = [args["lead_time"]]
+    safeties: List[Optional[int]] = [args["safety_stock"]]
+    for a in (sys.argv[1:] if argv is None else argv):
+        if a == "--serve":
+            args["serve"] = True
+        elif a == "--stream":
+            args["stream"] = True
+        elif a.startswith("--user="):
             args["user_id"] = a.split("=", 1)[1]
         elif a.startswith("--lead="):
-            args["lead_time"] = int(a.split("=", 1)[1])
+            leads = scenario_values(a.split("=", 1)[1])
         elif a.startswith("--safety="):
-            args["safety_stock"] = int(a.split("=", 1)[1])
+            safeties = scenario_values(a.split("=", 1)[1], allow_auto=True)
         elif a.startswith("--sku="):
             args["sku"] = a.split("=", 1)[1]
+        elif a.startswith("--engine="):
+            args["engine"] = a.split("=", 1)[1]
+        elif a.startswith("--decomp="):
+            args["decomp"] = a.split("=", 1)[1]
+        elif a.startswith("--workers="):
+            args["workers"] = max(1, int(a.split("=", 1)[1]))
+        elif a.startswith("--state-dir="):
+            args["state_dir"] = a.split("=", 1)[1]
+        elif a.startswith("--source="):
+            args["source"] = a.split("=", 1)[1]
+        elif a.startswith("--memory-mb="):
+            args["memory_mb"] = int(a.split("=", 1)[1])
+        elif a == "--series-store":
+            args["series_store"] = True
+        elif a.startswith("--series-dir="):
+            args["series_store"] = True
+            args["series_dir"] = a.split("=", 1)[1]
+        elif a.startswith("--deadline-ms="):
+            args["deadline_ms"] = int(a.split("=", 1)[1])
+        elif a == "--intermittent":
+            args["intermittent"] = True
+        elif a.startswith("--format="):
+            args["format"] = a.split("=", 1)[1]
+        elif a == "--profile":
+            args["profile"] = "time"
+        elif a.startswith("--profile="):
+            args["profile"] = a.split("=", 1)[1]
+        elif a.startswith("--cprofile="):
+            args["cprofile"] = a.split("=", 1)[1]
+    set_scenarios(args, leads, safeties)
     return args
 
 
+def scenario_values(value: Any, allow_auto: bool = False) -> List[Optional[int]]:
+    """'7,14,21', [7, 14, 21] or a single value -> list of ints; with allow_auto, 'auto'/None entries stay None."""
+    items = value.split(",") if isinstance(value, str) else (value if isinstance(value, list) else [value])
+    out: List[Optional[int]] = []
+    for v in items:
+        if allow_auto and (v is None or str(v).strip().lower() == "auto"):
+            out.append(None)
+        else:
+            out.append(int(v))
+    if not out:
+        raise ValueError(f"Empty scenario list: {value!r}")
+    return out
+
+
+def set_scenarios(args: Dict[str, Any], leads: List[Optional[int]], safeties: List[Optional[int]]):
+    """
+    The first lead time and safety value fill the scalar lead_time/safety_stock
+    fields; with more than one value, args["scenarios"] lists every
+    (lead_time, safety_stock) pair, lead-major.
+    """
+    args["lead_time"] = leads[0]
+    args["safety_stock"] = safeties[0]
+    pairs = [(lt, ss) for lt in leads for ss in safeties]
+    args["scenarios"] = pairs if len(pairs) > 1 else None
+
+
+def request_to_args(req: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a worker request {user, lead, safety, sku} onto parse_args() keys; lead and safety may be lists."""
+    args = parse_args([])
+    args["user_id"] = req.get("user") or None
+    leads = scenario_values(req["lead"]) if req.get("lead") is not None else [args["lead_time"]]
+    safeties = scenario_values(req["safety"], allow_auto=True) if req.get("safety") is not None else [None]
+    set_scenarios(args, leads, safeties)
+    args["sku"] = req.get("sku") or None
+    args["engine"] = req.get("engine") or args["engine"]
+    args["decomp"] = req.get("decomp") or args["decomp"]
+    args["source"] = req.get("source") or args["source"]
+    if req.get("memory_mb") is not None:
+        args["memory_mb"] = int(req["memory_mb"])
+    args["series_store"] = bool(req.get("series_store"))
+    if req.get("deadline_ms") is not None:
+        args["deadline_ms"] = int(req["deadline_ms"])
+    args["intermittent"] = bool(req.get("intermittent"))
+    args["stream"] = bool(req.get("stream"))
+    args["format"] = req.get("format") or args["format"]
+    if req.get("profile"):
+        args["profile"] = "memory" if req["profile"] == "memory" else "time"
+    if req.get("workers") is not None:
+        args["workers"] = max(1, int(req["workers"]))
+    return args
+
+
+# Set by serve() so warm workers reuse one connection across requests
+_keep_conn = False
+_shared_conn = None
+
+
 def get_conn():
+    global _shared_conn
+    if _keep_conn and _shared_conn is not None and not _shared_conn.closed:
+        return _shared_conn
     dsn = os.environ.get("DATABASE_URL")
     if not dsn:
         return None
     try:
-        return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+        conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
     except Exception as e:
         logger.warning("DB connection failed: %s", e)
         return None
+    if _keep_conn:
+        _shared_conn = conn
+    return conn
 
 
 def project_data_dir() -> str:
+    # SURGE_DATA_DIR points CSV fallbacks and state at another directory (benchmarks, fixtures)
+    override = os.environ.get("SURGE_DATA_DIR")
+    if override:
+        return override
     base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base, "data")
 
 
-def parse_sales_csv(path: str) -> pd.DataFrame:
-    try:
-        df = pd.read_csv(path)
-    except Exception as e:
-        logger.warning("Failed to read %s: %s", path, e)
-        return pd.DataFrame(columns=["sku", "date", "units"])
-    cols = {c.lower(): c for c in df.columns}
+# Rows per read_csv chunk; each chunk is reduced to int32 columns before the next is read
+CSV_CHUNK_ROWS = 1_000_000
+# Bump when read_sales_csv() output changes so cached copies are rebuilt
+SALES_CACHE_VERSION = 3
+# Transient cost of one in-flight input row: read_csv's tokenizer buffers and category codes (or
+# fetched tuples), the packed keys and sort order folding it, the reduced rows pending a merge and
+# the runs a merge rewrites. bench_out_of_core measures about 110 bytes; doubled for headroom.
+BYTES_PER_CHUNK_ROW = 200
+# Part of a --memory-mb budget taken whatever the chunk size (read_csv's fixed buffers, the cache
+# writer's column, allocator slack); bench_out_of_core measures 8-11 MB
+FIXED_MEMORY_MB = 12
+# Smallest --memory-mb the chunked loaders hold to: leaves 4 MB (about 20k rows) for chunks
+MIN_MEMORY_MB = 16
+
+
+def chunk_rows_for_budget(memory_mb: int) -> int:
+    """Input rows per chunk (and per DailyUnits merge) that keep a --memory-mb budget."""
+    if int(memory_mb) < MIN_MEMORY_MB:
+        raise ValueError(f"--memory-mb={memory_mb} is below the {MIN_MEMORY_MB} MB the chunked loaders need")
+    return (int(memory_mb) - FIXED_MEMORY_MB) * 2**20 // BYTES_PER_CHUNK_ROW
+
+
+class DailyUnits:
+    """
+    Folds (code, day, units) chunks into per-(code, day) unit sums, so memory
+    follows the number of distinct SKU-days rather than the number of input
+    rows. Each chunk is reduced on arrival and the reduced chunks are merged
+    once `compact_rows` of them are pending. The sums are held as sorted,
+    disjoint runs of at most 2 * compact_rows keys, so a merge rewrites one run
+    at a time (searchsorted + insert, no re-sort) and its transient memory
+    follows compact_rows rather than the sums. Chunks that arrive already
+    folded and past every key held (an export read back from its cache) are
+    kept as new runs without a merge.
+    """
+
+    def __init__(self, compact_rows: int = CSV_CHUNK_ROWS):
+        self.compact_rows = max(1, compact_rows)
+        self._runs: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._pending_rows = 0
+
+    def __len__(self) -> int:
+        self._compact()
+        return sum(len(k) for k, _ in self._runs)
+
+    @staticmethod
+    def _sum_by_key(keys: np.ndarray, units: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(keys):
+            return keys, units
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(keys)) + 1]
+        return keys[starts], np.add.reduceat(units[order], starts, dtype=np.int32)
+
+    def add(self, codes: np.ndarray, days: np.ndarray, units: np.ndarray):
+        # Inputs larger than a chunk (e.g. a whole cached export) are folded a chunk at a time
+        for lo in range(0, len(codes), self.compact_rows):
+            hi = lo + self.compact_rows
+            # Code in the high 32 bits, day offset to unsigned in the low 32, so keys sort by (code, day)
+            keys = codes[lo:hi].astype(np.int64)
+            keys <<= 32
+            offset = days[lo:hi].astype(np.int64)
+            offset += 2**31
+            keys |= offset
+            del offset
+            sums = units[lo:hi].astype(np.int32)
+            if (not self._pending and len(keys)
+                    and (not self._runs or keys[0] > self._runs[-1][0][-1]) and (keys[1:] > keys[:-1]).all()):
+                self._runs.append((keys, sums))
+                continue
+            keys, sums = self._sum_by_key(keys, sums)
+            self._pending.append((keys, sums))
+            self._pending_rows += len(keys)
+            if self._pending_rows >= self.compact_rows:
+                self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        keys, units = self._sum_by_key(
+            np.concatenate([k for k, _ in self._pending]),
+            np.concatenate([u for _, u in self._pending]),
+        )
+        self._pending, self._pending_rows = [], 0
+        if not self._runs:
+            self._runs = [(keys, units)]
+            return
+        # Keys before the first run go to it, keys past the last run to the last
+        cuts = np.searchsorted(keys, [k[0] for k, _ in self._runs[1:]])
+        # Taken off the old list one at a time so each rewritten run is freed before the next merge
+        old, runs = self._runs[::-1], []
+        self._runs = []
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(keys)]):
+            run_keys, run_units = old.pop()
+            if lo < hi:
+                run_keys, run_units = self._merge(run_keys, run_units, keys[lo:hi], units[lo:hi])
+            if len(run_keys) <= 2 * self.compact_rows:
+                runs.append((run_keys, run_units))
+                continue
+            for s in range(0, len(run_keys), self.compact_rows):
+                runs.append((run_keys[s:s + self.compact_rows].copy(), run_units[s:s + self.compact_rows].copy()))
+        self._runs = runs
+
+    @staticmethod
+    def _merge(run_keys: np.ndarray, run_units: np.ndarray, keys: np.ndarray, units: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        pos = np.searchsorted(run_keys, keys)
+        hit = pos < len(run_keys)
+        hit[hit] = run_keys[pos[hit]] == keys[hit]
+        # Reduced keys are unique, so the hit positions are too
+        run_units[pos[hit]] += units[hit]
+        new = ~hit
+        if new.any():
+            run_keys = np.insert(run_keys, pos[new], keys[new])
+            run_units = np.insert(run_units, pos[new], units[new])
+        return run_keys, run_units
+
+    def columns(self, rank: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+        """
+        The sums as whole int32 columns, codes then days then units, one row
+        per (code, day) sorted by code then day. With `rank` (a permutation of
+        the codes, e.g. each label's place in sorted order) code c becomes
+        rank[c] and rows follow the new codes. Each column is assembled from
+        the runs before the next, so only one is held beside the sums.
+        """
+        n = len(self)
+        if rank is not None:
+            rank = np.asarray(rank, dtype=np.int64)
+            counts = np.zeros(len(rank), dtype=np.int64)
+            for keys, _ in self._runs:
+                counts += np.bincount(keys >> 32, minlength=len(rank))
+            ranked = np.zeros_like(counts)
+            ranked[rank] = counts
+            # Row i of old code c moves to i + shift[c]
+            shift = (np.cumsum(ranked) - ranked)[rank] - (np.cumsum(counts) - counts)
+        for column in range(3):
+            out = np.empty(n, dtype=np.int32)
+            pos = 0
+            for keys, units in self._runs:
+                if column == 0:
+                    values = keys >> 32 if rank is None else rank[keys >> 32]
+                elif column == 1:
+                    values = (keys & 0xFFFFFFFF) - 2**31
+                else:
+                    values = units
+                if rank is None:
+                    out[pos:pos + len(keys)] = values
+                else:
+                    dest = np.arange(pos, pos + len(keys))
+                    dest += shift[keys >> 32]
+                    out[dest] = values
+                pos += len(keys)
+                del values
+            yield out
+            del out
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (codes, days, units) int32 columns, one row per (code, day), sorted by
+        code then day. Hands the sums over, leaving the accumulator empty.
+        """
+        codes, days, units = self.columns()
+        self._runs = []
+        return codes, days, units
+
+    def drain(self) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        The sums as (codes, days, units) int32 slices, one run at a time in
+        (code, day) order, each run dropped once handed over.
+        """
+        self._compact()
+        runs, self._runs = self._runs[::-1], []
+        while runs:
+            keys, units = runs.pop()
+            yield (keys >> 32).astype(np.int32), ((keys & 0xFFFFFFFF) - 2**31).astype(np.int32), units
+            del keys, units
+
+
+_SALES_COLUMNS = ("codes", "days", "units")
+
+
+def sales_csv_columns(path: str) -> Optional[Tuple[str, str, str]]:
+    """The (sku, date, units) column names of a sales export, from its header row."""
+    cols = {c.lower(): c for c in pd.read_csv(path, nrows=0).columns}
     def pick(*names):
         for n in names:
             if n in cols:
@@ -83,64 +392,519 @@ def parse_sales_csv(path: str) -> pd.DataFrame:
     date_col = pick("date", "order_date")
     units_col = pick("units_sold", "quantity", "units")
     if not (sku_col and date_col and units_col):
-        return pd.DataFrame(columns=["sku", "date", "units"])
-    out = pd.DataFrame({
-        "sku": df[sku_col],
-        "date": pd.to_datetime(df[date_col], errors="coerce"),
-        "units": pd.to_numeric(df[units_col], errors="coerce")
-    })
-    out = out.dropna(subset=["sku", "date", "units"])
-    out["date"] = out["date"].dt.date
-    out["units"] = out["units"].astype(int)
-    return out
+        return None
+    return sku_col, date_col, units_col
 
 
-def load_sales_from_csv(sku_filter: Optional[str]) -> pd.DataFrame:
+def read_sales_csv(path: str, chunk_rows: int = CSV_CHUNK_ROWS) -> Optional[Tuple[np.ndarray, DailyUnits]]:
+    """
+    One sales export, dictionary-encoded: its SKU labels and a DailyUnits of
+    int32 codes into them, days since 1970-01-01 and units, one row per
+    (sku, day) with units summed. Only the three needed columns are read, all as
+    categoricals, so each distinct date or quantity string is parsed once, and
+    each chunk of `chunk_rows` is folded into the per-day sums before the next is
+    read. Rows with a missing or unparseable sku, date or units are dropped;
+    fractional units are truncated.
+    """
+    try:
+        picked = sales_csv_columns(path)
+        if picked is None:
+            return None
+        sku_col, date_col, units_col = picked
+        label_index: Dict[str, int] = {}
+        acc = DailyUnits(chunk_rows)
+        reader = pd.read_csv(
+            path, usecols=list(picked), chunksize=chunk_rows,
+            dtype={sku_col: "category", date_col: "category", units_col: "category"}
+        )
+        for chunk in reader:
+            sku, date, units = chunk[sku_col].cat, chunk[date_col].cat, chunk[units_col].cat
+            parsed = pd.to_datetime(pd.Series(date.categories), errors="coerce")
+            # Trailing entries catch code -1 (missing value)
+            cat_days = np.r_[parsed.values.astype("datetime64[D]").astype(np.int64), 0]
+            cat_units = np.r_[pd.to_numeric(pd.Series(units.categories), errors="coerce").to_numpy(dtype=np.float64), np.nan]
+            cat_label = np.array([label_index.setdefault(c, len(label_index)) for c in sku.categories], dtype=np.int32)
+            sc, dc, uc = sku.codes, date.codes, units.codes
+            keep = (sc >= 0) & np.r_[parsed.notna().to_numpy(), False][dc] & ~np.isnan(cat_units[uc])
+            acc.add(cat_label[sc[keep]], cat_days[dc[keep]], cat_units[uc[keep]].astype(np.int32))
+            active().count("rows_read", len(chunk))
+            del chunk
+            _release_freed_memory()
+    except Exception as e:
+        logger.warning("Failed to read %s: %s", path, e)
+        return None
+    if not label_index:
+        return None
+    return np.array(list(label_index), dtype=str), acc
+
+
+def _release_freed_memory():
+    """
+    Hand freed heap memory back to the OS (glibc's malloc_trim). glibc keeps
+    the parser's and the sums' freed chunks for reuse, and the frame's large
+    columns are mapped separately, so without this a load holds both; a no-op
+    where the call is unavailable.
+    """
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def sales_cache_dir() -> str:
+    return os.path.join(project_data_dir(), ".surge_cache")
+
+
+def _write_sales_cache(f, key: str, labels: np.ndarray, rows: int, columns: Iterable[np.ndarray]):
+    """
+    Write a sales cache in np.savez's layout. The int32 (codes, days, units)
+    columns come from an iterator, so each is written before the next is built.
+    """
+    header = np.lib.format.header_data_from_array_1_0(np.empty(0, dtype=np.int32))
+    header["shape"] = (rows,)
+    with zipfile.ZipFile(f, "w", allowZip64=True) as zf:
+        for name, arr in (("key", np.array(key)), ("labels", labels), ("rows", np.array(rows))):
+            with zf.open(name + ".npy", "w", force_zip64=True) as m:
+                np.lib.format.write_array(m, arr, allow_pickle=False)
+        columns = iter(columns)
+        for name in _SALES_COLUMNS:
+            # next() rather than zip(), whose reused result tuple would hold this column while the next is built
+            column = next(columns)
+            with zf.open(name + ".npy", "w", force_zip64=True) as m:
+                np.lib.format.write_array_header_1_0(m, header)
+                m.write(column.data)
+            del column
+
+
+def _cached_slices(cache_path: str, rows: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(codes, days, units) slices of `rows` rows from a sales cache, read from its .npy members rather than loaded whole."""
+    with zipfile.ZipFile(cache_path) as zf:
+        members = [zf.open(name + ".npy") for name in _SALES_COLUMNS]
+        try:
+            dtypes = []
+            for m in members:
+                version = np.lib.format.read_magic(m)
+                read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+                (n,), _, dtype = read_header(m)
+                dtypes.append(dtype)
+            for lo in range(0, n, rows):
+                k = min(rows, n - lo)
+                yield tuple(np.frombuffer(m.read(k * dtype.itemsize), dtype=dtype) for m, dtype in zip(members, dtypes))
+        finally:
+            for m in members:
+                m.close()
+
+
+def cached_sales_csv(path: str, chunk_rows: int = CSV_CHUNK_ROWS) -> Optional[Tuple[np.ndarray, int, Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]]]:
+    """
+    read_sales_csv() through a columnar .npz copy in data/.surge_cache, keyed by
+    the export's absolute path, size and mtime, so unchanged exports are parsed
+    once. Returns the sorted SKU labels, the row count and the (codes, days,
+    units) rows in (label, day) order as slices of `chunk_rows`, streamed from
+    the cache rather than loaded whole.
+    """
+    prof = active()
+    st = os.stat(path)
+    key = json.dumps({
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "version": SALES_CACHE_VERSION,
+    }, sort_keys=True)
+    cache_dir = sales_cache_dir()
+    cache_path = os.path.join(cache_dir, hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16] + ".npz")
+    try:
+        with np.load(cache_path, allow_pickle=False) as z:
+            if str(z["key"]) == key:
+                prof.count("sales_cache_hits")
+                return z["labels"], int(z["rows"]), _cached_slices(cache_path, chunk_rows)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Ignoring unreadable sales cache %s: %s", cache_path, e)
+
+    prof.count("sales_cache_misses")
+    parsed = read_sales_csv(path, chunk_rows)
+    if parsed is None:
+        return None
+    labels, acc = parsed
+    # Codes follow sorted label order in the cache, so loading it needs no re-sort
+    order = np.argsort(labels, kind="stable")
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[order] = np.arange(len(labels))
+    labels, rows = labels[order], len(acc)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            _write_sales_cache(f, key, labels, rows, acc.columns(rank))
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        logger.warning("Could not write sales cache %s: %s", cache_path, e)
+        return labels, rows, [tuple(acc.columns(rank))]
+    del acc, parsed
+    _release_freed_memory()
+    return labels, rows, _cached_slices(cache_path, chunk_rows)
+
+
+def load_sales_from_csv(sku_filter: Optional[str], chunk_rows: int = CSV_CHUNK_ROWS, since_day: Optional[int] = None) -> pd.DataFrame:
+    """
+    Sales from every *sales.csv export in the data directory, folded to one row
+    per (sku, day); peak memory depends on chunk_rows and distinct SKU-days,
+    not on the number of order rows. `since_day` keeps days on or after that
+    day number (days since 1970-01-01).
+    """
     ddir = project_data_dir()
     if not os.path.isdir(ddir):
         logger.warning("Data directory not found at %s", ddir)
         return pd.DataFrame(columns=["sku", "date", "units"])
     files = []
-    for name in os.listdir(ddir):
+    for name in sorted(os.listdir(ddir)):
         if name.endswith("_sales.csv") or name.endswith("sales.csv"):
             files.append(os.path.join(ddir, name))
-    frames = [parse_sales_csv(f) for f in files]
-    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["sku", "date", "units"])
+    parts = [part for part in (cached_sales_csv(f, chunk_rows) for f in files) if part is not None]
+    if not parts:
+        return pd.DataFrame(columns=["sku", "date", "units"])
+    skus = np.unique(np.concatenate([labels for labels, _, _ in parts]))
+    if len(parts) == 1 and not sku_filter and since_day is None:
+        # One export's cache is already folded and in (sku, day) order
+        _, rows, slices = parts[0]
+        return folded_sales_frame(skus, rows, slices)
+    # The same SKU may appear in several marketplace exports, so fold across files too
+    acc = DailyUnits(chunk_rows)
+    for labels, _, slices in parts:
+        to_sku = np.searchsorted(skus, labels).astype(np.int32)
+        wanted = np.flatnonzero(labels == sku_filter) if sku_filter else None
+        if wanted is not None and not len(wanted):
+            continue
+        # Filters apply to each slice, so the rows they drop are never folded
+        for codes, days, units in slices:
+            if wanted is not None or since_day is not None:
+                keep = np.isin(codes, wanted) if wanted is not None else np.ones(len(codes), dtype=bool)
+                if since_day is not None:
+                    keep &= days >= since_day
+                codes, days, units = codes[keep], days[keep], units[keep]
+            acc.add(to_sku[codes], days, units)
+    return folded_sales_frame(skus, len(acc), acc.drain())
+
+
+# Rows pulled per round trip by the streaming sales loader
+SALES_CHUNK_ROWS = 100_000
+
+
+def sales_frame(codes: np.ndarray, labels: np.ndarray, days: np.ndarray, units: np.ndarray) -> pd.DataFrame:
+    """
+    Build the (sku, date, units) frame from dictionary-encoded columns: `codes`
+    index into `labels` and `days` are int32 days since 1970-01-01. The SKU
+    column is categorical over the observed SKUs only, rows are sorted by
+    (sku, date), and the int32 day numbers are kept in a `day` column.
+    """
+    if not len(codes):
+        return pd.DataFrame(columns=["sku", "date", "units"])
+    # Several product ids can share a SKU (one listing per marketplace)
+    skus, label_code = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+    present = np.bincount(label_code[np.unique(codes)], minlength=len(skus)) > 0
+    codes = (np.cumsum(present) - 1).astype(np.int32)[label_code][codes]
+    order = np.lexsort((days, codes))
+    days = days[order]
+    # Every column is a fresh array here, so let the frame take them without another copy
+    return pd.DataFrame({
+        "sku": pd.Categorical.from_codes(codes[order], skus[present]),
+        "date": days.astype("datetime64[D]"),
+        "day": days,
+        "units": units[order]
+    }, copy=False)
+
+
+def folded_sales_frame(skus: np.ndarray, rows: int, slices: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> pd.DataFrame:
+    """
+    sales_frame() for `rows` rows that arrive as (codes, days, units) slices
+    already folded and in (code, day) order, with `skus` sorted and unique
+    (DailyUnits.drain(), a cached export). Each slice is copied straight into
+    the frame's columns, so no more than the frame and one slice are held.
+    """
+    if not rows:
+        return pd.DataFrame(columns=["sku", "date", "units"])
+    # The narrowest type pandas keeps category codes in, so from_codes takes them as they are
+    codes = np.empty(rows, dtype=next(t for t in (np.int8, np.int16, np.int32, np.int64) if len(skus) < np.iinfo(t).max))
+    days = np.empty(rows, dtype=np.int32)
+    units = np.empty(rows, dtype=np.int32)
+    counts = np.zeros(len(skus), dtype=np.int64)
+    pos = 0
+    for c, d, u in slices:
+        codes[pos:pos + len(c)] = c
+        days[pos:pos + len(c)] = d
+        units[pos:pos + len(c)] = u
+        counts += np.bincount(c, minlength=len(skus))
+        pos += len(c)
+    present = counts > 0
+    if not present.all():
+        to_present = (np.cumsum(present) - 1).astype(codes.dtype)
+        for lo in range(0, rows, CSV_CHUNK_ROWS):
+            codes[lo:lo + CSV_CHUNK_ROWS] = to_present[codes[lo:lo + CSV_CHUNK_ROWS]]
+    # Seconds since the epoch, scaled in place: the datetime64[s] pandas would convert day dates to
+    date = days.astype(np.int64)
+    date *= 86400
+    return pd.DataFrame({
+        "sku": pd.Categorical.from_codes(codes, np.asarray(skus, dtype=object)[present]),
+        "date": date.view("datetime64[s]"),
+        "day": days,
+        "units": units
+    }, copy=False)
+
+
+def _stream_coded(conn, dict_query: str, rows_query: str, params: List[Any], chunk_rows: int, cursor_name: str, fold: bool = False,
+                  dict_params: Optional[List[Any]] = None, lookup_query: Optional[str] = None) -> pd.DataFrame:
+    """
+    Run `dict_query` -> (key, sku) rows (with `dict_params`, default `params`),
+    then stream `rows_query` -> (key, day number, units) through a named
+    (server-side) cursor in chunks of `chunk_rows`, packing each chunk into
+    int32 arrays so the client never holds the full result set as Python
+    objects. Keys a chunk brings that the dictionary lacks are looked up with
+    `lookup_query` (taking an array of keys) when given. With `fold`, each
+    chunk is summed
+    into per-(sku, day) totals instead of kept, so memory no longer grows with
+    the number of rows.
+    """
+    acc = DailyUnits(chunk_rows) if fold else None
+    code_parts: List[np.ndarray] = []
+    day_parts: List[np.ndarray] = []
+    unit_parts: List[np.ndarray] = []
+    # Folded SKUs found by lookups, numbered after the dictionary's sorted ones
+    extra: Dict[str, int] = {}
+    with conn:
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute(dict_query, params if dict_params is None else dict_params)
+            entries = cur.fetchall()
+        key_index = pd.Index([r[0] for r in entries])
+        labels = np.array([r[1] for r in entries], dtype=object)
+        if acc is not None:
+            # Fold on SKUs rather than keys: several product ids can share a SKU
+            labels, key_to_sku = np.unique(labels, return_inverse=True)
+            key_to_sku = key_to_sku.astype(np.int32)
+        if entries or lookup_query is not None:
+            with conn.cursor(name=cursor_name, cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.itersize = chunk_rows
+                cur.execute(rows_query, params)
+                while True:
+                    rows = cur.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    active().count("rows_read", len(rows))
+                    keys, days, units = zip(*rows)
+                    del rows
+                    codes = key_index.get_indexer(keys)
+                    if lookup_query is not None and (codes < 0).any():
+                        missing = sorted({k for k, c in zip(keys, codes.tolist()) if c < 0})
+                        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as lookup:
+                            lookup.execute(lookup_query, [missing])
+                            found = lookup.fetchall()
+                        key_index = key_index.append(pd.Index([r[0] for r in found]))
+                        found_labels = np.array([r[1] for r in found], dtype=object)
+                        if acc is None:
+                            labels = np.concatenate([labels, found_labels])
+                        else:
+                            at = np.searchsorted(labels, found_labels).tolist()
+                            found_codes = [i if i < len(labels) and labels[i] == sku else extra.setdefault(sku, len(labels) + len(extra))
+                                           for i, sku in zip(at, found_labels)]
+                            key_to_sku = np.concatenate([key_to_sku, np.array(found_codes, dtype=np.int32)])
+                        codes = key_index.get_indexer(keys)
+                    codes = codes.astype(np.int32)
+                    if acc is not None:
+                        acc.add(key_to_sku[codes], np.array(days, dtype=np.int32), np.array(units, dtype=np.int32))
+                        continue
+                    code_parts.append(codes)
+                    day_parts.append(np.array(days, dtype=np.int32))
+                    unit_parts.append(np.array(units, dtype=np.int32))
+
+    if acc is not None:
+        if not extra:
+            return folded_sales_frame(labels, len(acc), acc.drain())
+        # Renumber into sorted SKU order; only the rare lookup case holds whole columns
+        labels = np.concatenate([labels, np.array(list(extra), dtype=object)])
+        skus = np.sort(labels)
+        return folded_sales_frame(skus, len(acc), [tuple(acc.columns(np.searchsorted(skus, labels)))])
+    if not code_parts:
+        return sales_frame(np.empty(0, np.int32), labels, np.empty(0, np.int32), np.empty(0, np.int32))
+    return sales_frame(np.concatenate(code_parts), labels, np.concatenate(day_parts), np.concatenate(unit_parts))
+
+
+def stream_sales(conn, user_id: Optional[str], sku_filter: Optional[str], chunk_rows: int = SALES_CHUNK_ROWS, fold: bool = False, since_day: Optional[int] = None) -> pd.DataFrame:
+    """
+    Stream raw sale rows as (product_id, day number, units) integer tuples;
+    product ids are mapped to SKUs with a separate dictionary query on the
+    user's products (by user_id, index-backed), so sales are scanned only once.
+    Sales of products outside it (another account's, or without an owner) are
+    still included, as in the join: their ids are looked up as they arrive.
+    """
+    product_where = " WHERE 1=1"
+    product_params: List[Any] = []
+    if user_id:
+        product_where += " AND p.user_id = %s"
+        product_params.append(user_id)
+    if sku_filter:
+        product_where += " AND p.sku = %s"
+        product_params.append(sku_filter)
+    where = " WHERE 1=1"
+    params: List[Any] = []
+    if user_id:
+        where += " AND s.user_id = %s"
+        params.append(user_id)
     if sku_filter:
-        df = df[df["sku"] == sku_filter]
-    df = df.sort_values(["sku", "date"])
-    return df
+        where += " AND p.sku = %s"
+        params.append(sku_filter)
+    if since_day is not None:
+        where += " AND s.date::date >= DATE '1970-01-01' + %s"
+        params.append(int(since_day))
+    return _stream_coded(
+        conn,
+        "SELECT p.id, p.sku FROM products p" + product_where,
+        "SELECT s.product_id, s.date::date - DATE '1970-01-01' AS day, COALESCE(s.quantity::int, 0) AS units"
+        " FROM sales s JOIN products p ON p.id = s.product_id" + where,
+        params, chunk_rows, "surge_sales_stream", fold, dict_params=product_params,
+        lookup_query="SELECT p.id, p.sku FROM products p WHERE p.id = ANY(%s)"
+    )
+
+
+def stream_daily_sales(conn, user_id: Optional[str], sku_filter: Optional[str], chunk_rows: int = SALES_CHUNK_ROWS, fold: bool = False, since_day: Optional[int] = None) -> pd.DataFrame:
+    """
+    Stream the daily_sales rollup (one row per user, sku and day, maintained by
+    triggers on sales; see migrations/init.sql) in the same frame layout as
+    stream_sales().
+    """
+    where = " WHERE 1=1"
+    params: List[Any] = []
+    if user_id:
+        where += " AND d.user_id = %s"
+        params.append(user_id)
+    if sku_filter:
+        where += " AND d.sku = %s"
+        params.append(sku_filter)
+    if since_day is not None:
+        where += " AND d.day >= DATE '1970-01-01' + %s"
+        params.append(int(since_day))
+    return _stream_coded(
+        conn,
+        "SELECT DISTINCT d.sku, d.sku FROM daily_sales d" + where,
+        "SELECT d.sku, d.day - DATE '1970-01-01' AS day, d.units FROM daily_sales d" + where,
+        params, chunk_rows, "surge_daily_sales_stream", fold
+    )
+
+
+def has_daily_rollup(conn) -> bool:
+    with conn:
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute("SELECT to_regclass('daily_sales') IS NOT NULL")
+            return bool(cur.fetchone()[0])
 
 
-def fetch_sales(user_id: Optional[str], sku_filter: Optional[str]) -> pd.DataFrame:
+def fetch_sales(user_id: Optional[str], sku_filter: Optional[str], source: str = "auto", memory_mb: Optional[int] = None, since_day: Optional[int] = None) -> pd.DataFrame:
+    """
+    Load (sku, date, units) rows. `source` is "rollup" (daily_sales), "sales"
+    (raw sale rows) or "auto" (the rollup when the table exists). With
+    `memory_mb`, input is read in chunks sized to that budget and folded into
+    per-(sku, day) totals as it arrives (out-of-core). `since_day` (days since
+    1970-01-01) skips older sales.
+    """
     conn = get_conn()
     if conn is None:
         logger.info("No DB connection available. Falling back to CSV sales.")
-        return load_sales_from_csv(sku_filter)
-    q = """
-    SELECT p.sku, s.date::date AS date, s.quantity::int AS units
-    FROM sales s
-    JOIN products p ON p.id = s.product_id
-    WHERE 1=1
+        chunk_rows = chunk_rows_for_budget(memory_mb) if memory_mb else CSV_CHUNK_ROWS
+        return load_sales_from_csv(sku_filter, chunk_rows, since_day)
+    chunk_rows = chunk_rows_for_budget(memory_mb) if memory_mb else SALES_CHUNK_ROWS
+    fold = bool(memory_mb)
+    if source == "rollup" or (source == "auto" and has_daily_rollup(conn)):
+        return stream_daily_sales(conn, user_id, sku_filter, chunk_rows, fold, since_day)
+    return stream_sales(conn, user_id, sku_filter, chunk_rows, fold, since_day)
+
+
+def _sales_cells(user_id: Optional[str], source: str, until_day: Optional[int]) -> Tuple[Any, str, List[Any]]:
     """
+    (connection, query, params) selecting the (sku, day, units) cells fetch_sales()
+    would return, summed per SKU and day, before `until_day` when given; the
+    connection is None without a database, and the query is then empty.
+    """
+    conn = get_conn()
+    if conn is None:
+        return None, "", []
+    where = " WHERE 1=1"
     params: List[Any] = []
+    if source == "rollup" or (source == "auto" and has_daily_rollup(conn)):
+        if user_id:
+            where += " AND d.user_id = %s"
+            params.append(user_id)
+        if until_day is not None:
+            where += " AND d.day < DATE '1970-01-01' + %s"
+            params.append(int(until_day))
+        return conn, "SELECT d.sku, d.day - DATE '1970-01-01' AS day, SUM(d.units) AS units FROM daily_sales d" + where + " GROUP BY 1, 2", params
     if user_id:
-        q += " AND s.user_id = %s"
+        where += " AND s.user_id = %s"
         params.append(user_id)
-    if sku_filter:
-        q += " AND p.sku = %s"
-        params.append(sku_filter)
-    q += " ORDER BY p.sku, s.date::date"
+    if until_day is not None:
+        where += " AND s.date::date < DATE '1970-01-01' + %s"
+        params.append(int(until_day))
+    return conn, ("SELECT p.sku, s.date::date - DATE '1970-01-01' AS day, SUM(COALESCE(s.quantity::int, 0)) AS units"
+                  " FROM sales s JOIN products p ON p.id = s.product_id" + where + " GROUP BY 1, 2"), params
+
+
+def _csv_cells(until_day: Optional[int]) -> pd.DataFrame:
+    """_sales_cells() for the CSV exports: the folded (sku, day, units) rows before `until_day`."""
+    sales_df = load_sales_from_csv(None)
+    if not len(sales_df):
+        return pd.DataFrame({"sku": pd.Series(dtype=str), "day": pd.Series(dtype=np.int64), "units": pd.Series(dtype=np.int64)})
+    cells = sales_df[["sku", "day", "units"]]
+    return cells if until_day is None else cells[cells["day"] < until_day]
+
+
+def fetch_day_totals(user_id: Optional[str], source: str = "auto", until_day: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-day totals of the sales fetch_sales() would return: (day numbers, units,
+    SKUs with non-zero units that day), sorted by day, only days before
+    `until_day` when given. Summed in the database, so a copy of the sales (the
+    series store) can find the first day that changed without re-reading rows.
+    """
+    conn, cells, params = _sales_cells(user_id, source, until_day)
+    if conn is None:
+        cells_df = _csv_cells(until_day)
+        days = cells_df["day"].to_numpy()
+        units = cells_df["units"].to_numpy()
+        # One row per (sku, day) here, as in the database's inner grouping
+        day_list, at = np.unique(days, return_inverse=True)
+        return (day_list.astype(np.int64), np.bincount(at, weights=units, minlength=len(day_list)).astype(np.int64),
+                np.bincount(at, weights=units != 0, minlength=len(day_list)).astype(np.int64))
     with conn:
-        with conn.cursor() as cur:
-            cur.execute(q, params)
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute("SELECT day, SUM(units), COUNT(*) FILTER (WHERE units <> 0)"
+                        " FROM (" + cells + ") c GROUP BY day ORDER BY day", params)
             rows = cur.fetchall()
     if not rows:
-        return pd.DataFrame(columns=["sku", "date", "units"])
-    df = pd.DataFrame(rows)
-    df["date"] = pd.to_datetime(df["date"]).dt.date
-    df["units"] = pd.to_numeric(df["units"], errors="coerce").fillna(0).astype(int)
-    return df
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    return tuple(np.array(column, dtype=np.int64) for column in zip(*rows))
+
+
+def fetch_sku_totals(user_id: Optional[str], source: str = "auto", until_day: Optional[int] = None) -> pd.DataFrame:
+    """
+    Per-SKU totals of the sales fetch_sales() would return, before `until_day`
+    when given: a frame indexed by sku with the first and last day with a sale
+    row, units, days with non-zero units and units weighted by day number
+    (sum of units * day). Summed in the database, one row per SKU.
+    """
+    columns = ["first", "last", "units", "sale_days", "weighted"]
+    conn, cells, params = _sales_cells(user_id, source, until_day)
+    if conn is None:
+        cells_df = _csv_cells(until_day)
+        sku = cells_df["sku"].astype(str)
+        day = cells_df["day"].astype(np.int64)
+        units = cells_df["units"].astype(np.int64)
+        return pd.DataFrame({
+            "first": day, "last": day, "units": units, "sale_days": (units != 0).astype(np.int64), "weighted": units * day
+        }).groupby(sku.to_numpy()).agg({"first": "min", "last": "max", "units": "sum", "sale_days": "sum", "weighted": "sum"})[columns]
+    with conn:
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute("SELECT sku, MIN(day), MAX(day), SUM(units), COUNT(*) FILTER (WHERE units <> 0), SUM(units::bigint * day)"
+                        " FROM (" + cells + ") c GROUP BY sku", params)
+            rows = cur.fetchall()
+    return pd.DataFrame([r[1:] for r in rows], index=pd.Index([r[0] for r in rows], dtype=object), columns=columns, dtype=np.int64)
 
 
 def fetch_promotions(user_id: Optional[str]) -> pd.DataFrame:
@@ -149,7 +913,8 @@ def fetch_promotions(user_id: Optional[str]) -> pd.DataFrame:
         path = os.path.join(project_data_dir(), "promotions.csv")
         if os.path.isfile(path):
             try:
-                df = pd.read_csv(path)
+                # SKUs are strings, as in the sales CSVs and the database, so numeric SKUs still match
+                df = pd.read_csv(path, dtype={"sku": str})
                 df["start_date"] = pd.to_datetime(df["start_date"]).dt.date
                 df["end_date"] = pd.to_datetime(df["end_date"]).dt.date
                 return df[["sku", "start_date", "end_date", "discount_pct"]]
@@ -181,15 +946,17 @@ def fetch_promotions(user_id: Optional[str]) -> pd.DataFrame:
 
 
 def date_today(data_dates: pd.Series) -> datetime.date:
-    return max(pd.to_datetime(data_dates)).date() if len(data_dates) else datetime.utcnow().date()
+    return pd.to_datetime(data_dates).max().date() if len(data_dates) else datetime.utcnow().date()
 
 
 from statsmodels.tsa.seasonal import seasonal_decompose
 
-def perform_decomposition(series: pd.Series, period: int = 30) -> Dict[str, Any]:
+def perform_decomposition(series: pd.Series, period: int = 30, method: str = "exact") -> Dict[str, Any]:
     """
     Performs time-series decomposition into Trend, Seasonal, and Residual components.
     Uses additive model: Observed = Trend + Seasonal + Residual
+    method="fast" runs the numpy kernel from surge_batch (cumulative-sum moving
+    average, phase-mean profile) instead of statsmodels.
     """
     if len(series) < (2 * period):
         return {
@@ -201,6 +968,16 @@ def perform_decomposition(series: pd.Series, period: int = 30) -> Dict[str, Any]
         
     try:
         s_filled = series.ffill().bfill()
+
+        if method == "fast":
+            from surge_batch import decompose_rows
+            rows = decompose_rows(s_filled.to_numpy(dtype=np.float64)[None, :], period)
+            return {
+                "trend": pd.Series(rows["trend"][0], index=series.index),
+                "seasonal": pd.Series(rows["seasonal"][0], index=series.index),
+                "residual": pd.Series(rows["residual"][0], index=series.index),
+                "strength": float(rows["strength"][0])
+            }
         
         result = seasonal_decompose(s_filled, model='additive', period=period, extrapolate_trend='freq')
         
@@ -273,24 +1050,39 @@ def detect_recurring_peaks(df: pd.DataFrame, seasonal_component: pd.Series) -> L
     return events
 
 
-def promotion_multiplier_logic(df: pd.DataFrame, promos: pd.DataFrame, sku: str, today: datetime.date) -> Tuple[float, bool]:
-    df_promos = promos[promos["sku"] == sku] if not promos.empty else pd.DataFrame(columns=["start_date", "end_date", "discount_pct"])
-    if df_promos.empty:
-        return 1.0, False
-        
-    active_promo = False
-    max_discount = 0.0
-    
-    for _, row in df_promos.iterrows():
-        if today <= row["end_date"] and (row["start_date"] - today).days <= 14:
-            active_promo = True
-            max_discount = max(max_discount, row.get("discount_pct", 0))
-            
-    base_lift = 1.0
-    if active_promo:
-        base_lift = 1.0 + (max_discount * 0.02)
-        
-    return (float(base_lift), active_promo)
+class PromotionIndex:
+    """
+    Promotion lift per SKU for one run date. Every promotion row is checked in
+    one vectorized pass (active, or starting within `lead_days` of today) and
+    reduced to the max discount per SKU, so per-SKU lookups are dict hits.
+    Keys are SKU strings, so an int SKU from a caller still finds its promotion.
+    """
+
+    def __init__(self, promos: pd.DataFrame, today: datetime.date, lead_days: int = 14):
+        self.lifts: Dict[Any, float] = {}
+        if promos is None or promos.empty:
+            return
+        t = pd.Timestamp(today)
+        start = pd.to_datetime(promos["start_date"], errors="coerce")
+        end = pd.to_datetime(promos["end_date"], errors="coerce")
+        active = ((end >= t) & ((start - t).dt.days <= lead_days)).to_numpy()
+        if "discount_pct" in promos:
+            # Negative or missing discounts never raise the max above 0
+            discount = pd.to_numeric(promos["discount_pct"], errors="coerce").fillna(0.0).clip(lower=0.0)
+        else:
+            discount = pd.Series(0.0, index=promos.index)
+        best = discount[active].groupby(promos["sku"].astype(str).to_numpy()[active]).max()
+        self.lifts = dict(zip(best.index, 1.0 + best.to_numpy(dtype=np.float64) * 0.02))
+
+    def lookup(self, sku: Any) -> Tuple[float, bool]:
+        lift = self.lifts.get(str(sku))
+        if lift is None:
+            return 1.0, False
+        return float(lift), True
+
+
+def promotion_multiplier_logic(df: pd.DataFrame, promos: PromotionIndex, sku: str, today: datetime.date) -> Tuple[float, bool]:
+    return promos.lookup(sku)
 
 
 def classify_surge_type(multipliers: Dict[str, float]) -> str:
@@ -343,26 +1135,101 @@ def known_event_calendar(today: datetime.date, lookahead: int) -> List[Dict[str,
     return events
 
 
-def compute_for_sku(sku: str, sdf: pd.DataFrame, promos: pd.DataFrame, today: datetime.date, lead_time: int, safety_stock: Optional[int]) -> Dict[str, Any]:
-    df = sdf.copy().sort_values("date")
-    df = df.groupby("date", as_index=False)["units"].sum()
-    daily = df.set_index("date")["units"].asfreq("D").fillna(0)
-    units_series = daily # Maintain time index for decomposition
+class EventCalendarIndex:
+    """
+    Upcoming-day index for one (today, lookahead) window, shared by every SKU of
+    a run. Known calendar events are keyed by day offset from today, and
+    recurring peaks ("%m-%d" start dates) resolve to an offset through a
+    (month, day) lookup table, so matching a SKU costs O(peaks) instead of a
+    strftime scan over every day of the window.
+    """
+
+    def __init__(self, today: datetime.date, lookahead: int):
+        days = [today + timedelta(days=i) for i in range(lookahead)]
+        self.dates = [d.strftime("%Y-%m-%d") for d in days]
+        self.md_offset = np.full((13, 32), -1, dtype=np.int32)
+        for i, d in enumerate(days):
+            self.md_offset[d.month, d.day] = i
+        events = [((ev["date"] - today).days, ev) for ev in known_event_calendar(today, lookahead)]
+        # Stable sort keeps calendar order within a day
+        self.events = sorted([e for e in events if 0 <= e[0] < lookahead], key=lambda e: e[0])
+
+    def match(self, peaks: List[Dict[str, Any]], limit: int) -> Tuple[List[Tuple[int, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]], bool]:
+        """
+        Join recurring peaks with the calendar by day offset. Returns the first
+        `limit` (offset, peak, None) / (offset, None, calendar_event) matches in
+        day order, peaks before calendar events within a day, and whether
+        anything matched at all.
+        """
+        hits = []
+        for k, peak in enumerate(peaks):
+            md = peak["start_date"]
+            offset = int(self.md_offset[int(md[:2]), int(md[3:5])])
+            if offset >= 0:
+                hits.append((offset, 0, k))
+        hits.sort()
+        cal = ((offset, 1, j) for j, (offset, _) in enumerate(self.events))
+        matches = []
+        for offset, kind, k in itertools.islice(heapq.merge(hits, cal), limit):
+            if kind == 0:
+                matches.append((offset, peaks[k], None))
+            else:
+                matches.append((offset, None, self.events[k][1]))
+        return matches, bool(hits or self.events)
+
+
+@functools.lru_cache(maxsize=8)
+def event_calendar_index(today: datetime.date, lookahead: int) -> EventCalendarIndex:
+    """Built once per (today, lookahead) and reused across SKUs and warm-worker requests."""
+    return EventCalendarIndex(today, lookahead)
+
+
+def compute_for_sku(sku: str, sdf: Optional[pd.DataFrame], promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None, decomp_method: str = "exact", daily: Optional[pd.Series] = None) -> Dict[str, Any]:
+    """`daily` (e.g. SeriesStore.daily()) skips rebuilding the daily series from the sale rows in `sdf`."""
+    prof = active()
+    with prof.span("series_prep"):
+        df = sdf
+        if daily is None:
+            df = sdf.copy().sort_values("date")
+            df = df.groupby("date", as_index=False)["units"].sum()
+            daily = df.set_index("date")["units"].asfreq("D").fillna(0)
+        units_series = daily # Maintain time index for decomposition
 
     # 1. STL Decomposition (New)
-    decomp = perform_decomposition(units_series, period=30)
-    trend_series = decomp["trend"]
-    seasonal_series = decomp["seasonal"]
-    resid_series = decomp["residual"]
+    with prof.span("decomposition"):
+        decomp = perform_decomposition(units_series, period=30, method=decomp_method)
     
     # 2. Historical Pattern Analysis (Enhanced with Seasonal Component)
-    recurring_peaks = detect_recurring_peaks(df, seasonal_series)
+    with prof.span("peak_detection"):
+        if decomp_method == "fast":
+            from surge_batch import recurring_peaks_rows
+            first_day = units_series.index[:1].values.astype("datetime64[D]").astype(np.int64)
+            recurring_peaks = recurring_peaks_rows(decomp["seasonal"].to_numpy(dtype=np.float64)[None, :], first_day)[0]
+        else:
+            recurring_peaks = detect_recurring_peaks(df, decomp["seasonal"])
     
     # Use simpler event detection for specifically identifying date-based events if STL missed short spikes
     # historical_patterns = detect_event_patterns(df) # Legacy method kept for robustness
-    
+
+    # 3. Base Metrics (Updated)
+    with prof.span("signals"):
+        signals = decomposition_signals(units_series, decomp, today)
+
+    promo_mult, promo_flag = promotion_multiplier_logic(df, promos, sku, today)
+
+    return assemble_sku_result(sku, signals, recurring_peaks, promo_mult, promo_flag, today, lead_time, safety_stock, scenarios=scenarios)
+
+
+def decomposition_signals(units_series: pd.Series, decomp: Dict[str, Any], today: datetime.date) -> Dict[str, Any]:
+    """
+    Reduces a SKU's decomposition to the scalar signals the forecast needs
+    (seasonal/spike/trend multipliers and the base daily rate).
+    """
+    trend_series = decomp["trend"]
+    seasonal_series = decomp["seasonal"]
+    resid_series = decomp["residual"]
+
     # Forecast upcoming high-seasonality periods from decomposition
-    upcoming_seasonal_spike = False
     seasonal_mult = 1.0
     
     # Simple forecast: Look at seasonal component for the next 30 days (projected from last year)
@@ -380,7 +1247,6 @@ def compute_for_sku(sku: str, sdf: pd.DataFrame, promos: pd.DataFrame, today: da
          if current_trend > 0:
              seasonal_mult = (current_trend + current_seasonal_val) / current_trend
     
-    # 3. Base Metrics (Updated)
     # Residue-based anomaly detection (more robust than simple rolling mean)
     resid_std = resid_series.std()
     current_resid = resid_series.iloc[-1] if not resid_series.empty else 0
@@ -403,64 +1269,84 @@ def compute_for_sku(sku: str, sdf: pd.DataFrame, promos: pd.DataFrame, today: da
             trend_flag = trend_mult > 1.1
             accel = (curr_trend - prev_trend) / prev_trend
 
-    promo_mult, promo_flag = promotion_multiplier_logic(df, promos, sku, today)
-    
+    base_daily = float(trend_series.iloc[-1] if not trend_series.empty and not pd.isna(trend_series.iloc[-1]) else units_series.mean())
+
+    return {
+        "seasonal_mult": seasonal_mult,
+        "spike_flag": spike_flag,
+        "spike_mult": spike_mult,
+        "trend_mult": trend_mult,
+        "trend_flag": trend_flag,
+        "accel": accel,
+        "trend_last": trend_series.iloc[-1],
+        "strength": decomp["strength"],
+        "base_daily": base_daily,
+    }
+
+
+def assemble_sku_result(sku: str, signals: Dict[str, Any], recurring_peaks: List[Dict[str, Any]], promo_mult: float, promo_flag: bool, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None) -> Dict[str, Any]:
+    """
+    Combines decomposition signals, recurring peaks and promotions into the
+    per-SKU payload. Shared by the per-SKU and batch engines. With `scenarios`
+    the payload also carries a "scenarios" list with the forecast and reorder
+    point for each (lead_time, safety_stock) pair.
+    """
+    seasonal_mult = signals["seasonal_mult"]
+    spike_flag = signals["spike_flag"]
+    trend_mult = signals["trend_mult"]
+    trend_flag = signals["trend_flag"]
+    accel = signals["accel"]
+    strength = signals["strength"]
+    base_daily = signals["base_daily"]
+
     # 4. Combine
     multipliers = {
         "seasonal_index": float(max(1.0, seasonal_mult)),
         "festival_multiplier": 1.0, # Placeholder, would integrate recurring peaks here
         "promo_multiplier": float(promo_mult),
         "trend_multiplier": float(trend_mult),
-        "spike_multiplier": float(spike_mult),
+        "spike_multiplier": float(signals["spike_mult"]),
     }
 
     # Match recurring peaks + known calendar events to upcoming dates for "Festival/Event" forecast
-    upcoming_events = []
-    check_date = today
-    calendar = known_event_calendar(today, DEFAULTS["event_lookahead"])
-    cal_by_date: Dict[datetime.date, List[Dict[str, Any]]] = {}
-    for ev in calendar:
-        cal_by_date.setdefault(ev["date"], []).append(ev)
-    for i in range(DEFAULTS["event_lookahead"]):
-        check_md = check_date.strftime("%m-%d")
-        for peak in recurring_peaks:
-            if check_md == peak["start_date"]:
+    with active().span("event_matching"):
+        upcoming_events = []
+        calendar = event_calendar_index(today, DEFAULTS["event_lookahead"])
+        matches, has_events = calendar.match(recurring_peaks, limit=5)
+        for i, peak, ce in matches:
+            if peak is not None:
                 # Found a peak starting today/soon
+                if "duration_days" in peak:
+                    duration = peak["duration_days"]
+                else:
+                    duration = len(peak.get("dates", [])) if isinstance(peak.get("dates", []), list) else 1
                 upcoming_events.append({
-                    "event_name": f"Seasonal Peak Pattern ({check_md})",
-                    "event_date": check_date.strftime("%Y-%m-%d"),
+                    "event_name": f"Seasonal Peak Pattern ({peak['start_date']})",
+                    "event_date": calendar.dates[i],
                     "days_until": i,
-                    "expected_multiplier": 1.0 + (peak["magnitude"] / max(1, trend_series.iloc[-1]) ), # Approx multiplier
-                    "confidence": decomp["strength"],
-                    "duration_days": len(peak.get("dates", [])) if isinstance(peak.get("dates", []), list) else 1
+                    "expected_multiplier": 1.0 + (peak["magnitude"] / max(1, signals["trend_last"]) ), # Approx multiplier
+                    "confidence": strength,
+                    "duration_days": duration
                 })
-        # Known calendar labelling and lift
-        if check_date in cal_by_date:
-            for ce in cal_by_date[check_date]:
+            else:
+                # Known calendar labelling and lift
                 base_lift = float(ce.get("base_lift", 1.1))
                 blended = max(1.0, max(seasonal_mult, trend_mult, promo_mult) * base_lift)
                 upcoming_events.append({
                     "event_name": ce["name"],
-                    "event_date": check_date.strftime("%Y-%m-%d"),
+                    "event_date": calendar.dates[i],
                     "days_until": i,
                     "expected_multiplier": min(DEFAULTS["surge_cap"], blended),
-                    "confidence": min(1.0, (decomp["strength"] * 0.7) + 0.3),
+                    "confidence": min(1.0, (strength * 0.7) + 0.3),
                     "duration_days": 1,
-                    "categories": ce.get("categories", [])
+                    "categories": list(ce.get("categories", []))
                 })
-        check_date += timedelta(days=1)
-
 
     surge_mult = max(1.0, max(multipliers.values()))
     surge_mult = min(DEFAULTS["surge_cap"], surge_mult)
     
     # 5. Forecast
-    base_daily = float(trend_series.iloc[-1] if not trend_series.empty and not pd.isna(trend_series.iloc[-1]) else units_series.mean())
-    base_forecast = max(0.0, base_daily * lead_time)
-    adjusted_forecast = float(base_forecast * surge_mult)
-    
-    ss = safety_stock if safety_stock is not None else int(round(0.2 * base_daily * lead_time))
-    adjusted_reorder = float(adjusted_forecast + ss)
+    base_forecast, adjusted_forecast, adjusted_reorder, _ = lead_time_forecast(base_daily, surge_mult, lead_time, safety_stock)
 
     # 6. Metadata
     reasons = []
@@ -468,11 +1354,12 @@ def compute_for_sku(sku: str, sdf: pd.DataFrame, promos: pd.DataFrame, today: da
     if promo_flag: reasons.append("Active or upcoming promotion")
     if trend_flag: reasons.append("Positive trend (Decomposed)")
     if multipliers["seasonal_index"] > 1.1: reasons.append("High seasonal period (STL)")
+    if signals.get("intermittent"): reasons.append("Intermittent demand (SBA rate)")
     if not reasons: reasons.append("Stable demand")
 
     surge_type = classify_surge_type(multipliers)
     
-    return {
+    result = {
         "sku": sku,
         "base_forecast": round(base_forecast, 2),
         "surge_multiplier": round(surge_mult, 3),
@@ -481,29 +1368,66 @@ def compute_for_sku(sku: str, sdf: pd.DataFrame, promos: pd.DataFrame, today: da
         "signals": {
             "spike_flag": bool(spike_flag),
             "seasonal_flag": multipliers["seasonal_index"] > 1.1,
-            "festival_flag": bool(upcoming_events),
+            "festival_flag": has_events,
             "promo_flag": promo_flag,
             "trend_flag": trend_flag,
         },
         "reasons": reasons,
-        "upcoming_events": upcoming_events[:5],
+        "upcoming_events": upcoming_events,
         "metadata": {
             "surge_type": surge_type,
-            "surge_confidence_score": round(decomp["strength"], 2),
+            "surge_confidence_score": round(strength, 2),
             "demand_acceleration_rate": round(accel, 4),
             "historical_peak_comparison": 0.0, # Placeholder
         },
         "components": {k: round(v, 3) for k, v in multipliers.items()}
     }
+    if scenarios:
+        # Decomposition, events and multipliers are shared; only the lead-time arithmetic repeats
+        rows = []
+        for lt, ss in scenarios:
+            bf, af, ar, ss_used = lead_time_forecast(base_daily, surge_mult, lt, ss)
+            rows.append({
+                "lead_time": lt,
+                "safety_stock": ss_used,
+                "base_forecast": round(bf, 2),
+                "adjusted_forecast": round(af, 2),
+                "adjusted_reorder": round(ar, 2),
+            })
+        result["scenarios"] = rows
+    return result
 
 
-def aggregate_for_dashboard(results: List[Dict[str, Any]], today: datetime.date) -> Dict[str, Any]:
-    raw_events: List[Dict[str, Any]] = []
+def lead_time_forecast(base_daily: float, surge_mult: float, lead_time: int, safety_stock: Optional[int]) -> Tuple[float, float, float, int]:
+    """(base_forecast, adjusted_forecast, adjusted_reorder, safety stock used) over one lead time."""
+    base_forecast = max(0.0, base_daily * lead_time)
+    adjusted_forecast = float(base_forecast * surge_mult)
     
-    # Collect all predicted events from SKU analysis
-    for r in results:
+    ss = safety_stock if safety_stock is not None else int(round(0.2 * base_daily * lead_time))
+    adjusted_reorder = float(adjusted_forecast + ss)
+    return base_forecast, adjusted_forecast, adjusted_reorder, ss
+
+
+class DashboardAggregator:
+    """
+    Builds the dashboard block incrementally from SKU results as they are
+    produced, so streaming runs never hold every result. Keeps per-event
+    groups and a bounded top-10 heap of trending SKUs (ties keep the order
+    results were added in, like a stable sort).
+    """
+
+    TOP_TRENDING = 10
+
+    def __init__(self, today: Optional[datetime.date]):
+        self.today = today
+        self.grouped_map: Dict[str, Dict[str, Any]] = {}
+        self.trending: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.count = 0
+
+    def add(self, r: Dict[str, Any]):
+        # Group predicted events by name across dates (combine across SKUs, keep earliest date)
         for e in r.get("upcoming_events", []):
-            raw_events.append({
+            ev = {
                 "event": e["event_name"],
                 "date": e["event_date"],
                 "daysUntil": e["days_until"],
@@ -512,136 +1436,673 @@ def aggregate_for_dashboard(results: List[Dict[str, Any]], today: datetime.date)
                 "confidence": float(e["confidence"]) * 100.0,
                 "durationDays": int(e.get("duration_days", 1)),
                 "categories": e.get("categories", []) or []
-            })
-    
-    # Group by event name across dates (combine across SKUs, keep earliest date)
-    grouped_map: Dict[str, Dict[str, Any]] = {}
-    for ev in raw_events:
-        if ev["daysUntil"] < 0:
-            continue
-        key = ev["event"]
-        g = grouped_map.get(key)
-        if not g:
-            grouped_map[key] = {
-                "event": ev["event"],
-                "date": ev["date"],
-                "daysUntil": ev["daysUntil"],
-                "multVals": [ev["multiplier"]],
-                "confidenceVals": [ev["confidence"]],
-                "durationVals": [ev["durationDays"]],
-                "categories": set([c for c in ev["categories"] if isinstance(c, str) and c.strip()]),
-                "skus": set([ev["sku"]])
             }
-        else:
-            # keep earliest date and min daysUntil
-            if ev["daysUntil"] < g["daysUntil"]:
-                g["daysUntil"] = ev["daysUntil"]
-                g["date"] = ev["date"]
-            g["multVals"].append(ev["multiplier"])
-            g["durationVals"].append(ev["durationDays"])
-            g["categories"].update([c for c in ev["categories"] if isinstance(c, str) and c.strip()])
-            g["skus"].add(ev["sku"])
-            g["confidenceVals"].append(ev["confidence"])
-    
-    # Build grouped list
-    unique_events: List[Dict[str, Any]] = []
-    for g in grouped_map.values():
-        conf_vals = g["confidenceVals"]
-        avg_conf = int(round(sum(conf_vals) / max(1, len(conf_vals))))
-        mults = sorted(g["multVals"])
-        # Use median multiplier to avoid outliers causing identical 2.11x everywhere
-        mid = len(mults) // 2
-        median_mult = (mults[mid] if len(mults) % 2 == 1 else (mults[mid-1] + mults[mid]) / 2.0)
-        duration = max(g["durationVals"]) if g["durationVals"] else 1
-        cats = sorted(list(g["categories"]))[:8]
-        unique_events.append({
-            "event": g["event"],
-            "date": g["date"],
-            "daysUntil": g["daysUntil"],
-            "multiplier": round(float(median_mult), 2),
-            "confidence": avg_conf,
-            "durationDays": int(duration),
-            "categories": cats
+            if ev["daysUntil"] < 0:
+                continue
+            key = ev["event"]
+            g = self.grouped_map.get(key)
+            if not g:
+                self.grouped_map[key] = {
+                    "event": ev["event"],
+                    "date": ev["date"],
+                    "daysUntil": ev["daysUntil"],
+                    "multVals": [ev["multiplier"]],
+                    "confidenceVals": [ev["confidence"]],
+                    "durationVals": [ev["durationDays"]],
+                    "categories": set([c for c in ev["categories"] if isinstance(c, str) and c.strip()]),
+                    "skus": set([ev["sku"]])
+                }
+            else:
+                # keep earliest date and min daysUntil
+                if ev["daysUntil"] < g["daysUntil"]:
+                    g["daysUntil"] = ev["daysUntil"]
+                    g["date"] = ev["date"]
+                g["multVals"].append(ev["multiplier"])
+                g["durationVals"].append(ev["durationDays"])
+                g["categories"].update([c for c in ev["categories"] if isinstance(c, str) and c.strip()])
+                g["skus"].add(ev["sku"])
+                g["confidenceVals"].append(ev["confidence"])
+
+        # Min-heap on (trend, -arrival): the root is the entry a newcomer must beat
+        item = (r["components"]["trend_multiplier"], -self.count, {
+            "sku": r["sku"],
+            "trendMultiplier": r["components"]["trend_multiplier"],
+            "surgeMultiplier": r["surge_multiplier"],
+            "reasons": r["reasons"],
+            "signals": r.get("signals", {}),
+            "metadata": r.get("metadata", {})
         })
+        self.count += 1
+        if len(self.trending) < self.TOP_TRENDING:
+            heapq.heappush(self.trending, item)
+        elif item[:2] > self.trending[0][:2]:
+            heapq.heapreplace(self.trending, item)
+
+    def finish(self) -> Dict[str, Any]:
+        if self.today is None:
+            return {"upcomingEvents": [], "trendingProducts": []}
+        today = self.today
+
+        # Build grouped list
+        unique_events: List[Dict[str, Any]] = []
+        for g in self.grouped_map.values():
+            conf_vals = g["confidenceVals"]
+            avg_conf = int(round(sum(conf_vals) / max(1, len(conf_vals))))
+            mults = sorted(g["multVals"])
+            # Use median multiplier to avoid outliers causing identical 2.11x everywhere
+            mid = len(mults) // 2
+            median_mult = (mults[mid] if len(mults) % 2 == 1 else (mults[mid-1] + mults[mid]) / 2.0)
+            duration = max(g["durationVals"]) if g["durationVals"] else 1
+            cats = sorted(list(g["categories"]))[:8]
+            unique_events.append({
+                "event": g["event"],
+                "date": g["date"],
+                "daysUntil": g["daysUntil"],
+                "multiplier": round(float(median_mult), 2),
+                "confidence": avg_conf,
+                "durationDays": int(duration),
+                "categories": cats
+            })
     
-    # Sort by earliest, then confidence, then multiplier and keep top 3
-    unique_events = [e for e in unique_events if e["daysUntil"] >= 1]
-    unique_events.sort(key=lambda x: (x["daysUntil"], -x["confidence"], -x["multiplier"]))
-    unique_events = unique_events[:3]
-    # If fewer than 3 events detected from SKUs, supplement with calendar-only events
-    if len(unique_events) < 3:
-        cal = known_event_calendar(today, DEFAULTS["event_lookahead"])
-        # Build next distinct events by name that aren't already present
-        present = set(e["event"] for e in unique_events)
-        extra: List[Dict[str, Any]] = []
-        seen_names: set = set()
-        for ev in cal:
-            if ev["name"] in present or ev["name"] in seen_names:
-                continue
-            days_until = (ev["date"] - today).days
-            if days_until >= 1:
-                extra.append({
-                    "event": ev["name"],
-                    "date": ev["date"].strftime("%Y-%m-%d"),
-                    "daysUntil": days_until,
-                    "multiplier": round(float(ev.get("base_lift", 1.15)), 2),
-                    "confidence": 50,
-                    "durationDays": 1,
-                    "categories": ev.get("categories", [])
-                })
-                seen_names.add(ev["name"])
-            if len(extra) >= (3 - len(unique_events)):
-                break
-        unique_events.extend(extra[: max(0, 3 - len(unique_events))])
-            
-    trending = sorted(results, key=lambda x: x["components"]["trend_multiplier"], reverse=True)[:10]
-    trending_products = [{
-        "sku": t["sku"],
-        "trendMultiplier": t["components"]["trend_multiplier"],
-        "surgeMultiplier": t["surge_multiplier"],
-        "reasons": t["reasons"],
-        "signals": t.get("signals", {}),
-        "metadata": t.get("metadata", {})
-    } for t in trending]
+        # Sort by earliest, then confidence, then multiplier and keep top 3
+        unique_events = [e for e in unique_events if e["daysUntil"] >= 1]
+        unique_events.sort(key=lambda x: (x["daysUntil"], -x["confidence"], -x["multiplier"]))
+        unique_events = unique_events[:3]
+        # If fewer than 3 events detected from SKUs, supplement with calendar-only events
+        if len(unique_events) < 3:
+            cal = known_event_calendar(today, DEFAULTS["event_lookahead"])
+            # Build next distinct events by name that aren't already present
+            present = set(e["event"] for e in unique_events)
+            extra: List[Dict[str, Any]] = []
+            seen_names: set = set()
+            for ev in cal:
+                if ev["name"] in present or ev["name"] in seen_names:
+                    continue
+                days_until = (ev["date"] - today).days
+                if days_until >= 1:
+                    extra.append({
+                        "event": ev["name"],
+                        "date": ev["date"].strftime("%Y-%m-%d"),
+                        "daysUntil": days_until,
+                        "multiplier": round(float(ev.get("base_lift", 1.15)), 2),
+                        "confidence": 50,
+                        "durationDays": 1,
+                        "categories": ev.get("categories", [])
+                    })
+                    seen_names.add(ev["name"])
+                if len(extra) >= (3 - len(unique_events)):
+                    break
+            unique_events.extend(extra[: max(0, 3 - len(unique_events))])
 
-    return {
-        "upcomingEvents": unique_events,
-        "trendingProducts": trending_products
-    }
+        trending = sorted(self.trending, key=lambda t: t[:2], reverse=True)
+        return {
+            "upcomingEvents": unique_events,
+            "trendingProducts": [t[2] for t in trending]
+        }
 
 
-def main():
+def aggregate_for_dashboard(results: List[Dict[str, Any]], today: datetime.date) -> Dict[str, Any]:
+    agg = DashboardAggregator(today)
+    for r in results:
+        agg.add(r)
+    return agg.finish()
+
+
+def iter_serial(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], engine: str = "sku", scenarios: Optional[List[Scenario]] = None, decomp_method: str = "exact") -> Iterator[Dict[str, Any]]:
+    """Yield SKU results in sku order as each one is computed (the batch engine yields after its vectorized pass)."""
+    if engine == "batch":
+        from surge_batch import compute_batch
+        yield from compute_batch(sales_df, promos, today, lead_time, safety_stock, scenarios=scenarios)
+        return
+    for sku, g in sales_df.groupby("sku", observed=True):
+        yield from _sku_result(sku, compute_for_sku, sku, g[["date", "units"]], promos, today, lead_time, safety_stock, scenarios, decomp_method)
+
+
+def _sku_result(sku: str, compute: Callable[..., Dict[str, Any]], *args, **kwargs) -> List[Dict[str, Any]]:
+    """compute(*args, **kwargs) for one SKU as a 0/1-item list; a failure is logged and counted instead of raised."""
+    prof = active()
     try:
-        args = parse_args()
-        user_id = args["user_id"]
-        lead_time = args["lead_time"]
-        safety_stock = args["safety_stock"]
-        sku_filter = args["sku"]
-
-        sales_df = fetch_sales(user_id, sku_filter)
-        if sales_df.empty:
-            print(json.dumps({"results": [], "dashboard": {"upcomingEvents": [], "trendingProducts": []}}))
-            return
+        res = compute(*args, **kwargs)
+    except Exception as e:
+        logger.exception("Failed to compute for sku=%s: %s", sku, e)
+        prof.count("skus_failed")
+        return []
+    prof.count("skus_processed")
+    return [res]
 
-        today = date_today(sales_df["date"])
-        
-        # Prepare promo data
-        promos = fetch_promotions(user_id)
 
-        results: List[Dict[str, Any]] = []
-        for sku, g in sales_df.groupby("sku"):
+def compute_serial(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], engine: str = "sku", scenarios: Optional[List[Scenario]] = None, decomp_method: str = "exact") -> List[Dict[str, Any]]:
+    return list(iter_serial(sales_df, promos, today, lead_time, safety_stock, engine, scenarios, decomp_method))
+
+
+# Per-process copy of the run inputs. With the fork start method the pool
+# initializer's arguments are inherited rather than pickled, so workers share
+# the parent's sales frame copy-on-write; with spawn it is pickled once per worker.
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(state: Dict[str, Any]):
+    _worker_state.update(state)
+    reset_in_worker(state["profile"])
+
+
+def _compute_chunk(bounds: Tuple[int, int]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """One chunk's results plus the spans and counters the worker collected for it."""
+    st = _worker_state
+    chunk = st["sales_df"].iloc[bounds[0]:bounds[1]]
+    part = compute_serial(chunk, st["promos"], st["today"], st["lead_time"], st["safety_stock"], st["engine"], st["scenarios"], st["decomp_method"])
+    return part, active().drain()
+
+
+def sku_chunks(sales_df: pd.DataFrame, n_chunks: int) -> List[Tuple[int, int]]:
+    """Row ranges of a frame with each SKU's rows contiguous, split on SKU boundaries into ~equal SKU counts."""
+    return [bounds for bounds, _ in sku_chunk_sizes(sales_df, n_chunks)]
+
+
+def sku_chunk_sizes(sales_df: pd.DataFrame, n_chunks: int) -> List[Tuple[Tuple[int, int], int]]:
+    """sku_chunks() paired with the number of SKUs in each chunk."""
+    codes = pd.factorize(sales_df["sku"], sort=True)[0]
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    picks = np.unique(np.linspace(0, len(starts), n_chunks + 1).astype(int))
+    edges = [int(starts[i]) if i < len(starts) else len(sales_df) for i in picks]
+    return [((a, b), int(j - i)) for a, b, i, j in zip(edges[:-1], edges[1:], picks[:-1], picks[1:]) if b > a]
+
+
+def iter_parallel(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], engine: str, workers: int, scenarios: Optional[List[Scenario]] = None, decomp_method: str = "exact", deadline: Optional["Deadline"] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Runs compute_serial over SKU chunks on a process pool. Chunks are contiguous
+    runs of the sku-sorted frame and come back through imap in submission order,
+    so results are yielded in the same order as the serial path, one chunk at a
+    time. Per-SKU failures are logged inside the worker exactly as in the serial loop.
+    Worker spans are merged into the active profiler, so their seconds are summed
+    across workers rather than wall time.
+
+    With a deadline the frame comes from prioritized_frame() and keeps its order,
+    chunks are smaller (at most about DEADLINE_CHUNK_SKUS SKUs), and waiting for the next
+    chunk stops when the deadline passes; the pool is then terminated and the
+    unfinished chunks' SKUs count as skipped.
+    """
+    import multiprocessing as mp
+
+    if deadline is None:
+        sales_df = sales_df.sort_values("sku", kind="stable").reset_index(drop=True)
+        chunks = sku_chunk_sizes(sales_df, workers * 4)
+    else:
+        # Smaller chunks than usual, so less finished work is lost to the cut-off
+        chunks = sku_chunk_sizes(sales_df, max(workers * 16, -(-sales_df["sku"].nunique() // DEADLINE_CHUNK_SKUS)))
+    if len(chunks) <= 1:
+        if deadline is None:
+            yield from iter_serial(sales_df, promos, today, lead_time, safety_stock, engine, scenarios, decomp_method)
+        else:
+            yield from iter_prioritized(sales_df, promos, today, lead_time, safety_stock, engine, deadline, scenarios, decomp_method)
+        return
+
+    state = {
+        "sales_df": sales_df,
+        "promos": promos,
+        "today": today,
+        "lead_time": lead_time,
+        "safety_stock": safety_stock,
+        "engine": engine,
+        "scenarios": scenarios,
+        "decomp_method": decomp_method,
+        "profile": active().enabled,
+    }
+    method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(method)
+    if deadline is not None:
+        deadline.start(sum(n for _, n in chunks))
+    with ctx.Pool(min(workers, len(chunks)), initializer=_init_worker, initargs=(state,)) as pool:
+        parts = pool.imap(_compute_chunk, [bounds for bounds, _ in chunks])
+        for i in range(len(chunks)):
             try:
-                res = compute_for_sku(sku, g[["date", "units"]], promos, today, lead_time, safety_stock)
-                results.append(res)
-            except Exception as e:
-                logger.exception("Failed to compute for sku=%s: %s", sku, e)
+                part, prof_snap = parts.next(None if deadline is None else deadline.remaining())
+            except mp.TimeoutError:
+                deadline.skip(sum(n for _, n in chunks[i:]))
+                return
+            active().merge(prof_snap)
+            yield from part
+
+
+# Recent window (days up to today) that ranks SKUs under --deadline-ms
+PRIORITY_DAYS = 28
+# SKUs per vectorized pass (and at most per worker chunk) under --deadline-ms
+DEADLINE_CHUNK_SKUS = 1000
 
-        dashboard = aggregate_for_dashboard(results, today)
-        payload = {
-            "results": results,
-            "dashboard": dashboard
+
+class Deadline:
+    """
+    Time budget of one run (--deadline-ms) on the monotonic clock, started when
+    the run starts. Prioritized result iterators check it before starting each
+    SKU (batch engine and workers: each chunk) and record how many SKUs they
+    skipped. A started SKU or chunk is finished, except that --workers stops
+    waiting for chunks as soon as the budget runs out.
+    """
+
+    def __init__(self, ms: Optional[int]):
+        self.ms = ms
+        self.expires_at = None if ms is None else time.monotonic() + ms / 1000.0
+        self.total_skus = 0
+        self.skipped_skus = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (0 once expired); None without a budget."""
+        return None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def start(self, n_skus: int):
+        self.total_skus += n_skus
+
+    def skip(self, n_skus: int):
+        self.skipped_skus += n_skus
+        active().count("skus_skipped", n_skus)
+
+    def report(self) -> Dict[str, Any]:
+        """Payload fields of a run under a deadline."""
+        return {
+            "partial": self.skipped_skus > 0,
+            "deadline_ms": self.ms,
+            "total_skus": self.total_skus,
+            "skipped_skus": self.skipped_skus,
         }
-        print(json.dumps(payload, default=str))
+
+
+def priority_order(recent: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """
+    Positions of SKUs from most to least important: units sold in the last
+    PRIORITY_DAYS days, then all-time units, both descending; ties keep SKU order.
+    """
+    return np.lexsort((-np.asarray(total), -np.asarray(recent)))
+
+
+def prioritized_frame(sales_df: pd.DataFrame, today: datetime.date) -> pd.DataFrame:
+    """sales_df with each SKU's rows contiguous and SKUs in priority_order()."""
+    codes, labels = pd.factorize(sales_df["sku"], sort=True)
+    units = sales_df["units"].to_numpy(np.int64)
+    recent = sales_df["day"].to_numpy() > np.datetime64(today, "D").astype(np.int64) - PRIORITY_DAYS
+    totals = np.bincount(codes, weights=units, minlength=len(labels))
+    recents = np.bincount(codes, weights=np.where(recent, units, 0), minlength=len(labels))
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[priority_order(recents, totals)] = np.arange(len(labels))
+    return sales_df.iloc[np.argsort(rank[codes], kind="stable")].reset_index(drop=True)
+
+
+def iter_until(deadline: Deadline, tasks: Iterable[Tuple[int, Callable[[], Iterable[Dict[str, Any]]]]], total: int) -> Iterator[Dict[str, Any]]:
+    """Run (n_skus, compute) tasks in order until the deadline passes; the SKUs of tasks never started are skipped."""
+    deadline.start(total)
+    done = 0
+    for n, compute in tasks:
+        if deadline.expired():
+            break
+        yield from compute()
+        done += n
+    deadline.skip(total - done)
+
+
+def iter_prioritized(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], engine: str, deadline: Deadline, scenarios: Optional[List[Scenario]] = None, decomp_method: str = "exact") -> Iterator[Dict[str, Any]]:
+    """
+    iter_serial() under a deadline for a frame from prioritized_frame(): SKUs are
+    computed in priority order, by the batch engine in chunks of DEADLINE_CHUNK_SKUS.
+    """
+    if engine == "batch":
+        from surge_batch import compute_batch
+        chunks = sku_chunk_sizes(sales_df, -(-sales_df["sku"].nunique() // DEADLINE_CHUNK_SKUS))
+        tasks = (
+            (n, functools.partial(compute_batch, sales_df.iloc[a:b], promos, today, lead_time, safety_stock, scenarios=scenarios))
+            for (a, b), n in chunks
+        )
+        yield from iter_until(deadline, tasks, sum(n for _, n in chunks))
+        return
+    groups = sales_df.groupby("sku", observed=True, sort=False)
+    tasks = (
+        (1, functools.partial(_sku_result, sku, compute_for_sku, sku, g[["date", "units"]], promos, today, lead_time, safety_stock, scenarios, decomp_method))
+        for sku, g in groups
+    )
+    yield from iter_until(deadline, tasks, groups.ngroups)
+
+
+def surge_results(args: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[Optional[datetime.date], Iterable[Dict[str, Any]]]:
+    """
+    Load the inputs for parsed args and return (today, SKU results); today is None
+    when there are no sales. With an enabled deadline, results come in priority
+    order and stop early (see Deadline).
+    """
+    if args["series_store"]:
+        return series_store_results(args, deadline)
+    if args["engine"] == "incremental" and not args["sku"]:
+        return incremental_results(args, deadline)
+    prof = active()
+    with prof.span("fetch_sales"):
+        sales_df = fetch_sales(args["user_id"], args["sku"], args["source"], args["memory_mb"])
+    prof.count("rows_loaded", len(sales_df))
+    return frame_results(args, sales_df, deadline)
+
+
+def load_promotions(user_id: Optional[str], today: datetime.date) -> PromotionIndex:
+    prof = active()
+    with prof.span("fetch_promotions"):
+        promos_df = fetch_promotions(user_id)
+        promos = PromotionIndex(promos_df, today)
+    prof.count("promotions_loaded", len(promos_df))
+    return promos
+
+
+def frame_results(args: Dict[str, Any], sales_df: pd.DataFrame, deadline: Optional[Deadline] = None) -> Tuple[Optional[datetime.date], Iterable[Dict[str, Any]]]:
+    """surge_results() for an already loaded sales frame."""
+    user_id = args["user_id"]
+    lead_time = args["lead_time"]
+    safety_stock = args["safety_stock"]
+    scenarios = args["scenarios"]
+    if sales_df.empty:
+        return None, []
+
+    today = date_today(sales_df["date"])
+    promos = load_promotions(user_id, today)
+
+    if args["engine"] == "incremental":
+        from surge_state import SurgeStateStore, compute_incremental
+        store = SurgeStateStore.for_user(args["state_dir"], user_id)
+        incremental_notes(args, deadline)
+        return today, compute_incremental(sales_df, promos, today, lead_time, safety_stock, store, scenarios=scenarios, prune=not args["sku"])
+    intermittent: List[Dict[str, Any]] = []
+    if args["intermittent"]:
+        from surge_intermittent import split_frame
+        sales_df, intermittent = split_frame(sales_df, promos, today, lead_time, safety_stock, scenarios)
+    if deadline is not None and deadline.enabled:
+        with active().span("series_prep"):
+            sales_df = prioritized_frame(sales_df, today)
+        if args["workers"] > 1:
+            results = iter_parallel(sales_df, promos, today, lead_time, safety_stock, args["engine"], args["workers"], scenarios, args["decomp"], deadline)
+        else:
+            results = iter_prioritized(sales_df, promos, today, lead_time, safety_stock, args["engine"], deadline, scenarios, args["decomp"])
+    elif args["workers"] > 1:
+        results = iter_parallel(sales_df, promos, today, lead_time, safety_stock, args["engine"], args["workers"], scenarios, args["decomp"])
+    else:
+        results = iter_serial(sales_df, promos, today, lead_time, safety_stock, args["engine"], scenarios, args["decomp"])
+    return today, with_intermittent(results, intermittent, deadline)
+
+
+def incremental_notes(args: Dict[str, Any], deadline: Optional[Deadline] = None):
+    if deadline is not None and deadline.enabled:
+        logger.info("The incremental engine runs in full; --deadline-ms is not applied")
+    if args["intermittent"]:
+        logger.info("The incremental engine keeps its own per-SKU state; --intermittent is not applied")
+
+
+def incremental_results(args: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[Optional[datetime.date], Iterable[Dict[str, Any]]]:
+    """
+    surge_results() for the incremental engine over all of a user's SKUs. With
+    stored state only the sales from the last stored day onward are read, plus
+    per-SKU totals of the earlier days to check them against the state; the
+    full history is read when there is no state or a SKU's history changed.
+    """
+    from surge_state import SurgeStateStore, compute_incremental, compute_since, last_stored_day
+    user_id = args["user_id"]
+    store = SurgeStateStore.for_user(args["state_dir"], user_id)
+    states = store.load()
+    prof = active()
+    cut = last_stored_day(states)
+    if cut is not None:
+        with prof.span("fetch_sales"):
+            before = fetch_sku_totals(user_id, args["source"], until_day=cut)
+            recent_df = fetch_sales(user_id, None, args["source"], args["memory_mb"], since_day=cut)
+        prof.count("rows_loaded", len(recent_df))
+        last_days = [date_today(recent_df["date"])] if len(recent_df) else []
+        if len(before):
+            last_days.append((datetime(1970, 1, 1) + timedelta(days=int(before["last"].max()))).date())
+        if not last_days:
+            return None, []
+        today = max(last_days)
+        promos = load_promotions(user_id, today)
+        incremental_notes(args, deadline)
+        results = compute_since(recent_df, before, cut, promos, today, args["lead_time"], args["safety_stock"], store, states, scenarios=args["scenarios"])
+        if results is not None:
+            return today, results
+        logger.info("Sales before the last surge state day changed; reading the full sales history")
+
+    with prof.span("fetch_sales"):
+        sales_df = fetch_sales(user_id, None, args["source"], args["memory_mb"])
+    prof.count("rows_loaded", len(sales_df))
+    if sales_df.empty:
+        return None, []
+    today = date_today(sales_df["date"])
+    promos = load_promotions(user_id, today)
+    if cut is None:
+        incremental_notes(args, deadline)
+    return today, compute_incremental(sales_df, promos, today, args["lead_time"], args["safety_stock"], store, scenarios=args["scenarios"], states=states, prune=True)
+
+
+def with_intermittent(results: Iterable[Dict[str, Any]], intermittent: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> Iterable[Dict[str, Any]]:
+    """
+    Dense SKU results plus the intermittent ones from surge_intermittent (both in
+    sku order), merged by sku; under a deadline they follow the prioritized dense results.
+    """
+    if not intermittent:
+        return results
+    if deadline is not None and deadline.enabled:
+        deadline.start(len(intermittent))
+        return itertools.chain(results, intermittent)
+    return heapq.merge(results, intermittent, key=lambda r: r["sku"])
+
+
+def series_store_results(args: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[Optional[datetime.date], Iterable[Dict[str, Any]]]:
+    """
+    surge_results() from the user's series_store (synced first): the batch
+    engine maps the stored matrix directly and the per-SKU engine slices each
+    SKU's series; other engines get a sales frame rebuilt from the store.
+    """
+    from series_store import sync_store
+    prof = active()
+    with prof.span("fetch_sales"):
+        store = sync_store(args["series_dir"], args["user_id"], args["source"], args["memory_mb"])
+    sku_filter = args["sku"]
+    if store is None or not len(store.present_rows(sku_filter)):
+        return None, []
+    if args["engine"] == "incremental" or args["workers"] > 1:
+        with prof.span("series_prep"):
+            sales_df = store.sales_frame(sku_filter)
+        return frame_results(args, sales_df, deadline)
+
+    today = store.last_date(sku_filter)
+    promos = load_promotions(args["user_id"], today)
+    rows = store.present_rows(sku_filter)
+    intermittent: List[Dict[str, Any]] = []
+    if args["intermittent"]:
+        from surge_intermittent import split_store
+        rows, intermittent = split_store(store, rows, promos, today, args["lead_time"], args["safety_stock"], args["scenarios"])
+    if deadline is not None and deadline.enabled:
+        results = iter_store_prioritized(store, promos, today, args, rows, deadline)
+    elif args["engine"] == "batch":
+        from surge_batch import compute_matrix
+        with prof.span("series_prep"):
+            matrix = store.sales_matrix(rows=rows)
+        results = compute_matrix(matrix, promos, today, args["lead_time"], args["safety_stock"], scenarios=args["scenarios"])
+    else:
+        results = iter_store_serial(store, promos, today, args, rows)
+    return today, with_intermittent(results, intermittent, deadline)
+
+
+def iter_store_serial(store, promos: PromotionIndex, today: datetime.date, args: Dict[str, Any], rows: np.ndarray) -> Iterator[Dict[str, Any]]:
+    """iter_serial() for the per-SKU engine over SeriesStore rows (sorted)."""
+    for i in rows:
+        yield from _store_sku_result(store, store.skus[i].item(), promos, today, args)
+
+
+def _store_sku_result(store, sku: str, promos: PromotionIndex, today: datetime.date, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return _sku_result(sku, compute_for_sku, sku, None, promos, today, args["lead_time"], args["safety_stock"], args["scenarios"], args["decomp"], daily=store.daily(sku))
+
+
+def iter_store_prioritized(store, promos: PromotionIndex, today: datetime.date, args: Dict[str, Any], rows: np.ndarray, deadline: Deadline) -> Iterator[Dict[str, Any]]:
+    """iter_prioritized() over SeriesStore rows, ranked from the stored row totals."""
+    prof = active()
+    with prof.span("series_prep"):
+        since_day = int(np.datetime64(today, "D").astype(np.int64)) - PRIORITY_DAYS + 1
+        rows = rows[priority_order(store.row_totals(since_day)[rows], store.row_totals()[rows])]
+    if args["engine"] == "batch":
+        from surge_batch import compute_matrix
+
+        def batch(chunk: np.ndarray) -> List[Dict[str, Any]]:
+            with prof.span("series_prep"):
+                matrix = store.sales_matrix(rows=np.sort(chunk))
+            return compute_matrix(matrix, promos, today, args["lead_time"], args["safety_stock"], scenarios=args["scenarios"])
+
+        tasks = (
+            (len(rows[lo:lo + DEADLINE_CHUNK_SKUS]), functools.partial(batch, rows[lo:lo + DEADLINE_CHUNK_SKUS]))
+            for lo in range(0, len(rows), DEADLINE_CHUNK_SKUS)
+        )
+    else:
+        tasks = ((1, functools.partial(_store_sku_result, store, store.skus[i].item(), promos, today, args)) for i in rows)
+    yield from iter_until(deadline, tasks, len(rows))
+
+
+def run_surge(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute the full surge payload (what main() prints) for parsed args."""
+    deadline = Deadline(args["deadline_ms"])
+    today, results = surge_results(args, deadline)
+    prof = active()
+    agg = DashboardAggregator(today)
+    collected: List[Dict[str, Any]] = []
+    for res in results:
+        with prof.span("aggregation"):
+            agg.add(res)
+        collected.append(res)
+    with prof.span("aggregation"):
+        dashboard = agg.finish()
+    payload = {
+        "results": collected,
+        "dashboard": dashboard
+    }
+    if deadline.enabled:
+        payload.update(deadline.report())
+    if prof.enabled:
+        payload["timings"] = prof.snapshot()
+    return payload
+
+
+def stream_surge(args: Dict[str, Any], emit: Callable[[Dict[str, Any]], None]):
+    """
+    Streaming variant of run_surge(): emit({"result": ...}) once per SKU as it
+    is computed, then emit({"dashboard": ...}) last (with "timings" when
+    profiling, and the deadline fields under --deadline-ms). No result list is kept.
+    """
+    deadline = Deadline(args["deadline_ms"])
+    today, results = surge_results(args, deadline)
+    prof = active()
+    agg = DashboardAggregator(today)
+    for res in results:
+        with prof.span("aggregation"):
+            agg.add(res)
+        emit({"result": res})
+    with prof.span("aggregation"):
+        last = {"dashboard": agg.finish()}
+    if deadline.enabled:
+        last.update(deadline.report())
+    if prof.enabled:
+        last["timings"] = prof.snapshot()
+    emit(last)
+
+
+def serve():
+    """
+    Warm worker mode: read one JSON request per line on stdin and answer with one
+    JSON line on stdout. Requests look like {"id", "user", "lead", "safety", "sku"};
+    responses are {"id", "payload"} or {"id", "error"}. Requests with "format":
+    "msgpack" | "arrow" get {"id", "format", "payload_b64"} (see surge_codec.py)
+    instead of "payload". Requests with "stream": true
+    are answered with one {"id", "result"} line per SKU and a final {"id", "dashboard"}
+    (or {"id", "error"}) line. Requests with "profile": true | "memory" get a
+    "timings" block in the payload (or on the dashboard line), and requests with
+    "deadline_ms" get the partial/total_skus/skipped_skus fields there. Logs stay on stderr.
+    """
+    global _keep_conn
+    _keep_conn = True
+    out = sys.stdout
+    out.write(json.dumps({"type": "ready", "pid": os.getpid()}) + "\n")
+    out.flush()
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get("id")
+            args = request_to_args(req)
+            with profiling(profiler_for(args["profile"])):
+                if args["stream"]:
+                    def emit(part: Dict[str, Any]):
+                        out.write(json.dumps({"id": req_id, **part}, default=str) + "\n")
+                        out.flush()
+                    stream_surge(args, emit)
+                    continue
+                payload = run_surge(args)
+            if args["format"] != "json":
+                from surge_codec import encode_payload
+                data = encode_payload(payload, args["format"])
+                msg = {"id": req_id, "format": args["format"], "payload_b64": base64.b64encode(data).decode("ascii")}
+            else:
+                msg = {"id": req_id, "payload": payload}
+        except Exception as e:
+            logger.exception("Request %s failed: %s", req_id, e)
+            msg = {"id": req_id, "error": str(e)}
+        out.write(json.dumps(msg, default=str) + "\n")
+        out.flush()
+
+
+def write_output(args: Dict[str, Any]):
+    """Run the surge computation for parsed args and write it to stdout in the requested shape."""
+    prof = active()
+    if args["stream"]:
+        def emit(part: Dict[str, Any]):
+            line = {"type": "result" if "result" in part else "dashboard", **part}
+            with prof.span("encoding"):
+                text = json.dumps(line, default=str)
+            sys.stdout.write(text + "\n")
+            sys.stdout.flush()
+        stream_surge(args, emit)
+        return
+    payload = run_surge(args)
+    if args["format"] != "json":
+        from surge_codec import encode_payload
+        with prof.span("encoding"):
+            data = encode_payload(payload, args["format"])
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+        return
+    with prof.span("encoding"):
+        text = json.dumps(payload, default=str)
+    print(text)
+
+
+def main():
+    try:
+        args = parse_args()
+        if args["serve"]:
+            serve()
+            return
+        if args["stream"] and args["format"] != "json":
+            raise ValueError("--format applies to whole payloads and cannot be combined with --stream")
+        cprof = None
+        if args["cprofile"]:
+            import cProfile
+            cprof = cProfile.Profile()
+            cprof.enable()
+        try:
+            # The payload's "timings" is taken before encoding; the stderr lines include it
+            with profiling(profiler_for(args["profile"])) as prof:
+                write_output(args)
+                if prof.enabled:
+                    prof.write_lines(sys.stderr)
+        finally:
+            if cprof is not None:
+                cprof.disable()
+                cprof.dump_stats(args["cprofile"])
     except Exception as e:
         logger.exception("Fatal error: %s", e)
         print(json.dumps({"error": str(e)}))
@@ -649,4 +2110,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Let sibling modules (surge_batch, ...) import this script as `surge_engine`
+    sys.modules.setdefault("surge_engine", sys.modules[__name__])
     main()
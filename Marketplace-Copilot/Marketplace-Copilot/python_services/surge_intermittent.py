@@ -0,0 +1,184 @@
+"""
+Intermittent-Demand Fast Path
+Long-tail SKUs that sell on a few days a month get little from the additive
+decomposition. It either falls back on short series, or it fits trend and
+seasonality to what is mostly zeros. With --intermittent every SKU is first
+classified from its sale days:
+
+- zero-day ratio: days without sales / days from the SKU's first sale to today
+- ADI (average inter-demand interval): mean gap in days between sale days
+
+SKUs at or above both INTERMITTENT_ZERO_RATIO and INTERMITTENT_ADI (the
+Syntetos-Boylan 1.32 cut-off) are "intermittent". They skip decomposition, peak
+detection and the spike/trend signals. Their base daily demand is the
+Syntetos-Boylan approximation of Croston's method:
+
+    rate = (1 - alpha / 2) * z / p
+
+z and p are exponentially smoothed demand sizes and inter-demand intervals. They
+are updated only on sale days, z starting at the first sale and p at the ADI.
+Both smoothers are linear, so their final values are weighted sums over each
+SKU's sale days. All intermittent SKUs are estimated together with bincount
+instead of a per-day loop. The rest of the payload is assembled as usual with
+neutral multipliers: no seasonal, spike or trend lift and no recurring peaks,
+while promotions and calendar events still apply. The reasons list carries
+"Intermittent demand (SBA rate)".
+
+Dense SKUs go through the selected engine unchanged.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from surge_engine import PromotionIndex, Scenario
+from surge_batch import assemble_rows
+from surge_profile import active
+
+# A SKU is intermittent when both its zero-day ratio and its ADI reach these
+INTERMITTENT_ZERO_RATIO = 0.5
+INTERMITTENT_ADI = 1.32
+# Smoothing constant for demand sizes and intervals
+SBA_ALPHA = 0.1
+
+
+def sale_days(codes: np.ndarray, days: np.ndarray, units: np.ndarray, n_skus: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (code, day, units) per day with sales, summed over sale rows and sorted by
+    code, then day, plus each code's first day with a sale row (zero-unit rows
+    included, as they start the daily series too).
+    """
+    first = np.zeros(n_skus, dtype=np.int64)
+    days = days.astype(np.int64)
+    if not len(codes):
+        return codes, days, units.astype(np.int64), first
+    key = (codes.astype(np.int64) << 32) | (days - days.min())
+    step = np.diff(key)
+    # Folded loaders (DailyUnits, the series store) already deliver rows in (sku, day) order
+    if (step < 0).any():
+        order = np.argsort(key, kind="stable")
+        codes, days, units, key = codes[order], days[order], units[order], key[order]
+        step = np.diff(key)
+    units = units.astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, step != 0])
+    new_code = np.r_[True, codes[starts[1:]] != codes[starts[:-1]]]
+    first[codes[starts[new_code]]] = days[starts[new_code]]
+    codes, days = codes[starts], days[starts]
+    units = np.add.reduceat(units, starts)
+    keep = units > 0
+    return codes[keep], days[keep], units[keep], first
+
+
+def demand_profile(codes: np.ndarray, days: np.ndarray, n_skus: int, first: np.ndarray, today_day: int) -> Dict[str, np.ndarray]:
+    """
+    Zero-day ratio, ADI and sale-day count per SKU from sale_days() output;
+    `first` is each SKU's first day with a sale row (day numbers, like `days`).
+    A SKU with one sale day gets its whole window as ADI, one without any gets inf.
+    """
+    window = np.maximum(today_day - first + 1, 1).astype(np.float64)
+    n = np.bincount(codes, minlength=n_skus)
+    follows = np.r_[False, codes[1:] == codes[:-1]]
+    gaps = np.bincount(codes[follows], weights=np.diff(days)[follows[1:]], minlength=n_skus)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adi = np.where(n >= 2, gaps / np.maximum(n - 1, 1), np.where(n == 1, window, np.inf))
+    return {"n": n, "window": window, "zero_ratio": 1.0 - n / window, "adi": adi}
+
+
+def intermittent_mask(profile: Dict[str, np.ndarray], zero_ratio: float = INTERMITTENT_ZERO_RATIO, adi: float = INTERMITTENT_ADI) -> np.ndarray:
+    return (profile["zero_ratio"] >= zero_ratio) & (profile["adi"] >= adi)
+
+
+def sba_rates(codes: np.ndarray, days: np.ndarray, units: np.ndarray, profile: Dict[str, np.ndarray], alpha: float = SBA_ALPHA) -> np.ndarray:
+    """
+    Croston/SBA daily demand rate per SKU from sale_days() output. Closed form of
+    the smoothing recursions: the k-th of n sale days weighs (1-alpha)^(n-1) when
+    it initializes (k = 0) and alpha * (1-alpha)^(n-1-k) as an update.
+    """
+    n = profile["n"]
+    n_skus = len(n)
+    if not len(codes):
+        return np.zeros(n_skus)
+    start = np.r_[0, np.cumsum(n)[:-1]]
+    k = np.arange(len(codes)) - start[codes]
+    decay = (1.0 - alpha) ** (n[codes] - 1 - k)
+    updates = k > 0
+    z = np.bincount(codes, weights=np.where(updates, alpha * decay, decay) * units, minlength=n_skus)
+    intervals = np.diff(days, prepend=days[0])
+    p = (1.0 - alpha) ** np.maximum(n - 1, 0) * np.where(np.isfinite(profile["adi"]), profile["adi"], 1.0)
+    p += np.bincount(codes[updates], weights=alpha * decay[updates] * intervals[updates], minlength=n_skus)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(n > 0, (1.0 - alpha / 2.0) * z / p, 0.0)
+
+
+def intermittent_rates(codes: np.ndarray, days: np.ndarray, units: np.ndarray, profile: Dict[str, np.ndarray], sparse: np.ndarray) -> np.ndarray:
+    """sba_rates() of just the SKUs flagged in `sparse`, in SKU order."""
+    keep = sparse[codes]
+    position = np.cumsum(sparse) - 1
+    return sba_rates(position[codes[keep]], days[keep], units[keep], {k: v[sparse] for k, v in profile.items()})
+
+
+def intermittent_signals(rate: float) -> Dict[str, Any]:
+    """decomposition_signals()-shaped signals with neutral multipliers around an SBA rate."""
+    return {
+        "seasonal_mult": 1.0,
+        "spike_flag": False,
+        "spike_mult": 1.0,
+        "trend_mult": 1.0,
+        "trend_flag": False,
+        "accel": 0.0,
+        "trend_last": rate,
+        "strength": 0.0,
+        "base_daily": rate,
+        "intermittent": True,
+    }
+
+
+def intermittent_results(skus: np.ndarray, rates: np.ndarray, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None) -> List[Dict[str, Any]]:
+    """SKU results for intermittent SKUs (in the given order) from their SBA rates."""
+    signals = [intermittent_signals(float(r)) for r in rates]
+    return assemble_rows(skus, signals, [[] for _ in range(len(skus))], promos, today, lead_time, safety_stock, scenarios)
+
+
+def split_frame(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    (sale rows of the dense SKUs, results of the intermittent SKUs in sku order)
+    for a (sku, date, day, units) sales frame.
+    """
+    prof = active()
+    with prof.span("intermittent"):
+        codes, labels = pd.factorize(sales_df["sku"], sort=True)
+        # Rows without a SKU (code -1) are left to the dense engine, which drops them
+        valid = codes >= 0
+        ev_codes, ev_days, ev_units, first = sale_days(codes[valid], sales_df["day"].to_numpy()[valid], sales_df["units"].to_numpy()[valid], len(labels))
+        today_day = int(np.datetime64(today, "D").astype(np.int64))
+        profile = demand_profile(ev_codes, ev_days, len(labels), first, today_day)
+        sparse = intermittent_mask(profile)
+        rates = intermittent_rates(ev_codes, ev_days, ev_units, profile, sparse)
+        dense_df = sales_df[~(valid & sparse[np.maximum(codes, 0)])].reset_index(drop=True)
+    prof.count("skus_intermittent", int(sparse.sum()))
+    return dense_df, intermittent_results(np.asarray(labels, dtype=object)[sparse], rates, promos, today, lead_time, safety_stock, scenarios)
+
+
+def split_store(store, rows: np.ndarray, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], scenarios: Optional[List[Scenario]] = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    split_frame() for series_store rows: (dense rows, intermittent results in row
+    order). Sale days are read only for rows whose zero-day ratio qualifies.
+    """
+    prof = active()
+    with prof.span("intermittent"):
+        today_day = int(np.datetime64(today, "D").astype(np.int64))
+        first = store.first[rows].astype(np.int64) + store.origin
+        window = np.maximum(today_day - first + 1, 1)
+        counts = store.row_totals(days_with_sales=True)[rows]
+        candidates = np.flatnonzero(1.0 - counts / window >= INTERMITTENT_ZERO_RATIO)
+        codes, days, units = store.nonzero_days(rows[candidates])
+        profile = demand_profile(codes, days, len(candidates), first[candidates], today_day)
+        sparse = intermittent_mask(profile)
+        rates = intermittent_rates(codes, days, units, profile, sparse)
+        keep = np.ones(len(rows), dtype=bool)
+        keep[candidates[sparse]] = False
+    prof.count("skus_intermittent", int(sparse.sum()))
+    skus = store.skus[rows[candidates[sparse]]].astype(object)
+    return rows[keep], intermittent_results(skus, rates, promos, today, lead_time, safety_stock, scenarios)
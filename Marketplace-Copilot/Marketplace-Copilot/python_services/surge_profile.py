@@ -0,0 +1,182 @@
+"""
+Surge Run Profiling
+Named spans (accumulated seconds and call counts) and counters for a surge run,
+enabled with --profile. Code under measurement asks for the active profiler via
+active(); when profiling is off that is NULL_PROFILER, whose span() hands back a
+shared no-op context manager, so instrumented code pays only an attribute
+lookup and an empty `with`.
+"""
+
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullProfiler:
+    enabled = False
+
+    def span(self, name: str) -> _NullSpan:
+        return _NULL_SPAN
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    def merge(self, snap: Dict[str, Any]):
+        pass
+
+    def drain(self) -> Dict[str, Any]:
+        return {}
+
+    def stop(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Span:
+    __slots__ = ("stats", "t0")
+
+    def __init__(self, stats: list):
+        self.stats = stats
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats[0] += time.perf_counter() - self.t0
+        self.stats[1] += 1
+        return False
+
+
+class Profiler:
+    """
+    Accumulates span times and counters. With memory=True it also runs
+    tracemalloc for the Python heap peak, which slows the run noticeably, so
+    span times from memory runs are not comparable with plain --profile runs.
+    """
+
+    enabled = True
+
+    def __init__(self, memory: bool = False):
+        self.spans: Dict[str, list] = {}
+        self.counters: Dict[str, int] = {}
+        self.memory = memory
+        self.started = time.perf_counter()
+        if memory:
+            tracemalloc.start()
+
+    def span(self, name: str) -> _Span:
+        stats = self.spans.get(name)
+        if stats is None:
+            stats = self.spans[name] = [0.0, 0]
+        return _Span(stats)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def drain(self) -> Dict[str, Any]:
+        """Spans and counters collected so far, resetting them (pool workers ship these to the parent)."""
+        snap = {"spans": self.spans, "counters": self.counters}
+        self.spans, self.counters = {}, {}
+        return snap
+
+    def merge(self, snap: Dict[str, Any]):
+        for name, (seconds, calls) in snap.get("spans", {}).items():
+            stats = self.spans.setdefault(name, [0.0, 0])
+            stats[0] += seconds
+            stats[1] += calls
+        for name, n in snap.get("counters", {}).items():
+            self.count(name, n)
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "wall_s": round(time.perf_counter() - self.started, 4),
+            "spans": {name: {"seconds": round(s, 4), "calls": c} for name, (s, c) in self.spans.items()},
+            "counters": dict(self.counters),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if self.memory and tracemalloc.is_tracing():
+            out["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        return out
+
+    def write_lines(self, stream: TextIO):
+        """One JSON line per span, then one with counters and memory."""
+        snap = self.snapshot()
+        for name, stats in snap["spans"].items():
+            stream.write(json.dumps({"type": "span", "name": name, **stats}) + "\n")
+        summary = {k: v for k, v in snap.items() if k != "spans"}
+        stream.write(json.dumps({"type": "profile", **summary}) + "\n")
+        stream.flush()
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Process peak RSS; on platforms without resource (Windows) the tracemalloc peak if tracing, else None."""
+    try:
+        import resource
+    except ImportError:
+        if tracemalloc.is_tracing():
+            return round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_scale, 1)
+
+
+def profiler_for(mode: Optional[str]):
+    """Profiler for a --profile mode: None (off), "time" or "memory" (adds tracemalloc)."""
+    if not mode:
+        return NULL_PROFILER
+    return Profiler(memory=(mode == "memory"))
+
+
+_active: Any = NULL_PROFILER
+
+
+def active():
+    return _active
+
+
+def set_active(profiler):
+    global _active
+    _active = profiler
+
+
+def reset_in_worker(enabled: bool):
+    """Start a pool worker with empty counters; fork copies the parent's spans and tracemalloc state."""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    set_active(Profiler() if enabled else NULL_PROFILER)
+
+
+@contextmanager
+def profiling(profiler) -> Iterator[Any]:
+    """Make `profiler` the active one for the duration of the block, stopping it on exit."""
+    previous = _active
+    set_active(profiler)
+    try:
+        yield profiler
+    finally:
+        set_active(previous)
+        profiler.stop()
@@ -0,0 +1,409 @@
+"""
+Incremental Surge State
+Persists per-SKU decomposition state between surge runs. A run reuses the stored
+signals and peaks of SKUs whose daily series is unchanged, advances SKUs whose
+series only gained new days from the last processed day forward, and fully
+recomputes the rest (new SKUs, back-filled or edited history). States of SKUs
+that no longer have sales are dropped.
+
+A run with stored state reads only the sales from the last stored day onward;
+the days before it are checked against per-SKU totals summed by the database
+(units, days with non-zero units and units weighted by day number) and the
+stored tail of each series. A SKU whose earlier history no longer matches sends
+the run back to the full sales history. Edits that keep all three totals of a
+SKU (e.g. units moved between two days in opposite directions by the same day
+distance) are not detected until the SKU's state is rebuilt.
+
+The decomposition is additive with a centered moving-average trend, so trend
+values more than half a period before the series end never change once computed.
+For that settled prefix the state keeps per-phase sums of the detrended series;
+seasonal means, seasonal variance and residual variance of the whole series are
+rebuilt from those sums plus the short unsettled tail. Advanced SKUs match a full
+recompute to a relative tolerance of 1e-6.
+"""
+
+import os
+import re
+import pickle
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from surge_engine import logger, project_data_dir, PromotionIndex, Scenario
+from surge_profile import active
+from surge_batch import (
+    PERIOD, build_sales_matrix, length_buckets, decompose_rows, fallback_rows,
+    recurring_peaks_rows, tail_stats_rows, signals_rows, assemble_rows,
+    centered_ma, linear_extrapolate, phase_sums, phase_counts, seasonality_strength,
+)
+
+STATE_VERSION = 2
+# Incremental updates need the front trend extrapolation settled, i.e. a few cycles of history
+MIN_CYCLES_FOR_ADVANCE = 3
+# Stored series tail: tail_start() is at most two periods before the old end
+TAIL_CYCLES = 2
+STAT_KEYS = ("length", "trend_last", "prev_trend", "seasonal_last", "resid_last", "resid_std", "mean_units", "strength")
+
+
+@dataclass
+class SkuState:
+    start_day: int  # days since 1970-01-01 of series index 0
+    length: int  # series length at the last run
+    totals: Tuple[int, int, int]  # series_totals() of the daily units series
+    tail: np.ndarray  # last TAIL_CYCLES periods of the daily units series (int32)
+    settled: int  # indices [0, settled) have their final moving-average trend
+    phase_sum: np.ndarray  # detrended sums per phase over the settled prefix
+    sq_sum: float  # detrended sum of squares over the settled prefix
+    units_sum: float
+    profile: np.ndarray  # seasonal profile (per-phase means, centered)
+    trend_tail: np.ndarray  # last `period` trend values
+    stats: Dict[str, float]  # residual statistics and tail values read by signals_rows()
+    peaks: List[Dict[str, Any]]
+
+    @property
+    def end_day(self) -> int:
+        return self.start_day + self.length - 1
+
+    @property
+    def last_processed(self) -> date:
+        return date(1970, 1, 1) + timedelta(days=self.end_day)
+
+
+class SurgeStateStore:
+    """Pickle-backed map of sku -> SkuState, one file per user."""
+
+    def __init__(self, path: str, period: int = PERIOD):
+        self.path = path
+        self.period = period
+
+    @classmethod
+    def for_user(cls, state_dir: Optional[str], user_id: Optional[str]) -> "SurgeStateStore":
+        state_dir = state_dir or os.path.join(project_data_dir(), ".surge_state")
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id or "all")
+        return cls(os.path.join(state_dir, f"surge_state_{name}.pkl"))
+
+    def load(self) -> Dict[Any, SkuState]:
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning("Ignoring unreadable surge state %s: %s", self.path, e)
+            return {}
+        if data.get("version") != STATE_VERSION or data.get("period") != self.period:
+            return {}
+        return data["skus"]
+
+    def save(self, states: Dict[Any, SkuState]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"version": STATE_VERSION, "period": self.period, "skus": states}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def series_totals(units: np.ndarray, start_day: int) -> Tuple[int, int, int]:
+    """(units, days with non-zero units, sum of units * day number) of a daily series, as fetch_sku_totals() sums them."""
+    units = np.asarray(units, dtype=np.int64)
+    return int(units.sum()), int(np.count_nonzero(units)), int(units @ np.arange(start_day, start_day + len(units), dtype=np.int64))
+
+
+def last_stored_day(states: Dict[Any, SkuState]) -> Optional[int]:
+    """Day number of the last day any stored series reached, None without state."""
+    return max((st.end_day for st in states.values()), default=None)
+
+
+def _prefix_known(st: Optional[SkuState], start_day: int, series: np.ndarray) -> bool:
+    """Whether the stored state still describes the first st.length days of `series`."""
+    if st is None or st.start_day != start_day or len(series) < st.length:
+        return False
+    return (np.array_equal(series[st.length - len(st.tail):st.length], st.tail)
+            and series_totals(series[:st.length], start_day) == st.totals)
+
+
+def _stats_row(stats: Dict[str, np.ndarray], j: int) -> Dict[str, float]:
+    return {key: float(stats[key][j]) for key in STAT_KEYS}
+
+
+def _stats_arrays(rows: List[Dict[str, float]]) -> Dict[str, np.ndarray]:
+    return {key: np.array([r[key] for r in rows], dtype=np.float64) for key in STAT_KEYS}
+
+
+def _full_states(x: np.ndarray, decomp: Dict[str, np.ndarray], stats: Dict[str, np.ndarray], peaks: List[List[Dict[str, Any]]], start_days: np.ndarray, period: int) -> List[SkuState]:
+    k, n = x.shape
+    settled = max(0, n - period // 2)
+    detrended = x - decomp["trend"]
+    settled_part = detrended[:, :settled]
+    sums = phase_sums(settled_part, 0, period)
+    sq = (settled_part ** 2).sum(axis=1)
+    profile = decomp.get("profile", np.zeros((k, period)))
+    return [
+        SkuState(
+            start_day=int(start_days[j]),
+            length=n,
+            totals=series_totals(x[j], int(start_days[j])),
+            tail=x[j, -TAIL_CYCLES * period:].astype(np.int32),
+            settled=settled,
+            phase_sum=sums[j],
+            sq_sum=float(sq[j]),
+            units_sum=float(x[j].sum()),
+            profile=profile[j],
+            trend_tail=decomp["trend"][j, -period:].copy(),
+            stats=_stats_row(stats, j),
+            peaks=peaks[j],
+        )
+        for j in range(k)
+    ]
+
+
+def advance_rows(tail: np.ndarray, n_old: int, n: int, old: List[SkuState], period: int = PERIOD) -> Dict[str, Any]:
+    """
+    Extend the decomposition of equal-length series from n_old to n days.
+    `tail` holds each series' values from index tail_start(n_old, n) to n.
+    """
+    k = tail.shape[0]
+    half = period // 2
+    settled_old, settled_new = n_old - half, n - half
+    back = n - half - 1
+    t0 = min(settled_old, back - period)
+
+    # Moving average is final up to settled_new; the last `half` days are extrapolated
+    trend = np.empty((k, n - t0))
+    trend[:, :settled_new - t0] = centered_ma(tail, period)
+    trend[:, settled_new - t0:] = linear_extrapolate(trend, back - period, back, np.arange(settled_new, n), offset=t0)
+    detrended = tail[:, half:] - trend
+
+    newly_settled = detrended[:, settled_old - t0:settled_new - t0]
+    unsettled = detrended[:, settled_new - t0:]
+    settled_sum = np.stack([s.phase_sum for s in old]) + phase_sums(newly_settled, settled_old, period)
+    settled_sq = np.array([s.sq_sum for s in old]) + (newly_settled ** 2).sum(axis=1)
+    full_sum = settled_sum + phase_sums(unsettled, settled_new, period)
+    full_sq = settled_sq + (unsettled ** 2).sum(axis=1)
+
+    counts = phase_counts(n, period)
+    profile = full_sum / counts
+    profile -= profile.mean(axis=1, keepdims=True)
+
+    # Whole-series variances from per-phase sums: seasonal[t] = profile[t % period]
+    s_sum = (counts * profile).sum(axis=1)
+    s_sq = (counts * profile ** 2).sum(axis=1)
+    var_seasonal = (s_sq - s_sum ** 2 / n) / (n - 1)
+    r_sum = full_sum.sum(axis=1) - s_sum
+    r_sq = full_sq - 2 * (profile * full_sum).sum(axis=1) + s_sq
+    var_resid = np.maximum(0.0, (r_sq - r_sum ** 2 / n) / (n - 1))
+
+    seasonal_last = profile[:, (n - 1) % period]
+    units_sum = np.array([s.units_sum for s in old]) + tail[:, n_old - (t0 - half):].sum(axis=1)
+    stats = {
+        "length": np.full(k, n),
+        "trend_last": trend[:, -1],
+        "prev_trend": trend[:, n - 30 - t0],
+        "seasonal_last": seasonal_last,
+        "resid_last": detrended[:, -1] - seasonal_last,
+        "resid_std": np.sqrt(var_resid),
+        "mean_units": units_sum / n,
+        "strength": seasonality_strength(var_seasonal, var_resid),
+    }
+    return {
+        "stats": stats,
+        "profile": profile,
+        "seasonal": profile[:, np.arange(n) % period],
+        "phase_sum": settled_sum,
+        "sq_sum": settled_sq,
+        "units_sum": units_sum,
+        "trend_tail": trend[:, -period:],
+        "settled": settled_new,
+    }
+
+
+def tail_start(n_old: int, n: int, period: int = PERIOD) -> int:
+    """First series index advance_rows() needs: half a period before the first trend it recomputes."""
+    half = period // 2
+    return min(n_old - half, n - half - 1 - period) - half
+
+
+def _update(states: Dict[Any, SkuState], skus: np.ndarray, start_days: np.ndarray, lengths: np.ndarray, windows: List[Tuple[int, np.ndarray]], known: List[bool], period: int) -> Tuple[List[Dict[str, float]], List[List[Dict[str, Any]]]]:
+    """
+    Reuse, advance or recompute each SKU's state in `states` and return its (tail
+    stats, peaks). windows[i] is (offset, daily units from series index offset
+    to the end) and known[i] whether the stored state still describes the first
+    state.length days; SKUs that need a full recompute must have offset 0.
+    """
+    prof = active()
+    n_sku = len(skus)
+    stats_rows: List[Any] = [None] * n_sku
+    peaks: List[Any] = [None] * n_sku
+    full_rows: List[int] = []
+    advance: Dict[tuple, List[int]] = {}
+    for i, sku in enumerate(skus):
+        st = states.get(sku) if known[i] else None
+        if st is not None:
+            if st.length == lengths[i]:
+                stats_rows[i] = st.stats
+                peaks[i] = st.peaks
+                continue
+            if lengths[i] > st.length >= MIN_CYCLES_FOR_ADVANCE * period:
+                advance.setdefault((int(lengths[i]), st.length), []).append(i)
+                continue
+        full_rows.append(i)
+
+    full_idx = np.array(full_rows, dtype=np.int64)
+    for length, sel in length_buckets(lengths[full_idx]) if len(full_idx) else []:
+        rows = full_idx[sel]
+        with prof.span("decomposition"):
+            x = np.stack([windows[i][1] for i in rows]).astype(np.float64)
+            decomp = decompose_rows(x, period) if length >= 2 * period else fallback_rows(x)
+            stats = tail_stats_rows(x, decomp)
+        with prof.span("peak_detection"):
+            bucket_peaks = recurring_peaks_rows(decomp["seasonal"], start_days[rows])
+        new_states = _full_states(x, decomp, stats, bucket_peaks, start_days[rows], period)
+        for j, i in enumerate(rows):
+            stats_rows[i] = new_states[j].stats
+            peaks[i] = bucket_peaks[j]
+            states[skus[i]] = new_states[j]
+
+    for (n, n_old), row_list in advance.items():
+        rows = np.array(row_list, dtype=np.int64)
+        t_start = tail_start(n_old, n, period)
+        tail = np.stack([windows[i][1][t_start - windows[i][0]:] for i in rows]).astype(np.float64)
+        old = [states[skus[i]] for i in rows]
+        with prof.span("decomposition"):
+            upd = advance_rows(tail, n_old, n, old, period)
+        with prof.span("peak_detection"):
+            bucket_peaks = recurring_peaks_rows(upd["seasonal"], start_days[rows])
+        for j, i in enumerate(rows):
+            offset, values = windows[i]
+            added = series_totals(values[n_old - offset:], int(start_days[i]) + n_old)
+            st = SkuState(
+                start_day=int(start_days[i]),
+                length=n,
+                totals=tuple(a + b for a, b in zip(old[j].totals, added)),
+                tail=values[-TAIL_CYCLES * period:].astype(np.int32),
+                settled=upd["settled"],
+                phase_sum=upd["phase_sum"][j],
+                sq_sum=float(upd["sq_sum"][j]),
+                units_sum=float(upd["units_sum"][j]),
+                profile=upd["profile"][j],
+                trend_tail=upd["trend_tail"][j].copy(),
+                stats=_stats_row(upd["stats"], j),
+                peaks=bucket_peaks[j],
+            )
+            stats_rows[i] = st.stats
+            peaks[i] = st.peaks
+            states[skus[i]] = st
+
+    n_advanced = sum(len(v) for v in advance.values())
+    logger.info(
+        "Incremental surge run: %d SKUs reused, %d advanced, %d recomputed",
+        n_sku - n_advanced - len(full_rows), n_advanced, len(full_rows)
+    )
+    prof.count("skus_reused", n_sku - n_advanced - len(full_rows))
+    return stats_rows, peaks
+
+
+def compute_incremental(sales_df: pd.DataFrame, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], store: SurgeStateStore, scenarios: Optional[List[Scenario]] = None, states: Optional[Dict[Any, SkuState]] = None, prune: bool = False) -> List[Dict[str, Any]]:
+    """
+    Same results as compute_batch(), doing decomposition work only for SKUs whose
+    sales changed. With `prune`, sales_df holds every SKU of the user and the
+    states of SKUs missing from it are dropped.
+    """
+    if sales_df.empty:
+        return []
+    period = store.period
+    with active().span("series_prep"):
+        matrix = build_sales_matrix(sales_df)
+    origin = int(matrix.origin.astype(np.int64))
+    lengths = matrix.last - matrix.first + 1
+    start_days = matrix.first + origin
+    today_col = int((np.datetime64(today, "D") - matrix.origin).astype(np.int64))
+
+    states = store.load() if states is None else states
+    if prune:
+        states = {sku: states[sku] for sku in matrix.skus if sku in states}
+    windows = [(0, matrix.units[i, matrix.first[i]:matrix.last[i] + 1]) for i in range(len(matrix.skus))]
+    known = [_prefix_known(states.get(sku), start_days[i], windows[i][1]) for i, sku in enumerate(matrix.skus)]
+    stats_rows, peaks = _update(states, matrix.skus, start_days, lengths, windows, known, period)
+    store.save(states)
+
+    with active().span("signals"):
+        signals = signals_rows(_stats_arrays(stats_rows), matrix.last == today_col)
+    return assemble_rows(matrix.skus, signals, peaks, promos, today, lead_time, safety_stock, scenarios)
+
+
+def compute_since(recent_df: pd.DataFrame, before: pd.DataFrame, cut: int, promos: PromotionIndex, today: datetime.date, lead_time: int, safety_stock: Optional[int], store: SurgeStateStore, states: Dict[Any, SkuState], scenarios: Optional[List[Scenario]] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    compute_incremental() for all of a user's SKUs from the sales on or after day
+    `cut` (the last stored day) and fetch_sku_totals() of the days before it.
+    Returns None, leaving the state untouched, when a SKU with earlier sales no
+    longer matches its stored state; the caller then loads the full history.
+    """
+    period = store.period
+    if len(recent_df):
+        with active().span("series_prep"):
+            matrix = build_sales_matrix(recent_df)
+        origin = int(matrix.origin.astype(np.int64))
+        recent = {sku: i for i, sku in enumerate(matrix.skus)}
+    else:
+        recent = {}
+    skus = np.array(sorted(set(before.index) | set(recent)), dtype=object)
+    totals = before.reindex(skus)
+    has_before = totals["units"].notna().to_numpy()
+    first, last, units, sale_days, weighted = (totals[c].fillna(0).to_numpy(np.int64) for c in before.columns)
+
+    start_days = np.empty(len(skus), dtype=np.int64)
+    lengths = np.empty(len(skus), dtype=np.int64)
+    windows: List[Tuple[int, np.ndarray]] = []
+    known: List[bool] = []
+    for i, sku in enumerate(skus):
+        r = recent.get(sku)
+        r_units = matrix.units[r, matrix.first[r]:matrix.last[r] + 1] if r is not None else None
+        r_first = int(matrix.first[r]) + origin if r is not None else None
+        st = states.get(sku)
+        if not has_before[i]:
+            # Every sale row on or after the cut: the recent rows are the whole series
+            start_days[i], lengths[i] = r_first, len(r_units)
+            windows.append((0, r_units))
+            known.append(_prefix_known(st, r_first, r_units))
+            continue
+        if st is None or st.start_day != first[i]:
+            return None
+        end = max(int(last[i]), r_first + len(r_units) - 1) if r is not None else int(last[i])
+        n = end - st.start_day + 1
+        if not (n == st.length or n > st.length >= MIN_CYCLES_FOR_ADVANCE * period):
+            return None
+        if st.end_day < cut and last[i] != st.end_day:
+            return None
+        # Stored tail on and after the cut was read again; the rest must match the database totals
+        tail_first = st.end_day - len(st.tail) + 1
+        again = st.tail[max(0, cut - tail_first):]
+        expected = tuple(a - b for a, b in zip(st.totals, series_totals(again, st.end_day - len(again) + 1)))
+        if (units[i], sale_days[i], weighted[i]) != expected:
+            return None
+        offset = st.length - len(st.tail)
+        values = np.zeros(n - offset, dtype=np.int32)
+        values[:len(st.tail)] = st.tail
+        if len(again):
+            values[len(st.tail) - len(again):len(st.tail)] = 0
+        if r is not None:
+            at = r_first - st.start_day - offset
+            values[at:at + len(r_units)] = r_units
+        if not np.array_equal(values[len(st.tail) - len(again):len(st.tail)], again):
+            return None
+        start_days[i], lengths[i] = st.start_day, n
+        windows.append((offset, values))
+        known.append(True)
+
+    # SKUs with no sales left drop out of the state
+    states = {sku: states[sku] for sku in skus if sku in states}
+    stats_rows, peaks = _update(states, skus, start_days, lengths, windows, known, period)
+    store.save(states)
+
+    today_day = int(np.datetime64(today, "D").astype(np.int64))
+    with active().span("signals"):
+        signals = signals_rows(_stats_arrays(stats_rows), start_days + lengths - 1 == today_day)
+    return assemble_rows(skus, signals, peaks, promos, today, lead_time, safety_stock, scenarios)
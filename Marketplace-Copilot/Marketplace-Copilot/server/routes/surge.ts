@@ -1,67 +1,126 @@
 import express from "express";
-import { execFile } from "child_process";
-import { promisify } from "util";
-import path from "path";
-import fs from "fs";
+import { surgePool, type SurgeFormat, type SurgeRequest } from "../services/surge-pool";
+import { surgeCache, surgeWatermark } from "../services/surge-cache";
 
-const execFileAsync = promisify(execFile);
 const router = express.Router();
 
+// Default time budget for /intelligence when the request has no deadline_ms; unset means none
+const DEFAULT_DEADLINE_MS = parseInt(process.env.SURGE_DEADLINE_MS || "", 10) || undefined;
+
 router.get("/intelligence", async (req, res) => {
     try {
         const userId = (req as any).user?.claims?.sub || null;
-        const lead = parseInt((req.query.lead as string) || "14", 10);
-        const safety = req.query.safety ? parseInt(req.query.safety as string, 10) : undefined;
+        // lead=7,14,21,30 and safety=auto,20 evaluate every combination in one engine pass
+        const lead = parseScenarioList(req.query.lead, false);
+        const safety = parseScenarioList(req.query.safety, true);
         const sku = (req.query.sku as string) || undefined;
+        const stream = req.query.stream === "1" || req.query.stream === "true";
+        // Binary formats are whole-payload encodings, so they don't apply to streamed responses
+        const format = !stream && (req.query.format === "msgpack" || req.query.format === "arrow")
+            ? (req.query.format as SurgeFormat)
+            : undefined;
+        // deadline_ms=N returns the highest-selling SKUs finished within N ms, flagged partial
+        const deadline = parseInt(req.query.deadline_ms as string, 10);
 
-        // Detect Python executable
-        let pythonBin = "python";
-        if (process.platform === "win32") {
-            if (fs.existsSync(path.join(process.cwd(), "venv", "Scripts", "python.exe"))) {
-                pythonBin = path.join(process.cwd(), "venv", "Scripts", "python.exe");
-            }
-        } else {
-            if (fs.existsSync(path.join(process.cwd(), "venv", "bin", "python"))) {
-                pythonBin = path.join(process.cwd(), "venv", "bin", "python");
-            }
-        }
-
-        const scriptPath = path.join(process.cwd(), "python_services", "surge_engine.py");
-
-        const args = [scriptPath];
-        if (userId) args.push(`--user=${userId}`);
-        if (lead) args.push(`--lead=${lead}`);
-        if (typeof safety === "number" && !Number.isNaN(safety)) args.push(`--safety=${safety}`);
-        if (sku) args.push(`--sku=${sku}`);
+        const request: SurgeRequest = {
+            user: userId,
+            lead,
+            safety,
+            sku,
+            format,
+            deadline_ms: deadline > 0 ? deadline : DEFAULT_DEADLINE_MS,
+        };
 
-        console.info("Running surge engine:", pythonBin, args.join(" "));
+        // Identical requests against the same data share one engine run
+        const watermark = await surgeWatermark(userId);
+        const key = JSON.stringify([request.user, request.lead, request.safety, request.sku, request.format, request.deadline_ms, watermark]);
 
-        const { stdout, stderr } = await execFileAsync(pythonBin, args, {
-            cwd: process.cwd(),
-            env: {
-                ...process.env,
-                DATABASE_URL: process.env.DATABASE_URL || "postgresql://postgres:hi@localhost:5432/marketplace"
-            }
-        });
-
-        let payload: any;
-        try {
-            payload = JSON.parse(stdout);
-        } catch (e) {
-            if (stderr) console.error("surge_engine stderr:", stderr);
-            console.error("Failed to parse surge_engine output:", e, stdout);
-            return res.status(500).json({ message: "Invalid engine output" });
+        if (stream) {
+            await streamIntelligence(res, request, surgeCache.peek(key));
+            return;
         }
 
-        if (stderr && /error|traceback/i.test(stderr)) {
-            console.error("surge_engine stderr:", stderr);
-        }
+        // Partial payloads are returned but not cached (binary ones can't be inspected, so none under a deadline)
+        const payload = await surgeCache.getOrCompute(key, () => surgePool.run(request), (value) =>
+            Buffer.isBuffer(value) ? request.deadline_ms === undefined : !value?.partial);
 
+        if (format) {
+            // Engine-encoded bytes are passed through untouched; clients decode with msgpack (+ Arrow)
+            res.setHeader("X-Surge-Format", format);
+            res.type("application/x-msgpack").send(payload);
+            return;
+        }
         res.json(payload);
     } catch (err) {
         console.error("Error in /api/surge/intelligence:", err);
-        res.status(500).json({ message: "Internal server error", details: (err as any).message });
+        if (res.headersSent) {
+            res.end(JSON.stringify({ type: "error", message: (err as any).message }) + "\n");
+        } else {
+            res.status(500).json({ message: "Internal server error", details: (err as any).message });
+        }
     }
 });
 
+/**
+ * "14" -> 14, "7,14,21" -> [7, 14, 21]. Unparseable entries are dropped (as are
+ * non-positive lead times); with allowAuto, "auto" entries become null.
+ */
+function parseScenarioList(value: unknown, allowAuto: true): number | (number | null)[] | undefined;
+function parseScenarioList(value: unknown, allowAuto: false): number | number[] | undefined;
+function parseScenarioList(value: unknown, allowAuto: boolean): number | (number | null)[] | undefined {
+    if (typeof value !== "string" || !value) return undefined;
+    const values: (number | null)[] = [];
+    for (const part of value.split(",")) {
+        if (allowAuto && part.trim().toLowerCase() === "auto") {
+            values.push(null);
+            continue;
+        }
+        const n = parseInt(part, 10);
+        if (!Number.isNaN(n) && (allowAuto || n > 0)) values.push(n);
+    }
+    if (values.length === 0) return undefined;
+    if (values.length === 1) return values[0] ?? undefined;
+    return values;
+}
+
+/**
+ * NDJSON response: one {"type":"result"} line per SKU as the engine produces it,
+ * then a final {"type":"dashboard"} line (with partial/total_skus/skipped_skus
+ * under a deadline_ms). Served from the cache when a full
+ * payload is already there; streamed runs are not cached, so neither process
+ * holds the whole payload.
+ */
+async function streamIntelligence(res: express.Response, request: SurgeRequest, cached: any) {
+    res.status(200);
+    res.setHeader("Content-Type", "application/x-ndjson");
+    res.setHeader("Cache-Control", "no-cache");
+    res.flushHeaders();
+
+    if (cached) {
+        const { results, ...summary } = cached;
+        for (const result of results) res.write(JSON.stringify({ type: "result", result }) + "\n");
+        res.end(JSON.stringify({ type: "dashboard", ...summary }) + "\n");
+        return;
+    }
+
+    const summary = await surgePool.runStream(request, {
+        // After a client disconnect, drain the engine's remaining lines without writing
+        onResult: (result) => res.destroyed || res.write(JSON.stringify({ type: "result", result }) + "\n"),
+        onDrain: (resume) => {
+            const done = () => {
+                res.off("drain", done);
+                res.off("close", done);
+                resume();
+            };
+            res.once("drain", done);
+            res.once("close", done);
+        },
+    });
+    res.end(JSON.stringify({ type: "dashboard", ...summary }) + "\n");
+}
+
+router.get("/cache-stats", (_req, res) => {
+    res.json(surgeCache.snapshot());
+});
+
 export default router;
@@ -0,0 +1,111 @@
+import { pool } from "../db";
+
+type Entry = { value: any; expiresAt: number };
+
+export type SurgeCacheStats = {
+  hits: number;
+  misses: number;
+  coalesced: number;
+  evictions: number;
+  expirations: number;
+};
+
+/**
+ * LRU + TTL cache for surge payloads with in-flight request coalescing.
+ * Concurrent lookups for the same key share one computation; results are
+ * cached only when the computation succeeds and `cacheable` accepts the value.
+ */
+export class SurgeResultCache {
+  // Map iteration order is insertion order, so the first key is least recently used
+  private entries = new Map<string, Entry>();
+  private inflight = new Map<string, Promise<any>>();
+  readonly stats: SurgeCacheStats = { hits: 0, misses: 0, coalesced: 0, evictions: 0, expirations: 0 };
+
+  constructor(private maxEntries: number, private ttlMs: number) {}
+
+  async getOrCompute(key: string, compute: () => Promise<any>, cacheable: (value: any) => boolean = () => true): Promise<any> {
+    const entry = this.entries.get(key);
+    if (entry) {
+      this.entries.delete(key);
+      if (entry.expiresAt > Date.now()) {
+        this.entries.set(key, entry);
+        this.stats.hits++;
+        return entry.value;
+      }
+      this.stats.expirations++;
+    }
+
+    const pending = this.inflight.get(key);
+    if (pending) {
+      this.stats.coalesced++;
+      return pending;
+    }
+
+    this.stats.misses++;
+    const promise = compute()
+      .then((value) => {
+        if (cacheable(value)) this.set(key, value);
+        return value;
+      })
+      .finally(() => this.inflight.delete(key));
+    this.inflight.set(key, promise);
+    return promise;
+  }
+
+  /** Cached value without computing on a miss (expired entries count as misses). */
+  peek(key: string): any | undefined {
+    const entry = this.entries.get(key);
+    if (!entry || entry.expiresAt <= Date.now()) return undefined;
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    this.stats.hits++;
+    return entry.value;
+  }
+
+  snapshot() {
+    return {
+      ...this.stats,
+      size: this.entries.size,
+      inflight: this.inflight.size,
+      maxEntries: this.maxEntries,
+      ttlMs: this.ttlMs,
+    };
+  }
+
+  private set(key: string, value: any) {
+    this.entries.set(key, { value, expiresAt: Date.now() + this.ttlMs });
+    while (this.entries.size > this.maxEntries) {
+      const oldest = this.entries.keys().next().value as string;
+      this.entries.delete(oldest);
+      this.stats.evictions++;
+    }
+  }
+}
+
+/**
+ * Change counter of the data a surge run reads for a user: one primary-key read
+ * of surge_data_version (the sum over all users when userId is null). Triggers
+ * in migrations/init.sql bump a user's version on every statement that inserts,
+ * updates, deletes or truncates their sales, products or promotions rows, so
+ * any such change (a quantity or date fix included) invalidates their cached
+ * payloads. Promotions only count once the migration has run with that table
+ * present. Returns "nodb" when the database or the counter table is unreachable
+ * (the engine then reads CSVs, and only the TTL bounds staleness).
+ */
+export async function surgeWatermark(userId: string | null): Promise<string> {
+  try {
+    const { rows } = await pool.query(
+      `SELECT COALESCE(SUM(version), 0) AS version
+       FROM surge_data_version WHERE ($1::varchar IS NULL OR user_id = $1)`,
+      [userId],
+    );
+    return `v${rows[0].version}`;
+  } catch {
+    return "nodb";
+  }
+}
+
+export const surgeCache = new SurgeResultCache(
+  Math.max(1, parseInt(process.env.SURGE_CACHE_MAX || "200", 10)),
+  Math.max(0, parseInt(process.env.SURGE_CACHE_TTL_MS || "600000", 10)),
+);
@@ -0,0 +1,255 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import readline from "readline";
+import path from "path";
+import fs from "fs";
+
+export type SurgeRequest = {
+  user?: string | null;
+  /** One lead time, or several to get a per-SKU "scenarios" matrix from one run */
+  lead?: number | number[];
+  /** Safety stock per scenario; null keeps the engine's 20%-of-demand default */
+  safety?: number | (number | null)[];
+  sku?: string;
+  stream?: boolean;
+  format?: SurgeFormat;
+  /**
+   * Time budget in ms, counted from when the request was queued. The engine ranks
+   * SKUs by recent units and returns what it finished in time, flagged
+   * `partial` with `total_skus` / `skipped_skus`.
+   */
+  deadline_ms?: number;
+};
+
+/** Final line of a streaming run; the deadline fields are set when the request had a deadline_ms. */
+export type SurgeStreamSummary = {
+  dashboard: any;
+  partial?: boolean;
+  deadline_ms?: number;
+  total_skus?: number;
+  skipped_skus?: number;
+};
+
+/** Binary payload encodings from python_services/surge_codec.py; JSON when unset. */
+export type SurgeFormat = "msgpack" | "arrow";
+
+/**
+ * Per-SKU callbacks for streaming runs. onResult returns false when the
+ * consumer is backed up; the worker then stops reading until onDrain's resume
+ * callback fires, so backpressure reaches the Python process through the pipe.
+ */
+export type SurgeStreamHandlers = {
+  onResult: (result: any) => boolean;
+  onDrain: (resume: () => void) => void;
+};
+
+type Job = {
+  request: SurgeRequest;
+  stream?: SurgeStreamHandlers;
+  resolve: (payload: any) => void;
+  reject: (err: Error) => void;
+  queuedAt: number;
+};
+
+// Hard limit for one engine run; requests with a deadline_ms get deadline + grace instead
+const SURGE_TIMEOUT_MS = Math.max(1, parseInt(process.env.SURGE_TIMEOUT_MS || "300000", 10));
+// Time past a request's deadline_ms for the engine to finish the SKU or chunk in hand and encode the payload
+const SURGE_DEADLINE_GRACE_MS = Math.max(0, parseInt(process.env.SURGE_DEADLINE_GRACE_MS || "5000", 10));
+
+export function resolvePythonBin(): string {
+  if (process.platform === "win32") {
+    const venvPython = path.join(process.cwd(), "venv", "Scripts", "python.exe");
+    if (fs.existsSync(venvPython)) return venvPython;
+  } else {
+    const venvPython = path.join(process.cwd(), "venv", "bin", "python");
+    if (fs.existsSync(venvPython)) return venvPython;
+  }
+  return "python";
+}
+
+export function surgeScriptPath(): string {
+  return path.join(process.cwd(), "python_services", "surge_engine.py");
+}
+
+export function surgeEnv(): NodeJS.ProcessEnv {
+  return {
+    ...process.env,
+    DATABASE_URL: process.env.DATABASE_URL || "postgresql://postgres:hi@localhost:5432/marketplace",
+  };
+}
+
+/**
+ * One long-lived `surge_engine.py --serve` process. It keeps pandas/statsmodels
+ * imported and its DB connection open, and answers one request at a time over
+ * newline-delimited JSON on stdin/stdout.
+ */
+class SurgeWorker {
+  private proc: ChildProcessWithoutNullStreams;
+  private current: (Job & { id: number }) | null = null;
+  private timer: NodeJS.Timeout | null = null;
+  ready = false;
+  alive = true;
+
+  constructor(private onIdle: (worker: SurgeWorker) => void, private onExit: (worker: SurgeWorker) => void) {
+    this.proc = spawn(resolvePythonBin(), [surgeScriptPath(), "--serve"], {
+      cwd: process.cwd(),
+      env: surgeEnv(),
+    });
+
+    readline.createInterface({ input: this.proc.stdout }).on("line", (line) => this.handleLine(line));
+    readline.createInterface({ input: this.proc.stderr }).on("line", (line) => {
+      if (/error|traceback/i.test(line)) console.error("surge_engine stderr:", line);
+    });
+
+    this.proc.on("exit", (code, signal) => {
+      this.alive = false;
+      this.clearTimer();
+      if (this.current) {
+        this.current.reject(new Error(`surge worker exited (code=${code}, signal=${signal})`));
+        this.current = null;
+      }
+      this.onExit(this);
+    });
+    this.proc.on("error", (err) => {
+      console.error("surge worker failed to start:", err);
+    });
+  }
+
+  get idle(): boolean {
+    return this.alive && this.ready && this.current === null;
+  }
+
+  send(id: number, job: Job) {
+    this.current = { ...job, id };
+    const request = { ...job.request };
+    let timeoutMs = SURGE_TIMEOUT_MS;
+    if (request.deadline_ms !== undefined) {
+      // Time spent queued counts against the deadline
+      request.deadline_ms = Math.max(1, request.deadline_ms - (Date.now() - job.queuedAt));
+      timeoutMs = request.deadline_ms + SURGE_DEADLINE_GRACE_MS;
+    }
+    this.timer = setTimeout(() => this.timeout(id, timeoutMs), timeoutMs);
+    this.proc.stdin.write(JSON.stringify({ id, ...request }) + "\n");
+  }
+
+  /** Fails a run that overstays its limit and kills the process; the pool spawns a replacement. */
+  private timeout(id: number, timeoutMs: number) {
+    this.timer = null;
+    const job = this.current;
+    if (!job || job.id !== id) return;
+    this.current = null;
+    job.reject(new Error(`surge engine timed out after ${timeoutMs} ms`));
+    this.kill();
+  }
+
+  private clearTimer() {
+    if (this.timer) clearTimeout(this.timer);
+    this.timer = null;
+  }
+
+  kill() {
+    this.proc.kill();
+  }
+
+  private handleLine(line: string) {
+    let msg: any;
+    try {
+      msg = JSON.parse(line);
+    } catch (e) {
+      console.error("Failed to parse surge worker output:", e, line);
+      return;
+    }
+
+    if (msg.type === "ready") {
+      this.ready = true;
+      this.onIdle(this);
+      return;
+    }
+
+    const job = this.current;
+    if (!job || msg.id !== job.id) {
+      console.error("surge worker returned an unexpected response id:", msg.id);
+      return;
+    }
+    if (msg.result !== undefined) {
+      // Streaming run: one SKU result, more lines follow
+      if (job.stream && job.stream.onResult(msg.result) === false) {
+        this.proc.stdout.pause();
+        job.stream.onDrain(() => this.proc.stdout.resume());
+      }
+      return;
+    }
+    this.current = null;
+    this.clearTimer();
+    if (msg.error) job.reject(new Error(msg.error));
+    else if (msg.dashboard !== undefined) {
+      const { id: _id, ...summary } = msg;
+      job.resolve(summary);
+    }
+    else if (msg.payload_b64 !== undefined) job.resolve(Buffer.from(msg.payload_b64, "base64"));
+    else job.resolve(msg.payload);
+    this.onIdle(this);
+  }
+}
+
+/**
+ * Fixed-size pool of warm surge workers. Requests queue FIFO and are handed to
+ * the first idle worker; crashed workers, and workers killed for overrunning
+ * SURGE_TIMEOUT_MS (or a deadline_ms plus SURGE_DEADLINE_GRACE_MS), are
+ * replaced on the next dispatch.
+ */
+export class SurgeWorkerPool {
+  private workers: SurgeWorker[] = [];
+  private queue: Job[] = [];
+  private nextId = 1;
+
+  constructor(private size: number) {}
+
+  run(request: SurgeRequest): Promise<any> {
+    return new Promise((resolve, reject) => {
+      this.queue.push({ request, resolve, reject, queuedAt: Date.now() });
+      this.dispatch();
+    });
+  }
+
+  /**
+   * Streaming run: results are handed to `stream.onResult` as each SKU finishes;
+   * the promise resolves with `{ dashboard }` (plus the deadline fields) once the engine is done.
+   */
+  runStream(request: SurgeRequest, stream: SurgeStreamHandlers): Promise<SurgeStreamSummary> {
+    return new Promise((resolve, reject) => {
+      this.queue.push({ request: { ...request, stream: true }, stream, resolve, reject, queuedAt: Date.now() });
+      this.dispatch();
+    });
+  }
+
+  shutdown() {
+    for (const w of this.workers) w.kill();
+    this.workers = [];
+  }
+
+  private dispatch() {
+    while (this.workers.length < this.size) {
+      this.workers.push(
+        new SurgeWorker(
+          () => this.dispatch(),
+          (dead) => {
+            this.workers = this.workers.filter((w) => w !== dead);
+            if (!dead.ready) {
+              // Died before it could serve anything: fail fast instead of respawning in a loop
+              const err = new Error("surge worker failed to start");
+              for (const job of this.queue.splice(0)) job.reject(err);
+              return;
+            }
+            if (this.queue.length) this.dispatch();
+          },
+        ),
+      );
+    }
+    for (const worker of this.workers) {
+      if (!this.queue.length) return;
+      if (worker.idle) worker.send(this.nextId++, this.queue.shift()!);
+    }
+  }
+}
+
+export const surgePool = new SurgeWorkerPool(Math.max(1, parseInt(process.env.SURGE_WORKERS || "2", 10)));